@@ -2,6 +2,7 @@ from flask import Flask, json, request, render_template, redirect, url_for, flas
 import logging
 import os
 import datetime
+import click
 
 # Try to import git, but continue if it's not available
 git_available = False
@@ -11,6 +12,8 @@ try:
 except ImportError:
     logging.warning("GitPython not installed. To use Git functionality, install with: pip install GitPython")
 
+from utils.db_config import sqlite_engine_options, configure_sqlite
+
 # Настройка логирования
 logging.basicConfig(level=logging.DEBUG)
 
@@ -25,7 +28,18 @@ app.jinja_env.globals.update(hasattr=hasattr)
 app.config['SECRET_KEY'] = 'ваш_секретный_ключ'  # Измените это в продакшне
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(instance_path, "chat.db")}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Пул соединений и таймауты для SQLite (PRAGMA применяются ниже, после init_app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50 MB
+# Большие файлы загружаются по частям (utils/uploads.py), каждая часть — отдельный запрос
+app.config['MAX_UPLOAD_SIZE'] = 1024 * 1024 * 1024  # 1 GB
+app.config['UPLOAD_CHUNK_SIZE'] = 4 * 1024 * 1024  # 4 MB
+# Превью изображений и обложки видео строит пул потоков (utils/thumbnails.py), 0 отключает
+app.config['THUMBNAIL_WORKERS'] = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+app.config['FFMPEG_PATH'] = os.environ.get('FFMPEG_PATH')
+# Рассылка live-событий между воркерами: 'sqlite' (общий файл) или 'memory' (один процесс)
+app.config['EVENT_BUS'] = os.environ.get('EVENT_BUS', 'sqlite')
+app.config['EVENT_BUS_PATH'] = os.path.join(instance_path, 'events.db')
 
 # Настройка SERVER_NAME
 if os.environ.get('FLASK_ENV') == 'production':
@@ -45,14 +59,30 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # Создаем корневую папку для загрузок, если её нет
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Кто отдает байты загруженных файлов: None — сам Flask, 'x-accel' — nginx
+# (internal location X_ACCEL_PREFIX с alias на UPLOAD_FOLDER), 'x-sendfile' — Apache/lighttpd
+app.config['FILE_OFFLOAD'] = os.environ.get('FILE_OFFLOAD') or None
+app.config['X_ACCEL_PREFIX'] = os.environ.get('X_ACCEL_PREFIX', '/protected_uploads/')
+app.config['USE_X_SENDFILE'] = app.config['FILE_OFFLOAD'] == 'x-sendfile'
+
 # Инициализация базы данных
 from models.user import db, User, Contact, Message, Block, Group, GroupMember, GroupMessage
-from flask import send_from_directory # Import send_from_directory
 
 db.init_app(app)
 
+# WAL, busy_timeout и прочие PRAGMA для каждого нового соединения
+with app.app_context():
+    configure_sqlite(db.engine)
+
 # Import database utility functions from utils
-from utils.db_utils import create_tables
+from utils.migrations import migrate, check_schema_version
+from utils.conversations import rebuild_conversations
+from utils.search import rebuild_search_index
+from utils.events import init_events
+from utils.uploads import expire_uploads
+from utils.blobs import collect_garbage, deduplicate_uploads
+from utils.thumbnails import init_thumbnails, backfill_variants
+from utils.odoo_sync import start_outbox_worker, drain_outbox, requeue_dead_letters
 
 # Import and register blueprints
 from routes.auth import auth_bp
@@ -60,6 +90,8 @@ from routes.user import user_bp
 from routes.contacts import contacts_bp
 from routes.messages import messages_bp
 from routes.groups import groups_bp
+from routes.events import events_bp
+from routes.files import files_bp
 
 # Register blueprints without URL prefixes
 app.register_blueprint(auth_bp)
@@ -67,92 +99,82 @@ app.register_blueprint(user_bp)
 app.register_blueprint(contacts_bp)
 app.register_blueprint(messages_bp)
 app.register_blueprint(groups_bp)
+app.register_blueprint(events_bp)
+app.register_blueprint(files_bp)
 
-# --- NEW ROUTE TO SERVE UPLOADED FILES ---
-@app.route('/uploads/<path:filepath>')
-def serve_uploaded_file(filepath):
-    if 'user_id' not in session:
-        return jsonify({"error": "Unauthorized"}), 401
+init_events(app)
+init_thumbnails(app)
 
-    logging.debug(f"Attempting to serve file: {filepath}")
-    # Security Check: Basic check for path traversal
-    if '..' in filepath or filepath.startswith('/'):
-        logging.warning(f"Potential path traversal attempt: {filepath}")
-        return jsonify({"error": "Forbidden"}), 403
+# Фоновая отправка очереди в Odoo стартует с первым запросом, а не при импорте:
+# CLI-команды (migrate-db, drain-odoo-outbox) и скрипты, импортирующие app, поток не запускают
+@app.before_request
+def ensure_outbox_worker():
+    start_outbox_worker(app)
 
-    # More specific security for group files
-    if filepath.startswith('group_files/'):
-        try:
-            # Extract group_id from the path (e.g., group_files/123/image.png -> 123)
-            parts = filepath.split('/')
-            if len(parts) < 3 or not parts[1].isdigit():
-                 logging.warning(f"Invalid group file path format: {filepath}")
-                 return jsonify({"error": "Not found"}), 404
-            group_id = int(parts[1])
-            
-            # Check if current user is a member of this group
-            is_member = GroupMember.query.filter_by(
-                group_id=group_id,
-                user_id=session['user_id'],
-                invitation_status='accepted'
-            ).first()
-            
-            if not is_member:
-                logging.warning(f"User {session['user_id']} not member of group {group_id}, denied access to {filepath}")
-                return jsonify({"error": "Forbidden"}), 403
-                
-            logging.debug(f"User {session['user_id']} is member of group {group_id}. Serving file: {filepath}")
-        except Exception as e:
-            logging.error(f"Error during group file access check for {filepath}: {e}")
-            return jsonify({"error": "Server Error"}), 500
-    # Handle direct chat files
-    elif filepath.startswith('direct_files/'):
-        try:
-            # Extract user IDs from the path (e.g., direct_files/1_2/file.png -> 1_2)
-            parts = filepath.split('/')
-            if len(parts) < 3 or '_' not in parts[1]:
-                logging.warning(f"Invalid direct file path format: {filepath}")
-                return jsonify({"error": "Not found"}), 404
-            user_ids = parts[1].split('_')
-            if len(user_ids) != 2 or not all(uid.isdigit() for uid in user_ids):
-                logging.warning(f"Invalid user IDs in direct file path: {filepath}")
-                return jsonify({"error": "Not found"}), 404
-            user_id_1, user_id_2 = map(int, user_ids)
-            current_user_id = int(session['user_id'])
-            if current_user_id not in (user_id_1, user_id_2):
-                logging.warning(f"User {current_user_id} not authorized for direct file {filepath}")
-                return jsonify({"error": "Forbidden"}), 403
-            logging.debug(f"User {current_user_id} is authorized for direct file: {filepath}")
-        except Exception as e:
-            logging.error(f"Error during direct file access check for {filepath}: {e}")
-            return jsonify({"error": "Server Error"}), 500
-    # Handle avatars
-    elif filepath.startswith('avatars/'):
-        # Avatars are generally considered public within the app
-        logging.debug(f"Serving avatar: {filepath}")
-    else:
-        # Handle other potential paths or deny by default
-        logging.warning(f"Attempt to access potentially restricted path: {filepath}")
-        return jsonify({"error": "Forbidden"}), 403
+# CLI: flask --app app migrate-db
+@app.cli.command('migrate-db')
+def migrate_db_command():
+    """Применяет недостающие миграции схемы базы данных"""
+    applied = migrate()
+    for name in applied:
+        print(f"Applied {name}")
+    current, latest = check_schema_version()
+    print(f"Schema version: {current} (latest {latest})")
 
-    # Serve the file using send_from_directory
-    try:
-        # Remove 'static/' prefix if present in the filepath
-        if filepath.startswith('static/'):
-            filepath = filepath[7:]  # Remove 'static/' prefix
-            
-        # Ensure the upload directory exists
-        upload_dir = os.path.join(app.config['UPLOAD_FOLDER'], os.path.dirname(filepath))
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filepath, as_attachment=False)
-    except FileNotFoundError:
-        logging.error(f"File not found: {os.path.join(app.config['UPLOAD_FOLDER'], filepath)}")
-        return jsonify({"error": "Not found"}), 404
-    except Exception as e:
-        logging.error(f"Error serving file {filepath}: {e}")
-        return jsonify({"error": "Server error"}), 500
-# --- END NEW ROUTE ---
+# CLI: flask --app app rebuild-conversations
+@app.cli.command('rebuild-conversations')
+def rebuild_conversations_command():
+    """Пересобирает таблицу conversation из существующих сообщений"""
+    count = rebuild_conversations()
+    print(f"Rebuilt {count} conversation summaries")
+
+# CLI: flask --app app drain-odoo-outbox [--requeue-dead]
+@app.cli.command('drain-odoo-outbox')
+@click.option('--requeue-dead', is_flag=True, help='Вернуть записи из dead-letter в очередь')
+def drain_odoo_outbox_command(requeue_dead):
+    """Отправляет все готовые записи очереди в Odoo"""
+    if requeue_dead:
+        print(f"Requeued {requeue_dead_letters()} dead-letter records")
+    total = 0
+    while True:
+        claimed = drain_outbox()
+        total += claimed
+        if claimed == 0:
+            break
+    print(f"Processed {total} outbox records")
+
+# CLI: flask --app app rebuild-search-index
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Пересобирает полнотекстовые индексы сообщений и имен пользователей"""
+    rebuild_search_index()
+    print("Search indexes rebuilt")
+
+# CLI: flask --app app expire-uploads
+@app.cli.command('expire-uploads')
+def expire_uploads_command():
+    """Удаляет загрузки по частям, не получавшие новых частей больше суток"""
+    print(f"Expired {expire_uploads()} unfinished uploads")
+
+# CLI: flask --app app collect-blobs [--dry-run]
+@app.cli.command('collect-blobs')
+@click.option('--dry-run', is_flag=True, help='Только посчитать, ничего не удалять')
+def collect_blobs_command(dry_run):
+    """Удаляет файлы, на которые не ссылается ни одно сообщение или аватар, и освободившиеся блобы"""
+    links, blobs = collect_garbage(dry_run=dry_run)
+    print(f"Removed {links} unreferenced files and {blobs} blobs")
+
+# CLI: flask --app app dedupe-uploads
+@app.cli.command('dedupe-uploads')
+def dedupe_uploads_command():
+    """Переносит загруженные ранее файлы в хранилище блобов, одинаковые файлы хранятся один раз"""
+    print(f"Deduplicated {deduplicate_uploads()} files")
+
+# CLI: flask --app app generate-thumbnails
+@app.cli.command('generate-thumbnails')
+def generate_thumbnails_command():
+    """Строит превью вложений, загруженных до появления фоновой генерации"""
+    print(f"Processed {backfill_variants()} attachments")
 
 # Маршруты для автообновления PythonAnywhere
 @app.route('/update_server', methods=['POST'])
@@ -221,8 +243,9 @@ def profile():
 
 if __name__ == '__main__':
     # Инициализация базы данных в контексте приложения
+    # Локальный запуск — один процесс, миграции можно применить сразу
     with app.app_context():
-        create_tables()
+        migrate()
     # Временно отключаем SERVER_NAME для локального запуска
     app.config['SERVER_NAME'] = None
     # Устанавливаем host='0.0.0.0', чтобы приложение было доступно извне
@@ -238,12 +261,8 @@ else:
             )
             logging.info("Запускаем приложение через WSGI")
             try:
-                # Защищенный вызов create_tables
-                create_tables_success = create_tables()
-                if create_tables_success:
-                    logging.info("Схема базы данных успешно обновлена")
-                else:
-                    logging.warning("Не удалось обновить схему базы данных, но приложение продолжит работу")
+                # Воркер только сверяет версию схемы; миграции — командой migrate-db
+                check_schema_version()
                 
                 # Проверка наличия папки для аватаров
                 if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -0,0 +1,93 @@
+"""
+Cross-process fan-out benchmark for the SQLite event bus.
+
+Starts N worker processes on one shared events file. Every worker subscribes
+for its own user id and publishes messages addressed to a random other worker,
+the way send_message in one WSGI worker reaches a subscriber on another.
+Reports end-to-end delivery latency and aggregate throughput.
+
+    python benchmarks/event_bus.py --workers 4 --messages 500
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.events import SQLiteEventBus
+
+
+def worker(index, workers, messages, path, start_event, results):
+    bus = SQLiteEventBus(path)
+    expected = messages  # каждый воркер получает столько же, сколько отправляет в среднем
+    latencies = []
+    received = threading.Event()
+
+    def subscriber():
+        after_seq = bus.current_seq()
+        while len(latencies) < expected:
+            events, after_seq = bus.wait(index, after_seq, timeout=1)
+            now = time.time()
+            for _, _, data in events:
+                latencies.append(now - data['sent_at'])
+        received.set()
+
+    thread = threading.Thread(target=subscriber, daemon=True)
+    thread.start()
+    start_event.wait()
+
+    # Получатели выбираются по кругу, чтобы каждый получил ровно messages событий
+    started = time.time()
+    for i in range(messages):
+        recipient = (index + 1 + i % (workers - 1)) % workers if workers > 1 else index
+        bus.publish([recipient], 'message', {'sent_at': time.time(), 'from': index})
+    publish_seconds = time.time() - started
+
+    received.wait(timeout=60)
+    results.put((index, publish_seconds, latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=500, help='messages published per worker')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'events.db')
+        SQLiteEventBus(path)  # создаем схему до старта воркеров
+
+        start_event = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(i, args.workers, args.messages, path, start_event, results))
+            for i in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        time.sleep(0.5)
+
+        started = time.time()
+        start_event.set()
+        collected = [results.get(timeout=120) for _ in processes]
+        elapsed = time.time() - started
+        for process in processes:
+            process.join()
+
+    latencies = sorted(l for _, _, worker_latencies in collected for l in worker_latencies)
+    total = args.workers * args.messages
+    print(f"workers={args.workers} messages={total} delivered={len(latencies)}")
+    print(f"throughput: {len(latencies) / elapsed:.0f} events/s end-to-end")
+    if latencies:
+        print(f"latency ms: p50={statistics.median(latencies) * 1000:.1f} "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} "
+              f"max={latencies[-1] * 1000:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Latency of /search_messages (FTS5, utils/search) versus the naive
+LIKE '%term%' scan over the same visible messages.
+
+Builds a throwaway database with synthetic direct and group messages whose
+words follow a Zipf distribution, so the queries cover both common and rare
+terms. Rows are inserted through the normal tables, so the FTS triggers are
+part of the load time.
+
+    python benchmarks/message_search.py --messages 1000000 --queries 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import Flask
+from sqlalchemy import insert, text
+from models.user import db, User, Group, GroupMember, Message, GroupMessage
+from utils.search import search_messages
+
+USERS = 1000
+GROUPS = 100
+GROUP_SIZE = 20
+VOCABULARY = 20000
+WORDS_PER_MESSAGE = 12
+# Доля сообщений, отправленных в группы
+GROUP_SHARE = 0.3
+
+LIKE_QUERY = text("""
+    SELECT id FROM (
+        SELECT m.id AS id, m.content AS content FROM message m
+        WHERE (m.sender_id = :user_id OR m.recipient_id = :user_id)
+        UNION ALL
+        SELECT gm.id, gm.content FROM group_message gm
+        JOIN group_member mem ON mem.group_id = gm.group_id
+        WHERE mem.user_id = :user_id AND mem.invitation_status = 'accepted'
+    )
+    WHERE content LIKE :pattern
+    ORDER BY id DESC LIMIT 21
+""")
+
+
+def vocabulary():
+    words = [f'w{i}' for i in range(VOCABULARY)]
+    cum_weights, total = [], 0.0
+    for rank in range(VOCABULARY):
+        total += 1 / (rank + 1)
+        cum_weights.append(total)
+    return words, cum_weights
+
+
+def populate(messages, batch=50000):
+    words, cum_weights = vocabulary()
+    # insert(Model) подставляет значения по умолчанию из моделей
+    db.session.execute(insert(User), [
+        {'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x'} for i in range(1, USERS + 1)
+    ])
+    db.session.execute(insert(Group), [{'id': g, 'name': f'Group {g}', 'creator_id': 1} for g in range(1, GROUPS + 1)])
+    members = {g: random.sample(range(1, USERS + 1), GROUP_SIZE) for g in range(1, GROUPS + 1)}
+    db.session.execute(insert(GroupMember), [
+        {'group_id': g, 'user_id': u, 'role': 'member', 'invitation_status': 'accepted'}
+        for g, users in members.items() for u in users
+    ])
+    db.session.commit()
+
+    inserted = 0
+    while inserted < messages:
+        size = min(batch, messages - inserted)
+        direct, grouped = [], []
+        for _ in range(size):
+            content = ' '.join(random.choices(words, cum_weights=cum_weights, k=WORDS_PER_MESSAGE))
+            if random.random() < GROUP_SHARE:
+                group_id = random.randint(1, GROUPS)
+                grouped.append({'group_id': group_id, 'sender_id': random.choice(members[group_id]), 'content': content})
+            else:
+                direct.append({'sender_id': random.randint(1, USERS), 'recipient_id': random.randint(1, USERS), 'content': content})
+        if direct:
+            db.session.execute(insert(Message), direct)
+        if grouped:
+            db.session.execute(insert(GroupMessage), grouped)
+        db.session.commit()
+        inserted += size
+    return words
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return f"p50={statistics.median(samples) * 1000:7.2f} ms  p95={p95 * 1000:7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    random.seed(1)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmpdir, 'chat.db')}"
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            words = populate(args.messages)
+            print(f"inserted {args.messages} messages in {time.perf_counter() - started:.1f} s")
+
+            # Половина запросов — частые слова, половина — редкие
+            terms = [random.choice(words[:100]) if i % 2 else random.choice(words[100:5000]) for i in range(args.queries)]
+            users = [random.randint(1, USERS) for _ in range(args.queries)]
+
+            fts, like = [], []
+            for user_id, term in zip(users, terms):
+                started = time.perf_counter()
+                search_messages(user_id, term)
+                fts.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                db.session.execute(LIKE_QUERY, {'user_id': user_id, 'pattern': f'%{term}%'}).fetchall()
+                like.append(time.perf_counter() - started)
+
+            print(f"fts5     {percentiles(fts)}")
+            print(f"like     {percentiles(like)}")
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Rows per second for turning a page of messages into a JSON body: ORM objects
+with to_dict() and stdlib json against column tuples with the precompiled row
+serializer, with the stdlib encoder and with orjson when it is installed.
+Each variant includes the SELECT of the page.
+
+    python benchmarks/message_serialization.py --rows 10000 --repeat 5
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlalchemy import insert
+from models.user import db, User, Message
+from utils import serialization
+from utils.serialization import MESSAGE_FIELDS, MESSAGE_COLUMNS, row_serializer
+from utils.testing import create_test_app
+
+
+def orm_to_dict():
+    messages = Message.query.order_by(Message.id).all()
+    return json.dumps([message.to_dict() for message in messages]).encode('utf-8')
+
+
+def tuples_with(serialize, dumps):
+    def variant():
+        rows = db.session.query(*MESSAGE_COLUMNS).order_by(Message.id).all()
+        return dumps([serialize(row) for row in rows])
+    return variant
+
+
+def stdlib_dumps(payload):
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    variants = [
+        ('orm + to_dict + json', orm_to_dict),
+        ('tuples + json', tuples_with(row_serializer(MESSAGE_FIELDS, native_datetime=False), stdlib_dumps)),
+    ]
+    if serialization.orjson_available:
+        variants.append(('tuples + orjson', tuples_with(row_serializer(MESSAGE_FIELDS, native_datetime=True),
+                                                        serialization.orjson.dumps)))
+    else:
+        print("orjson is not installed, skipping the orjson variant")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_test_app(database_uri=f"sqlite:///{os.path.join(tmpdir, 'chat.db')}")
+        with app.app_context():
+            db.create_all()
+            db.session.execute(insert(User), [
+                {'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+                for i in (1, 2)
+            ])
+            started = datetime.datetime(2024, 1, 1)
+            db.session.execute(insert(Message), [
+                {'sender_id': 1 + i % 2, 'recipient_id': 2 - i % 2, 'content': f'message number {i} ' * 3,
+                 'timestamp': started + datetime.timedelta(seconds=i), 'is_read': i % 3 == 0}
+                for i in range(args.rows)
+            ])
+            db.session.commit()
+
+            reference = json.loads(orm_to_dict())
+            for name, variant in variants:
+                assert json.loads(variant()) == reference, name
+                best = float('inf')
+                for _ in range(args.repeat):
+                    db.session.expunge_all()
+                    begin = time.perf_counter()
+                    variant()
+                    best = min(best, time.perf_counter() - begin)
+                print(f"{name:<22} {best * 1000:8.1f} ms  {args.rows / best:12,.0f} rows/s")
+            db.session.remove()
+            db.engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Read/write throughput of the chat database under concurrent load, with
+SQLAlchemy defaults versus the tuned setup from utils/db_config.
+
+Writer threads insert messages and commit one at a time (like send_message);
+reader threads load the latest page of a conversation (like get_messages).
+
+    python benchmarks/sqlite_concurrency.py --writers 4 --readers 8 --seconds 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from utils.db_config import configure_sqlite, sqlite_engine_options
+
+USERS = 50
+
+SCHEMA = """
+    CREATE TABLE message (
+        id INTEGER PRIMARY KEY,
+        sender_id INTEGER NOT NULL,
+        recipient_id INTEGER NOT NULL,
+        content TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        is_read BOOLEAN DEFAULT 0
+    )
+"""
+INDEX = "CREATE INDEX ix_message_sender_recipient_id ON message (sender_id, recipient_id, id)"
+
+PAGE_QUERY = text("""
+    SELECT * FROM message
+    WHERE sender_id = :a AND recipient_id = :b
+    ORDER BY id DESC LIMIT 50
+""")
+INSERT = text("INSERT INTO message (sender_id, recipient_id, content) VALUES (:a, :b, :content)")
+
+
+def build_engine(path, tuned):
+    if tuned:
+        engine = create_engine(f'sqlite:///{path}', **sqlite_engine_options())
+        configure_sqlite(engine)
+    else:
+        engine = create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+    return engine
+
+
+def run(tuned, writers, readers, seconds, seed_rows):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = build_engine(os.path.join(tmpdir, 'chat.db'), tuned)
+        with engine.begin() as connection:
+            connection.execute(text(SCHEMA))
+            connection.execute(text(INDEX))
+            connection.execute(INSERT, [
+                {'a': random.randint(1, USERS), 'b': random.randint(1, USERS), 'content': 'seed'}
+                for _ in range(seed_rows)
+            ])
+
+        counts = {'writes': 0, 'reads': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def writer():
+            while time.monotonic() < deadline:
+                try:
+                    with engine.begin() as connection:
+                        connection.execute(INSERT, {'a': random.randint(1, USERS), 'b': random.randint(1, USERS), 'content': 'x' * 80})
+                    key = 'writes'
+                except OperationalError:
+                    key = 'errors'
+                with lock:
+                    counts[key] += 1
+
+        def reader():
+            while time.monotonic() < deadline:
+                try:
+                    with engine.connect() as connection:
+                        connection.execute(PAGE_QUERY, {'a': random.randint(1, USERS), 'b': random.randint(1, USERS)}).fetchall()
+                    key = 'reads'
+                except OperationalError:
+                    key = 'errors'
+                with lock:
+                    counts[key] += 1
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    label = 'tuned' if tuned else 'default'
+    print(f"{label:8} writes/s={counts['writes'] / seconds:8.0f}  reads/s={counts['reads'] / seconds:8.0f}  "
+          f"locked errors={counts['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--seed-rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    for tuned in (False, True):
+        run(tuned, args.writers, args.readers, args.seconds, args.seed_rows)
+
+
+if __name__ == '__main__':
+    main()
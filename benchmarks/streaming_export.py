@@ -0,0 +1,72 @@
+"""
+Peak Python memory of /export_messages for growing conversation histories,
+measured with tracemalloc while the streamed body is consumed chunk by chunk.
+Exits with status 1 if the peak grows with the history length.
+
+    python benchmarks/streaming_export.py --messages 10000 100000
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlalchemy import insert
+from models.user import db, User, Message
+from utils.testing import create_test_app
+
+# Во сколько раз пик может вырасти, прежде чем считать его зависящим от истории
+ALLOWED_GROWTH = 1.5
+
+
+def run(messages):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_test_app(database_uri=f"sqlite:///{os.path.join(tmpdir, 'chat.db')}")
+        client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.execute(insert(User), [
+                {'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+                for i in (1, 2)
+            ])
+            started = datetime.datetime(2024, 1, 1)
+            for offset in range(0, messages, 50000):
+                db.session.execute(insert(Message), [
+                    {'sender_id': 1 + i % 2, 'recipient_id': 2 - i % 2, 'content': f'message number {i} ' * 3,
+                     'timestamp': started + datetime.timedelta(seconds=i)}
+                    for i in range(offset, min(offset + 50000, messages))
+                ])
+            db.session.commit()
+            db.session.remove()
+
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        tracemalloc.start()
+        response = client.get('/export_messages?user_id=2', buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        with app.app_context():
+            db.engine.dispose()
+
+    print(f"{messages:>8} messages  body={size / 2**20:7.1f} MiB  peak={peak / 2**20:6.2f} MiB")
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    peaks = [run(messages) for messages in args.messages]
+    if max(peaks) > min(peaks) * ALLOWED_GROWTH:
+        print("FAIL: peak memory grows with the history length")
+        sys.exit(1)
+    print("OK: peak memory is independent of the history length")
+
+
+if __name__ == '__main__':
+    main()
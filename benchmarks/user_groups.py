@@ -0,0 +1,83 @@
+"""
+Query count and latency of /get_user_groups for a user in a growing number
+of groups, in a database that also holds --other-groups groups the user is
+not in (the response time must not depend on them). Exits with status 1 if
+the number of SQL statements per request depends on the number of groups.
+
+    python benchmarks/user_groups.py --groups 10 50 200 --other-groups 0 20000 --messages 20 --requests 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlalchemy import insert
+from models.user import db, User, Group, GroupMember, GroupMessage
+from utils.testing import create_test_app, QueryCounter
+
+MEMBERS_PER_GROUP = 25
+
+
+def run(groups, other_groups, messages, requests):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_test_app(database_uri=f"sqlite:///{os.path.join(tmpdir, 'chat.db')}")
+        client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.execute(insert(User), [
+                {'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+                for i in range(1, MEMBERS_PER_GROUP + 1)
+            ])
+            total = groups + other_groups
+            db.session.execute(insert(Group), [{'id': g, 'name': f'Group {g}', 'creator_id': 2} for g in range(1, total + 1)])
+            # Пользователь 1 состоит только в первых groups группах
+            db.session.execute(insert(GroupMember), [
+                {'group_id': g, 'user_id': u, 'role': 'admin' if u == 2 else 'member', 'invitation_status': 'accepted'}
+                for g in range(1, total + 1) for u in range(1 if g <= groups else 2, MEMBERS_PER_GROUP + 1)
+            ])
+            db.session.execute(insert(GroupMessage), [
+                {'group_id': g, 'sender_id': (i % MEMBERS_PER_GROUP) + 1, 'content': f'message {i}'}
+                for g in range(1, groups + 1) for i in range(messages)
+            ])
+            db.session.commit()
+
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+            with QueryCounter(db.engine) as counter:
+                data = client.get('/get_user_groups').get_json()
+            assert len(data['groups']) == groups
+
+            timings = []
+            for _ in range(requests):
+                started = time.perf_counter()
+                client.get('/get_user_groups')
+                timings.append(time.perf_counter() - started)
+            db.session.remove()
+            db.engine.dispose()
+
+    print(f"{groups:>5} groups of {groups + other_groups:>6}  queries={counter.count:3}  "
+          f"p50={statistics.median(timings) * 1000:7.2f} ms")
+    return counter.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--other-groups', type=int, nargs='+', default=[0, 20000])
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    counts = {(groups, other): run(groups, other, args.messages, args.requests)
+              for other in args.other_groups for groups in args.groups}
+    if len(set(counts.values())) > 1:
+        print(f"FAIL: query count grows with the number of groups: {counts}")
+        sys.exit(1)
+    print("OK: query count is independent of the number of groups")
+
+
+if __name__ == '__main__':
+    main()
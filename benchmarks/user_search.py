@@ -0,0 +1,87 @@
+"""
+Latency of /search_users (utils/search.search_users: name_search prefix index
+plus trigram FTS5) versus the old User.name.ilike('%query%') scan, at growing
+numbers of users.
+
+    python benchmarks/user_search.py --sizes 10000 100000 1000000 --queries 300
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlalchemy import insert
+from models.user import db, User, normalize_name
+from utils.search import search_users
+from utils.testing import create_test_app
+
+SYLLABLES = ['an', 'na', 'iv', 'pe', 'tr', 'ov', 'er', 'la', 'ma', 'ri', 'ko', 'sa', 'de', 'ni', 'ka', 'lo', 'ме', 'ан', 'ер', 'ли']
+
+
+def random_name():
+    first = ''.join(random.choices(SYLLABLES, k=random.randint(2, 4))).capitalize()
+    last = ''.join(random.choices(SYLLABLES, k=random.randint(2, 5))).capitalize()
+    return f'{first} {last}'
+
+
+def populate(users, batch=50000):
+    for start in range(1, users + 1, batch):
+        rows = []
+        for i in range(start, min(start + batch, users + 1)):
+            name = random_name()
+            rows.append({'id': i, 'name': name, 'name_search': normalize_name(name),
+                         'email': f'user{i}@example.com', 'password_hash': 'x'})
+        db.session.execute(insert(User), rows)
+        db.session.commit()
+
+
+def p(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+
+
+def run(users, queries):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        app = create_test_app(database_uri=f"sqlite:///{os.path.join(tmpdir, 'chat.db')}")
+        with app.app_context():
+            db.create_all()
+            populate(users)
+            # Запросы разной длины, как при наборе текста в поле поиска
+            terms = []
+            for _ in range(queries):
+                name = random_name()
+                start = random.randint(0, 2)
+                terms.append(name[start:start + random.randint(2, 6)].strip() or name[:3])
+
+            indexed, scan = [], []
+            for term in terms:
+                started = time.perf_counter()
+                search_users(1, term)
+                indexed.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                User.query.filter(User.name.ilike(f'%{term}%'), User.id != 1).limit(10).all()
+                scan.append(time.perf_counter() - started)
+                db.session.expunge_all()
+
+            print(f"{users:>8} users  indexed p50={p(indexed, 0.5):6.2f} ms p99={p(indexed, 0.99):6.2f} ms   "
+                  f"ilike p50={p(scan, 0.5):6.2f} ms p99={p(scan, 0.99):7.2f} ms")
+            db.session.remove()
+            db.engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=300)
+    args = parser.parse_args()
+    random.seed(1)
+    for users in args.sizes:
+        run(users, args.queries)
+
+
+if __name__ == '__main__':
+    main()
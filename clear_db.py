@@ -1,5 +1,5 @@
 from app import app, db
-from models.user import User, Contact, Message, Block, Group, GroupMember, GroupMessage
+from models.user import User, Contact, Message, Block, Group, GroupMember, GroupMessage, Conversation
 
 def clear_database():
     print("Starting database cleanup...")
@@ -11,9 +11,11 @@ def clear_database():
             group_msg_count = GroupMessage.query.delete()
             print(f"Deleted group messages: {group_msg_count}")
             
-            # 2. Delete direct messages (depends on users)
+            # 2. Delete direct messages and their summaries (depends on users)
             msg_count = Message.query.delete()
             print(f"Deleted direct messages: {msg_count}")
+            conversation_count = Conversation.query.delete()
+            print(f"Deleted conversation summaries: {conversation_count}")
             
             # 3. Delete group members (depends on groups and users)
             group_member_count = GroupMember.query.delete()
@@ -0,0 +1,24 @@
+"""Базовые таблицы и колонки, которые раньше добавлял create_tables()"""
+from utils.migrations import create_table_if_missing, add_column_if_missing
+
+def upgrade(connection):
+    for table_name in ('user', 'contact', 'message', 'block', 'group', 'group_member', 'group_message'):
+        create_table_if_missing(connection, table_name)
+
+    add_column_if_missing(connection, 'user', 'avatar_path', 'VARCHAR(255)')
+    add_column_if_missing(connection, 'user', 'bio', 'VARCHAR(500)')
+
+    add_column_if_missing(connection, 'message', 'is_edited', 'BOOLEAN DEFAULT FALSE')
+    add_column_if_missing(connection, 'message', 'edited_at', 'TIMESTAMP')
+    add_column_if_missing(connection, 'message', 'file_path', 'VARCHAR(255)')
+    add_column_if_missing(connection, 'message', 'mime_type', 'VARCHAR(100)')
+    add_column_if_missing(connection, 'message', 'original_filename', 'VARCHAR(255)')
+    add_column_if_missing(connection, 'message', 'message_type', 'VARCHAR(50)')
+    add_column_if_missing(connection, 'message', 'translation', 'TEXT')
+
+    add_column_if_missing(connection, 'group_message', 'file_path', 'VARCHAR(255)')
+    add_column_if_missing(connection, 'group_message', 'mime_type', 'VARCHAR(100)')
+    add_column_if_missing(connection, 'group_message', 'original_filename', 'VARCHAR(255)')
+    add_column_if_missing(connection, 'group_message', 'message_type', 'VARCHAR(50)')
+    add_column_if_missing(connection, 'group_message', 'is_edited', 'BOOLEAN DEFAULT FALSE')
+    add_column_if_missing(connection, 'group_message', 'edited_at', 'TIMESTAMP')
@@ -0,0 +1,9 @@
+"""Таблица сводок диалогов для списка чатов, заполняется по существующим сообщениям"""
+from sqlalchemy import text
+from utils.conversations import REBUILD_QUERY
+from utils.migrations import create_table_if_missing
+
+def upgrade(connection):
+    create_table_if_missing(connection, 'conversation')
+    connection.execute(text("DELETE FROM conversation"))
+    connection.execute(REBUILD_QUERY)
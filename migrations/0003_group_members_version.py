@@ -0,0 +1,5 @@
+"""Счетчик версии списка участников группы"""
+from utils.migrations import add_column_if_missing
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'group', 'members_version', 'INTEGER NOT NULL DEFAULT 0')
@@ -0,0 +1,5 @@
+"""Очередь синхронизации с Odoo"""
+from utils.migrations import create_table_if_missing
+
+def upgrade(connection):
+    create_table_if_missing(connection, 'odoo_outbox')
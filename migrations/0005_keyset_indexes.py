@@ -0,0 +1,8 @@
+"""Индексы для постраничной загрузки истории, списка чатов и очереди Odoo"""
+from utils.migrations import create_index_if_missing
+
+def upgrade(connection):
+    create_index_if_missing(connection, 'message', 'ix_message_sender_recipient_id')
+    create_index_if_missing(connection, 'conversation', 'ix_conversation_user_last_timestamp')
+    create_index_if_missing(connection, 'group_message', 'ix_group_message_group_id_id')
+    create_index_if_missing(connection, 'odoo_outbox', 'ix_odoo_outbox_status_next_attempt')
@@ -0,0 +1,7 @@
+"""Индексы под запросы маршрутов: токен подтверждения, группы пользователя, последнее сообщение группы"""
+from utils.migrations import create_index_if_missing
+
+def upgrade(connection):
+    create_index_if_missing(connection, 'user', 'ix_user_confirmation_token')
+    create_index_if_missing(connection, 'group_member', 'ix_group_member_user_id_group_id')
+    create_index_if_missing(connection, 'group_message', 'ix_group_message_group_id_timestamp')
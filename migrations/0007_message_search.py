@@ -0,0 +1,8 @@
+"""Полнотекстовый поиск по личным и групповым сообщениям (FTS5) с заполнением по существующим строкам"""
+from models.user import MESSAGE_SEARCH_DDL, GROUP_MESSAGE_SEARCH_DDL, create_search_objects
+
+def upgrade(connection):
+    create_search_objects(connection, MESSAGE_SEARCH_DDL)
+    create_search_objects(connection, GROUP_MESSAGE_SEARCH_DDL)
+    connection.exec_driver_sql("INSERT INTO message_fts (message_fts) VALUES ('rebuild')")
+    connection.exec_driver_sql("INSERT INTO group_message_fts (group_message_fts) VALUES ('rebuild')")
@@ -0,0 +1,15 @@
+"""Поиск пользователей: нормализованное имя с индексом для префикса и триграммный FTS5 для подстроки"""
+from sqlalchemy import text
+from models.user import USER_SEARCH_DDL, create_search_objects, normalize_name
+from utils.migrations import add_column_if_missing, create_index_if_missing
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'user', 'name_search', 'VARCHAR(100)')
+    rows = connection.execute(text("SELECT id, name FROM user")).fetchall()
+    if rows:
+        connection.execute(text("UPDATE user SET name_search = :name_search WHERE id = :id"), [
+            {'id': row.id, 'name_search': normalize_name(row.name)} for row in rows
+        ])
+    create_index_if_missing(connection, 'user', 'ix_user_name_search')
+    create_search_objects(connection, USER_SEARCH_DDL)
+    connection.exec_driver_sql("INSERT INTO user_fts (user_fts) VALUES ('rebuild')")
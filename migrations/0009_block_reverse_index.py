@@ -0,0 +1,5 @@
+"""Индекс block по blocked_user_id для загрузки кеша связей: кто заблокировал пользователя"""
+from utils.migrations import create_index_if_missing
+
+def upgrade(connection):
+    create_index_if_missing(connection, 'block', 'ix_block_blocked_user_id')
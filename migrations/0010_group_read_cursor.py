@@ -0,0 +1,11 @@
+"""Курсор прочтения участника группы; существующая история считается прочитанной"""
+from sqlalchemy import text
+from utils.migrations import add_column_if_missing
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'group_member', 'last_read_message_id', 'INTEGER NOT NULL DEFAULT 0')
+    connection.execute(text("""
+        UPDATE group_member SET last_read_message_id = COALESCE(
+            (SELECT MAX(id) FROM group_message WHERE group_message.group_id = group_member.group_id), 0
+        )
+    """))
@@ -0,0 +1,5 @@
+"""Частичный индекс непрочитанных личных сообщений для отметки прочтения одним UPDATE"""
+from utils.migrations import create_index_if_missing
+
+def upgrade(connection):
+    create_index_if_missing(connection, 'message', 'ix_message_unread')
@@ -0,0 +1,7 @@
+"""Счетчики версий профиля пользователя, группы и ее сообщений для ETag"""
+from utils.migrations import add_column_if_missing
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'user', 'profile_version', 'INTEGER NOT NULL DEFAULT 0')
+    add_column_if_missing(connection, 'group', 'version', 'INTEGER NOT NULL DEFAULT 0')
+    add_column_if_missing(connection, 'group', 'messages_version', 'INTEGER NOT NULL DEFAULT 0')
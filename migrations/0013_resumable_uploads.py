@@ -0,0 +1,5 @@
+"""Сессии загрузки файлов по частям"""
+from utils.migrations import create_table_if_missing
+
+def upgrade(connection):
+    create_table_if_missing(connection, 'upload')
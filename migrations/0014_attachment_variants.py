@@ -0,0 +1,6 @@
+"""Превью вложений: список готовых вариантов у сообщения"""
+from utils.migrations import add_column_if_missing
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'message', 'variants', 'VARCHAR(100)')
+    add_column_if_missing(connection, 'group_message', 'variants', 'VARCHAR(100)')
@@ -0,0 +1,9 @@
+"""Загрузки по частям истекают по времени последней части, а не по началу"""
+from sqlalchemy import text
+from utils.migrations import add_column_if_missing, create_index_if_missing
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'upload', 'updated_at', 'DATETIME')
+    connection.execute(text("UPDATE upload SET updated_at = created_at WHERE updated_at IS NULL"))
+    create_index_if_missing(connection, 'upload', 'ix_upload_updated_at')
+    connection.execute(text("DROP INDEX IF EXISTS ix_upload_created_at"))
@@ -0,0 +1,5 @@
+"""Захват части загрузки: параллельные повторы одной части не пишут в файл одновременно"""
+from utils.migrations import add_column_if_missing
+
+def upgrade(connection):
+    add_column_if_missing(connection, 'upload', 'chunk_lock', 'VARCHAR(32)')
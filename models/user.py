@@ -1,19 +1,27 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 
 db = SQLAlchemy()
 
+def normalize_name(name):
+    """Ключ поиска по имени: SQLite lower() понимает только ASCII, поэтому регистр сворачивается в Python"""
+    return ' '.join((name or '').split()).casefold()
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
+    # Нормализованное имя для поиска по префиксу (см. normalize_name)
+    name_search = db.Column(db.String(100), nullable=True, index=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Добавляем недостающие поля, которые используются в app.py
     email_confirmed = db.Column(db.Boolean, default=False)
-    confirmation_token = db.Column(db.String(100), nullable=True)
+    confirmation_token = db.Column(db.String(100), nullable=True, index=True)
     token_expiration = db.Column(db.DateTime, nullable=True)
     
     # Добавляем поле для хранения пути к аватарке
@@ -21,6 +29,8 @@ class User(db.Model):
     
     # Новое поле для хранения информации о пользователе
     bio = db.Column(db.String(500), nullable=True)
+    # Счетчик изменений профиля (имя, bio, аватар) для ETag
+    profile_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     
     # Определение отношения для контактов
     contacts = db.relationship('Contact', 
@@ -42,6 +52,11 @@ class User(db.Model):
                                      lazy='dynamic',
                                      cascade='all, delete-orphan')
     
+    @validates('name')
+    def _update_name_search(self, key, name):
+        self.name_search = normalize_name(name)
+        return name
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
         
@@ -93,12 +108,21 @@ class Message(db.Model):
     file_path = db.Column(db.String(255), nullable=True)
     mime_type = db.Column(db.String(100), nullable=True)
     original_filename = db.Column(db.String(255), nullable=True)
+    # Готовые превью через запятую ('160,480,poster'), '' — превью нет, NULL — еще не обработано
+    variants = db.Column(db.String(100), nullable=True)
     # --- End Fields for file attachments ---
     
     # Define relationships
     sender = db.relationship('User', foreign_keys=[sender_id], backref=db.backref('sent_messages', lazy='dynamic'))
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref=db.backref('received_messages', lazy='dynamic'))
     
+    # Keyset pagination of a conversation: (sender_id, recipient_id) range ordered by id
+    __table_args__ = (
+        db.Index('ix_message_sender_recipient_id', 'sender_id', 'recipient_id', 'id'),
+        # Частичный индекс только по непрочитанным: отметка прочтения не проходит по всей истории
+        db.Index('ix_message_unread', 'recipient_id', 'sender_id', 'id', sqlite_where=db.text('is_read = 0')),
+    )
+    
     def to_dict(self):
         """Convert message to dictionary for JSON serialization"""
         message_dict = {
@@ -115,11 +139,80 @@ class Message(db.Model):
             'message_type': self.message_type if hasattr(self, 'message_type') else 'text',
             'file_path': self.file_path if hasattr(self, 'file_path') else None,
             'mime_type': self.mime_type if hasattr(self, 'mime_type') else None,
-            'original_filename': self.original_filename if hasattr(self, 'original_filename') else None
+            'original_filename': self.original_filename if hasattr(self, 'original_filename') else None,
+            'variants': self.variants
             # --- End Add file fields ---
         }
         return message_dict
 
+# Сводка по диалогу: одна строка на пару (пользователь, собеседник).
+# Поддерживается при записи сообщений (см. utils/conversations.py),
+# чтобы список чатов читался диапазонным сканированием индекса
+class Conversation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    peer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=True)
+    last_timestamp = db.Column(db.DateTime, nullable=True)
+    last_preview = db.Column(db.String(255), nullable=True)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'peer_id', name='_conversation_user_peer_uc'),
+        db.Index('ix_conversation_user_last_timestamp', 'user_id', 'last_timestamp'),
+    )
+
+# Очередь записей для Odoo (transactional outbox): строка пишется в той же
+# транзакции, что и сообщение, а фоновый воркер отправляет их пачками
+class OdooOutbox(db.Model):
+    __tablename__ = 'odoo_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    model = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sent' or 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    odoo_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (db.Index('ix_odoo_outbox_status_next_attempt', 'status', 'next_attempt_at'),)
+
+# Незавершенная загрузка файла по частям; байты лежат во временном файле (utils/uploads.py)
+class Upload(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    original_filename = db.Column(db.String(255), nullable=False)
+    mime_type = db.Column(db.String(100), nullable=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    # Части принимаются по порядку: сколько первых частей уже записано и проверено
+    received_chunks = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Время последней принятой части: брошенные загрузки истекают по нему, а не по началу
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Токен запроса, который сейчас пишет часть received_chunks; NULL — никто
+    chunk_lock = db.Column(db.String(32), nullable=True)
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    @property
+    def is_complete(self):
+        return self.received_chunks >= self.total_chunks
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'next_chunk': self.received_chunks
+        }
+
 # Model for storing blocked users
 class Block(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -127,8 +220,11 @@ class Block(db.Model):
     blocked_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    # Index for fast lookup and uniqueness
-    __table_args__ = (db.UniqueConstraint('user_id', 'blocked_user_id', name='_user_blocked_uc'),)
+    # Index for fast lookup and uniqueness; the second index finds who blocked a user
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'blocked_user_id', name='_user_blocked_uc'),
+        db.Index('ix_block_blocked_user_id', 'blocked_user_id'),
+    )
 
 # Group model for group chats
 class Group(db.Model):
@@ -138,6 +234,11 @@ class Group(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     avatar_path = db.Column(db.String(255), nullable=True)
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Счетчик изменений справочника участников (состав, роли, имена, аватары)
+    members_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    # Счетчики изменений самой группы (название, описание, аватар) и ее сообщений, для ETag
+    version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    messages_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     
     # Relationship with creator
     creator = db.relationship('User', foreign_keys=[creator_id], backref=db.backref('created_groups', lazy='dynamic'))
@@ -166,22 +267,35 @@ class Group(db.Model):
             return True
         return False
     
+    @staticmethod
+    def _bump_counter(group_ids, column):
+        if not isinstance(group_ids, (list, tuple, set)):
+            group_ids = [group_ids]
+        if not group_ids:
+            return
+        Group.query.filter(Group.id.in_([int(gid) for gid in group_ids])).update(
+            {column.key: column + 1}, synchronize_session=False
+        )
+    
+    @staticmethod
+    def bump_members_version(group_ids):
+        """Increment the member directory version of the given groups"""
+        Group._bump_counter(group_ids, Group.members_version)
+    
+    @staticmethod
+    def bump_messages_version(group_ids):
+        """Increment the version of the message history of the given groups"""
+        Group._bump_counter(group_ids, Group.messages_version)
+    
     def is_member(self, user_id):
         """Check if a user is a member of the group"""
-        return GroupMember.query.filter_by(
-            group_id=self.id, 
-            user_id=user_id,
-            invitation_status='accepted'
-        ).first() is not None
+        from utils.memberships import is_group_member
+        return is_group_member(self.id, user_id)
     
     def is_admin(self, user_id):
         """Check if a user is an admin of the group"""
-        member = GroupMember.query.filter_by(
-            group_id=self.id, 
-            user_id=user_id,
-            invitation_status='accepted'
-        ).first()
-        return member and member.role == 'admin'
+        from utils.memberships import is_group_admin
+        return is_group_admin(self.id, user_id)
 
 # Model for group membership
 class GroupMember(db.Model):
@@ -191,13 +305,19 @@ class GroupMember(db.Model):
     role = db.Column(db.String(20), default='member', nullable=False)  # 'admin' or 'member'
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
     invitation_status = db.Column(db.String(20), default='accepted', nullable=False)  # 'invited', 'accepted', 'declined'
+    # Курсор прочтения: сообщения группы с id больше этого значения непрочитаны
+    last_read_message_id = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     
     # Relationships
     group = db.relationship('Group', backref=db.backref('members', lazy='dynamic'))
     user = db.relationship('User', backref=db.backref('group_memberships', lazy='dynamic'))
     
     # Ensure no duplicate memberships
-    __table_args__ = (db.UniqueConstraint('group_id', 'user_id', name='_group_user_uc'),)
+    # Уникальный индекс начинается с group_id; для выборки групп пользователя нужен обратный порядок
+    __table_args__ = (
+        db.UniqueConstraint('group_id', 'user_id', name='_group_user_uc'),
+        db.Index('ix_group_member_user_id_group_id', 'user_id', 'group_id'),
+    )
 
 # Model for storing messages in group chats
 class GroupMessage(db.Model):
@@ -214,12 +334,20 @@ class GroupMessage(db.Model):
     file_path = db.Column(db.String(255), nullable=True)
     mime_type = db.Column(db.String(100), nullable=True)
     original_filename = db.Column(db.String(255), nullable=True)
+    # Готовые превью через запятую ('160,480,poster'), '' — превью нет, NULL — еще не обработано
+    variants = db.Column(db.String(100), nullable=True)
     # --- End Fields for file attachments ---
     
     # Define relationships
     group = db.relationship('Group', backref=db.backref('messages', lazy='dynamic'))
     sender = db.relationship('User', backref=db.backref('group_messages_sent', lazy='dynamic'))
     
+    # Keyset pagination of a group's history and the latest message per group
+    __table_args__ = (
+        db.Index('ix_group_message_group_id_id', 'group_id', 'id'),
+        db.Index('ix_group_message_group_id_timestamp', 'group_id', 'timestamp'),
+    )
+    
     def to_dict(self):
         """Convert group message to dictionary for JSON serialization"""
         message_dict = {
@@ -234,7 +362,95 @@ class GroupMessage(db.Model):
             'message_type': self.message_type,
             'file_path': self.file_path,
             'mime_type': self.mime_type,
-            'original_filename': self.original_filename
+            'original_filename': self.original_filename,
+            'variants': self.variants
             # --- End Add file fields ---
         }
-        return message_dict
\ No newline at end of file
+        return message_dict
+
+# --- Полнотекстовый поиск (FTS5) ---
+# Индексы с внешним содержимым: текст хранится только в message/group_message,
+# а таблицы FTS поддерживаются триггерами. Колонка participants содержит
+# токены доступа ("u<id>" собеседников, "g<id>" группы), чтобы поиск сразу
+# пересекал совпадения с сообщениями, видимыми пользователю.
+
+FTS_OPTIONS = "tokenize='unicode61 remove_diacritics 2', prefix='2 3'"
+
+MESSAGE_SEARCH_DDL = [
+    """CREATE VIEW IF NOT EXISTS message_search_source AS
+       SELECT id, content, 'u' || sender_id || ' u' || recipient_id AS participants FROM message""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+       content, participants, content='message_search_source', content_rowid='id', {FTS_OPTIONS})""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_insert AFTER INSERT ON message BEGIN
+       INSERT INTO message_fts (rowid, content, participants)
+       VALUES (new.id, new.content, 'u' || new.sender_id || ' u' || new.recipient_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_delete AFTER DELETE ON message BEGIN
+       INSERT INTO message_fts (message_fts, rowid, content, participants)
+       VALUES ('delete', old.id, old.content, 'u' || old.sender_id || ' u' || old.recipient_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_update AFTER UPDATE OF content, sender_id, recipient_id ON message BEGIN
+       INSERT INTO message_fts (message_fts, rowid, content, participants)
+       VALUES ('delete', old.id, old.content, 'u' || old.sender_id || ' u' || old.recipient_id);
+       INSERT INTO message_fts (rowid, content, participants)
+       VALUES (new.id, new.content, 'u' || new.sender_id || ' u' || new.recipient_id);
+       END""",
+]
+
+GROUP_MESSAGE_SEARCH_DDL = [
+    """CREATE VIEW IF NOT EXISTS group_message_search_source AS
+       SELECT id, content, 'g' || group_id AS participants FROM group_message""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS group_message_fts USING fts5(
+       content, participants, content='group_message_search_source', content_rowid='id', {FTS_OPTIONS})""",
+    """CREATE TRIGGER IF NOT EXISTS group_message_fts_insert AFTER INSERT ON group_message BEGIN
+       INSERT INTO group_message_fts (rowid, content, participants)
+       VALUES (new.id, new.content, 'g' || new.group_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS group_message_fts_delete AFTER DELETE ON group_message BEGIN
+       INSERT INTO group_message_fts (group_message_fts, rowid, content, participants)
+       VALUES ('delete', old.id, old.content, 'g' || old.group_id);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS group_message_fts_update AFTER UPDATE OF content, group_id ON group_message BEGIN
+       INSERT INTO group_message_fts (group_message_fts, rowid, content, participants)
+       VALUES ('delete', old.id, old.content, 'g' || old.group_id);
+       INSERT INTO group_message_fts (rowid, content, participants)
+       VALUES (new.id, new.content, 'g' || new.group_id);
+       END""",
+]
+
+def create_search_objects(connection, statements):
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+def _search_ddl_listeners(table, statements, fts_table, source_view=None):
+    @event.listens_for(table, 'after_create')
+    def _create(target, connection, **kw):
+        if connection.dialect.name == 'sqlite':
+            create_search_objects(connection, statements)
+
+    @event.listens_for(table, 'before_drop')
+    def _drop(target, connection, **kw):
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql(f"DROP TABLE IF EXISTS {fts_table}")
+            if source_view:
+                connection.exec_driver_sql(f"DROP VIEW IF EXISTS {source_view}")
+
+# Триграммный индекс имен для поиска подстроки; регистр сворачивает сам токенизатор
+USER_SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(
+       name, content='user', content_rowid='id', tokenize='trigram case_sensitive 0')""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_insert AFTER INSERT ON user BEGIN
+       INSERT INTO user_fts (rowid, name) VALUES (new.id, new.name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_delete AFTER DELETE ON user BEGIN
+       INSERT INTO user_fts (user_fts, rowid, name) VALUES ('delete', old.id, old.name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS user_fts_update AFTER UPDATE OF name ON user BEGIN
+       INSERT INTO user_fts (user_fts, rowid, name) VALUES ('delete', old.id, old.name);
+       INSERT INTO user_fts (rowid, name) VALUES (new.id, new.name);
+       END""",
+]
+
+_search_ddl_listeners(Message.__table__, MESSAGE_SEARCH_DDL, 'message_fts', 'message_search_source')
+_search_ddl_listeners(GroupMessage.__table__, GROUP_MESSAGE_SEARCH_DDL, 'group_message_fts', 'group_message_search_source')
+_search_ddl_listeners(User.__table__, USER_SEARCH_DDL, 'user_fts')
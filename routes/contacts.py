@@ -1,6 +1,8 @@
 from flask import Blueprint, request, session, jsonify
 from models.user import db, User, Contact, Block
 import logging
+from utils.relations import relations_changed, is_contact, is_blocked_between
+from utils.http_cache import version_etag, not_modified, tag_response
 
 # Create blueprint for contact routes with explicit URL prefix of nothing
 contacts_bp = Blueprint('contacts', __name__, url_prefix='')
@@ -10,6 +12,15 @@ def get_contacts():
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     try:
+        # Версия списка: сами записи контактов и счетчики профилей контактов
+        versions = db.session.query(Contact.id, Contact.contact_id, User.profile_version).join(
+            User, User.id == Contact.contact_id
+        ).filter(Contact.user_id == session['user_id'])
+        etag = version_etag('contacts', session['user_id'], sorted(tuple(row) for row in versions))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
         # Получаем все контакты текущего пользователя
         contacts_query = Contact.query.filter_by(user_id=session['user_id']).all()
         contacts = []
@@ -23,10 +34,10 @@ def get_contacts():
             }
             contacts.append(contact_data)
         logging.debug(f"Retrieved {len(contacts)} contacts for user {session['user_id']}")
-        return jsonify({
+        return tag_response(jsonify({
             'success': True,
             'contacts': contacts
-        })
+        }), etag)
     except Exception as e:
         logging.error(f"Ошибка при получении контактов: {str(e)}")
         return jsonify({'success': False, 'error': 'Failed to retrieve contacts'}), 500
@@ -75,6 +86,7 @@ def add_contact():
         )
         db.session.add(new_contact)
         db.session.commit()
+        relations_changed(session['user_id'], contact_id)
         
         return jsonify({
             'success': True,
@@ -113,6 +125,7 @@ def remove_contact():
         if contact:
             db.session.delete(contact)
             db.session.commit()
+            relations_changed(session['user_id'], contact_id)
         return jsonify({
             'success': True,
             'message': 'Contact removed successfully'
@@ -133,12 +146,8 @@ def check_contact():
             return jsonify({'error': 'Contact ID is required'}), 400
         
         # Проверяем, добавлен ли пользователь уже в контакты
-        existing_contact = Contact.query.filter_by(
-            user_id=session['user_id'],
-            contact_id=contact_id
-        ).first()
         return jsonify({
-            'is_contact': existing_contact is not None
+            'is_contact': is_contact(session['user_id'], contact_id)
         })
     except Exception as e:
         logging.error(f"Ошибка при проверке контакта: {str(e)}")
@@ -154,17 +163,8 @@ def check_block_status():
         if not user_id:
             return jsonify({'success': False, 'error': 'User ID required'}), 400
         
-        # Check if the current user has blocked the target user
-        is_blocked_by_you = Block.query.filter_by(
-            user_id=session['user_id'],
-            blocked_user_id=user_id
-        ).first() is not None
-        
-        # Check if the target user has blocked the current user
-        has_blocked_you = Block.query.filter_by(
-            user_id=user_id,
-            blocked_user_id=session['user_id']
-        ).first() is not None
+        # Блокировки в обе стороны из кеша связей
+        is_blocked_by_you, has_blocked_you = is_blocked_between(session['user_id'], user_id)
         
         return jsonify({
             'success': True,
@@ -218,6 +218,7 @@ def block_user():
             db.session.delete(contact2)
         
         db.session.commit()
+        relations_changed(session['user_id'], user_id)
         return jsonify({'success': True, 'message': 'User blocked successfully'})
     except Exception as e:
         db.session.rollback()
@@ -242,6 +243,7 @@ def unblock_user():
         if block:
             db.session.delete(block)
             db.session.commit()
+            relations_changed(session['user_id'], user_id)
             return jsonify({'success': True, 'message': 'User unblocked successfully'})
         else:
             return jsonify({'success': True, 'message': 'User was not blocked'})
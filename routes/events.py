@@ -0,0 +1,49 @@
+from flask import Blueprint, Response, request, session, jsonify
+import logging
+import time
+from utils.events import get_broker, format_sse
+
+# Create blueprint for the live updates stream
+events_bp = Blueprint('events', __name__)
+
+# Интервал keep-alive комментариев, чтобы прокси не закрывали соединение
+KEEPALIVE_INTERVAL = 15
+# Задержка переподключения, которую браузер использует для EventSource
+RETRY_MS = 3000
+
+@events_bp.route('/events')
+def events():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    user_id = int(session['user_id'])
+    broker = get_broker()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    resume_seq = broker.parse_event_id(last_event_id)
+
+    def stream():
+        yield f"retry: {RETRY_MS}\n\n"
+        if resume_seq is not None and broker.is_resumable(resume_seq):
+            after_seq = resume_seq
+        else:
+            after_seq = broker.current_seq()
+            if last_event_id:
+                # Пропущенные события уже недоступны: клиент должен перечитать данные
+                yield format_sse(f"{broker.epoch}-{after_seq}", 'resync', {})
+        last_write = time.monotonic()
+        try:
+            while True:
+                events, after_seq = broker.wait(user_id, after_seq, KEEPALIVE_INTERVAL)
+                for event_id, event_type, data in events:
+                    yield format_sse(event_id, event_type, data)
+                    last_write = time.monotonic()
+                if not events and time.monotonic() - last_write >= KEEPALIVE_INTERVAL:
+                    yield ": keepalive\n\n"
+                    last_write = time.monotonic()
+        except GeneratorExit:
+            logging.debug(f"Event stream closed for user {user_id}")
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -0,0 +1,159 @@
+from flask import Blueprint, request, session, jsonify, current_app, send_file
+from werkzeug.exceptions import HTTPException
+from werkzeug.security import safe_join
+import logging
+import mimetypes
+import os
+from urllib.parse import quote
+from utils.memberships import is_group_member
+from utils.uploads import UploadError, start_upload, get_upload, write_chunk
+from utils.thumbnails import variant_for
+
+# Blueprint for serving uploaded files (auth in Python, bytes optionally by the proxy)
+files_bp = Blueprint('files', __name__)
+
+# Имена файлов в direct_files/ и group_files/ — uuid4, содержимое по адресу не меняется
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+# Аватары видны всем пользователям; новый аватар сохраняется под новым именем
+AVATAR_CACHE_CONTROL = 'public, max-age=86400'
+# ?size=N, пока превью не готово: отдается оригинал, но после появления превью ответ по тому же адресу изменится
+PENDING_VARIANT_CACHE_CONTROL = 'private, no-cache'
+
+def check_upload_access(filepath, user_id):
+    """
+    Returns None if user_id may read the upload at filepath, otherwise an
+    error response. Group files need group membership, direct files must be
+    in a folder named after the pair of users, avatars are open to everyone.
+    """
+    # Security Check: Basic check for path traversal
+    if '..' in filepath or filepath.startswith('/'):
+        logging.warning(f"Potential path traversal attempt: {filepath}")
+        return jsonify({"error": "Forbidden"}), 403
+
+    parts = filepath.split('/')
+    # More specific security for group files
+    if parts[0] == 'group_files':
+        # Extract group_id from the path (e.g., group_files/123/image.png -> 123)
+        if len(parts) < 3 or not parts[1].isdigit():
+            logging.warning(f"Invalid group file path format: {filepath}")
+            return jsonify({"error": "Not found"}), 404
+        # Check if current user is a member of this group (кеш членства, без SQL)
+        if not is_group_member(int(parts[1]), user_id):
+            logging.warning(f"User {user_id} not member of group {parts[1]}, denied access to {filepath}")
+            return jsonify({"error": "Forbidden"}), 403
+        return None
+    # Handle direct chat files
+    if parts[0] == 'direct_files':
+        # Extract user IDs from the path (e.g., direct_files/1_2/file.png -> 1_2)
+        user_ids = parts[1].split('_') if len(parts) >= 3 else []
+        if len(user_ids) != 2 or not all(uid.isdigit() for uid in user_ids):
+            logging.warning(f"Invalid direct file path format: {filepath}")
+            return jsonify({"error": "Not found"}), 404
+        if int(user_id) not in map(int, user_ids):
+            logging.warning(f"User {user_id} not authorized for direct file {filepath}")
+            return jsonify({"error": "Forbidden"}), 403
+        return None
+    # Avatars are generally considered public within the app
+    if parts[0] == 'avatars':
+        return None
+    # Handle other potential paths or deny by default
+    logging.warning(f"Attempt to access potentially restricted path: {filepath}")
+    return jsonify({"error": "Forbidden"}), 403
+
+def send_upload(filepath, cache_control):
+    """
+    Sends a file from UPLOAD_FOLDER. With FILE_OFFLOAD = 'x-accel' the body is
+    left to nginx through an X-Accel-Redirect to X_ACCEL_PREFIX + filepath
+    (an internal location aliased to the upload folder); with 'x-sendfile'
+    Flask's USE_X_SENDFILE hands the absolute path to Apache/lighttpd. The
+    server then also answers Range and conditional requests. Without offload
+    werkzeug streams the file and answers Range with 206 and
+    If-None-Match/If-Modified-Since with 304.
+    """
+    full_path = safe_join(current_app.config['UPLOAD_FOLDER'], filepath)
+    if full_path is None or not os.path.isfile(full_path):
+        logging.error(f"File not found: {filepath}")
+        return jsonify({"error": "Not found"}), 404
+
+    offload = current_app.config.get('FILE_OFFLOAD')
+    if offload == 'x-accel':
+        # Тело, Range и условные запросы обрабатывает nginx
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = current_app.config['X_ACCEL_PREFIX'].rstrip('/') + '/' + quote(filepath)
+    elif offload == 'x-sendfile':
+        response = send_file(full_path, conditional=False)
+    else:
+        response = send_file(full_path, conditional=True)
+        # werkzeug объявляет Accept-Ranges только в ответе 206; плеерам нужно знать заранее
+        response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+@files_bp.route('/uploads/<path:filepath>')
+def serve_uploaded_file(filepath):
+    if 'user_id' not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    logging.debug(f"Attempting to serve file: {filepath}")
+    try:
+        denied = check_upload_access(filepath, session['user_id'])
+        if denied:
+            return denied
+        cache_control = AVATAR_CACHE_CONTROL if filepath.startswith('avatars/') else IMMUTABLE_CACHE_CONTROL
+        # ?size=480 — превью рядом с файлом (та же папка, те же права), пока его нет — сам файл
+        if request.args.get('size'):
+            variant = variant_for(filepath, request.args['size'])
+            if variant == filepath:
+                cache_control = PENDING_VARIANT_CACHE_CONTROL
+            filepath = variant
+        return send_upload(filepath, cache_control)
+    except HTTPException as e:
+        # 416 для диапазона за концом файла
+        return e
+    except Exception as e:
+        logging.error(f"Error serving file {filepath}: {e}")
+        return jsonify({"error": "Server error"}), 500
+
+# --- Resumable uploads: /upload_init, then /upload_chunk/<id>/<n> for every part,
+# then /upload_direct_file or /upload_group_file with upload_id creates the message ---
+
+@files_bp.route('/upload_init', methods=['POST'])
+def upload_init():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'}), 401
+    try:
+        data = request.get_json() or {}
+        upload = start_upload(session['user_id'], data.get('filename'), data.get('size'), data.get('mime_type'))
+        return jsonify({'success': True, **upload.to_dict()})
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except Exception as e:
+        logging.error(f"Error starting upload: {e}")
+        return jsonify({'success': False, 'error': 'Server error'}), 500
+
+@files_bp.route('/upload_chunk/<upload_id>/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """Body is the raw chunk; X-Chunk-SHA256 carries its hex SHA-256"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'}), 401
+    try:
+        upload = get_upload(upload_id, session['user_id'])
+        upload = write_chunk(upload, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+        return jsonify({'success': True, **upload.to_dict()})
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except Exception as e:
+        logging.error(f"Error writing chunk {index} of upload {upload_id}: {e}")
+        return jsonify({'success': False, 'error': 'Server error'}), 500
+
+@files_bp.route('/upload_status/<upload_id>')
+def upload_status(upload_id):
+    """Where to resume: next_chunk is the first chunk the server does not have"""
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'}), 401
+    try:
+        return jsonify({'success': True, **get_upload(upload_id, session['user_id']).to_dict()})
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
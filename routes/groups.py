@@ -1,12 +1,22 @@
 from flask import Blueprint, request, render_template, redirect, url_for, flash, session, jsonify, current_app
 from models.user import db, User, GroupMember, Group, GroupMessage, Contact
+from sqlalchemy import text
 import logging
 import datetime
 import os
 from werkzeug.utils import secure_filename
 import traceback
 import uuid
-from utils.odoo_sync import send_group_message_to_odoo, send_group_to_odoo
+from utils.odoo_sync import enqueue_group_message, send_group_to_odoo
+from utils.pagination import parse_page_args, keyset_page
+from utils.events import publish
+from utils.memberships import get_members, member_role, is_group_member, is_group_admin, members_changed
+from utils.serialization import (GROUP_MESSAGE_COLUMNS, STREAM_BATCH_SIZE, serialize_group_message_row,
+                                 json_response, stream_json)
+from utils.http_cache import version_etag, not_modified, tag_response
+from utils.uploads import UploadError, get_upload, finish_upload, discard_partial
+from utils.blobs import store_stream
+from utils.thumbnails import schedule_variants
 
 # Create blueprint for group routes
 groups_bp = Blueprint('groups', __name__)
@@ -16,6 +26,30 @@ def allowed_file(filename):
     allowed_extensions = {'png', 'jpg', 'jpeg', 'gif'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
+def group_member_ids(group_id):
+    """Ids of accepted members of a group, for addressing live events"""
+    return list(get_members(group_id))
+
+def latest_group_message_id(group_id):
+    return db.session.query(db.func.max(GroupMessage.id)).filter_by(group_id=group_id).scalar() or 0
+
+def advance_read_cursor(group_id, user_ids, message_id):
+    """Moves read cursors forward to message_id; a cursor never moves back"""
+    if not isinstance(user_ids, (list, tuple, set)):
+        user_ids = [user_ids]
+    GroupMember.query.filter(
+        GroupMember.group_id == group_id,
+        GroupMember.user_id.in_([int(uid) for uid in user_ids]),
+        GroupMember.last_read_message_id < message_id
+    ).update({'last_read_message_id': message_id}, synchronize_session=False)
+
+def group_unread_count(group_id, last_read_message_id):
+    """Счет по диапазону индекса (group_id, id) без чтения самих сообщений"""
+    return GroupMessage.query.filter(
+        GroupMessage.group_id == group_id,
+        GroupMessage.id > last_read_message_id
+    ).count()
+
 @groups_bp.route('/create_group', methods=['GET', 'POST'])
 def create_group():
     if 'user_id' not in session:
@@ -50,7 +84,7 @@ def create_group():
                             file_path = os.path.join(avatars_dir, unique_filename)
                             
                             # Save the file
-                            avatar_file.save(file_path)
+                            store_stream(avatar_file.stream, file_path)
                             logging.debug(f"Saved avatar to {file_path}")
                             
                             # Store the path relative to uploads folder (without static/ prefix)
@@ -113,6 +147,9 @@ def create_group():
                     continue
             
             db.session.commit()
+            members_changed(new_group.id)
+            if avatar_path:
+                schedule_variants(avatar_path)
             # Синхронизация группы с Odoo
             member_records = GroupMember.query.filter_by(group_id=new_group.id, invitation_status='accepted').all()
             member_users = [User.query.get(m.user_id) for m in member_records if User.query.get(m.user_id)]
@@ -144,6 +181,47 @@ def create_group():
     # GET request - display the form
     return render_template('create_group.html')
 
+# Список групп пользователя одним запросом: число участников — коррелированный
+# COUNT по индексу (group_id, user_id) каждой его группы (не проход по всей
+# group_member), последнее сообщение каждой группы берется по индексу
+# (group_id, timestamp), имя отправителя — LEFT JOIN, непрочитанные — счет по
+# диапазону индекса (group_id, id) после курсора участника
+USER_GROUPS_QUERY = text("""
+    WITH my_groups AS (
+        SELECT id AS membership_id, group_id, role, last_read_message_id FROM group_member
+        WHERE user_id = :user_id AND invitation_status = 'accepted'
+    )
+    SELECT
+        g.id AS id,
+        g.name AS name,
+        g.description AS description,
+        g.avatar_path AS avatar_path,
+        mg.role AS role,
+        (
+            SELECT COUNT(*) FROM group_member gm
+            WHERE gm.group_id = g.id AND gm.invitation_status = 'accepted'
+        ) AS member_count,
+        (
+            SELECT COUNT(*) FROM group_message um
+            WHERE um.group_id = g.id AND um.id > mg.last_read_message_id
+        ) AS unread_count,
+        lm.id AS last_message_id,
+        lm.content AS last_content,
+        lm.sender_id AS last_sender_id,
+        lm.timestamp AS last_timestamp,
+        su.name AS last_sender_name
+    FROM my_groups mg
+    JOIN "group" g ON g.id = mg.group_id
+    LEFT JOIN group_message lm ON lm.id = (
+        SELECT id FROM group_message
+        WHERE group_id = g.id
+        ORDER BY timestamp DESC, id DESC
+        LIMIT 1
+    )
+    LEFT JOIN user su ON su.id = lm.sender_id
+    ORDER BY mg.membership_id
+""").columns(last_timestamp=db.DateTime)
+
 # Ensure this route matches what frontend expects
 @groups_bp.route('/get_user_groups')
 def get_user_groups():
@@ -151,52 +229,46 @@ def get_user_groups():
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        # Get groups where the user is a member
-        member_records = GroupMember.query.filter_by(
-            user_id=session['user_id'],
-            invitation_status='accepted'
-        ).all()
+        # Версия списка по счетчикам групп и курсорам чтения, без подсчетов и последних сообщений
+        versions = db.session.query(
+            GroupMember.group_id, GroupMember.role, GroupMember.last_read_message_id,
+            Group.version, Group.members_version, Group.messages_version
+        ).join(Group, Group.id == GroupMember.group_id).filter(
+            GroupMember.user_id == session['user_id'],
+            GroupMember.invitation_status == 'accepted'
+        )
+        etag = version_etag('user_groups', session['user_id'], sorted(tuple(row) for row in versions))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        result = db.session.execute(USER_GROUPS_QUERY, {'user_id': session['user_id']})
         
         groups = []
-        for member in member_records:
-            group = member.group
-            
-            # Count members
-            member_count = GroupMember.query.filter_by(
-                group_id=group.id,
-                invitation_status='accepted'
-            ).count()
-            
-            # Get last message
-            last_message = GroupMessage.query.filter_by(
-                group_id=group.id
-            ).order_by(GroupMessage.timestamp.desc()).first()
-            
+        for row in result:
             # Include last message info
             last_message_data = None
-            if last_message:
-                sender = User.query.get(last_message.sender_id)
-                sender_name = sender.name if sender else "Unknown"
+            if row.last_message_id is not None:
                 last_message_data = {
-                    'content': last_message.content,
-                    'sender_name': sender_name,
-                    'sender_id': last_message.sender_id,
-                    'timestamp': last_message.timestamp.isoformat()  # Include timestamp
+                    'content': row.last_content,
+                    'sender_name': row.last_sender_name or "Unknown",
+                    'sender_id': row.last_sender_id,
+                    'timestamp': row.last_timestamp.isoformat() if row.last_timestamp else None  # Include timestamp
                 }
             
             # Add group to list
             groups.append({
-                'id': group.id,
-                'name': group.name,
-                'description': group.description,
-                'member_count': member_count,
-                'is_admin': member.role == 'admin',
-                'unread_count': 0,  # TODO: Implement unread messages count
-                'avatar_path': group.avatar_path,
+                'id': row.id,
+                'name': row.name,
+                'description': row.description,
+                'member_count': row.member_count,
+                'is_admin': row.role == 'admin',
+                'unread_count': row.unread_count,
+                'avatar_path': row.avatar_path,
                 'last_message': last_message_data
             })
         
-        return jsonify({'success': True, 'groups': groups})
+        return tag_response(jsonify({'success': True, 'groups': groups}), etag)
     except Exception as e:
         logging.error(f"Error getting user groups: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
@@ -236,21 +308,23 @@ def get_group_info():
         return jsonify({'error': 'Group ID is required'}), 400
     
     try:
-        # Get the group
-        group = Group.query.get(group_id)
-        if not group:
+        versions = db.session.query(Group.version, Group.members_version).filter_by(id=group_id).first()
+        if not versions:
             return jsonify({'error': 'Group not found'}), 404
         
         # Check if user is a member
-        member = GroupMember.query.filter_by(
-            group_id=group_id,
-            user_id=session['user_id'],
-            invitation_status='accepted'
-        ).first()
-        
-        if not member:
+        role = member_role(group_id, session['user_id'])
+        if not role:
             return jsonify({'error': 'You are not a member of this group'}), 403
         
+        etag = version_etag('group_info', int(group_id), session['user_id'], tuple(versions))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        # Get the group
+        group = Group.query.get(group_id)
+        
         # Get all accepted members
         members_query = GroupMember.query.filter_by(
             group_id=group_id,
@@ -276,11 +350,11 @@ def get_group_info():
             'creator_id': group.creator_id,
             'members': members,
             'member_count': len(members),
-            'is_admin': member.role == 'admin',
+            'is_admin': role == 'admin',
             'avatar_path': group.avatar_path  # Make sure to include avatar_path in response
         }
         
-        return jsonify({'success': True, 'group': group_info})
+        return tag_response(jsonify({'success': True, 'group': group_info}), etag)
     except Exception as e:
         logging.error(f"Error getting group info: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
@@ -290,52 +364,68 @@ def get_group_messages():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    group_id = request.args.get('group_id')
+    group_id = request.args.get('group_id', type=int)
     if not group_id:
         return jsonify({'error': 'Group ID is required'}), 400
     
     try:
         # Check if user is a member
-        member = GroupMember.query.filter_by(
-            group_id=group_id,
-            user_id=session['user_id'],
-            invitation_status='accepted'
-        ).first()
-        
-        if not member:
+        if not is_group_member(group_id, session['user_id']):
             return jsonify({'error': 'You are not a member of this group'}), 403
         
-        # Get messages for the group
-        messages_query = GroupMessage.query.filter_by(
-            group_id=group_id
-        ).order_by(GroupMessage.timestamp.asc())
-        
-        messages = [message.to_dict() for message in messages_query.all()]
-        
-        # Get all group members for displaying names
-        members_query = GroupMember.query.filter_by(
-            group_id=group_id,
-            invitation_status='accepted'
-        ).all()
-        
-        members = []
-        for member_record in members_query:
-            user = User.query.get(member_record.user_id)
-            if user:
-                members.append({
-                    'id': user.id,
-                    'name': user.name
-                })
+        # Get a page of messages for the group (keyset on group_id, id)
+        before_id, after_id, limit = parse_page_args(request.args)
+        page, has_more = keyset_page(
+            db.session.query(*GROUP_MESSAGE_COLUMNS).filter(GroupMessage.group_id == group_id),
+            GroupMessage.id, before_id, after_id, limit
+        )
+        messages = [serialize_group_message_row(row) for row in page]
         
-        return jsonify({
+        response = {
             'success': True,
             'messages': messages,
-            'members': members
-        })
+            'has_more': has_more
+        }
+        
+        # The member directory is only sent when the client's copy is stale
+        members_version = db.session.query(Group.members_version).filter_by(id=group_id).scalar() or 0
+        response['members_version'] = members_version
+        if request.args.get('members_version', type=int) != members_version:
+            members_query = db.session.query(User.id, User.name).join(
+                GroupMember, GroupMember.user_id == User.id
+            ).filter(
+                GroupMember.group_id == group_id,
+                GroupMember.invitation_status == 'accepted'
+            )
+            response['members'] = [{'id': row.id, 'name': row.name} for row in members_query]
+        
+        return json_response(response)
     except Exception as e:
         logging.error(f"Error getting group messages: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
 
+@groups_bp.route('/export_group_messages')
+def export_group_messages():
+    """Whole history of a group, oldest first, streamed from a range scan on (group_id, id)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    group_id = request.args.get('group_id', type=int)
+    if not group_id:
+        return jsonify({'error': 'Group ID is required'}), 400
+    
+    try:
+        if not is_group_member(group_id, session['user_id']):
+            return jsonify({'error': 'You are not a member of this group'}), 403
+        
+        rows = iter(db.session.query(*GROUP_MESSAGE_COLUMNS).filter(
+            GroupMessage.group_id == group_id
+        ).order_by(GroupMessage.id.asc()).yield_per(STREAM_BATCH_SIZE))
+        return stream_json({'success': True}, 'messages', rows, serialize_group_message_row)
+    except Exception as e:
+        logging.error(f"Error exporting group messages: {str(e)}")
+        return jsonify({'error': 'Server error'}), 500
+
 @groups_bp.route('/send_group_message', methods=['POST'])
 def send_group_message():
     if 'user_id' not in session:
@@ -350,13 +440,7 @@ def send_group_message():
             return jsonify({'error': 'Group ID and content are required'}), 400
         
         # Check if user is a member
-        member = GroupMember.query.filter_by(
-            group_id=group_id,
-            user_id=session['user_id'],
-            invitation_status='accepted'
-        ).first()
-        
-        if not member:
+        if not is_group_member(group_id, session['user_id']):
             return jsonify({'error': 'You are not a member of this group'}), 403
         
         # Create new message
@@ -368,19 +452,18 @@ def send_group_message():
         )
         
         db.session.add(new_message)
+        db.session.flush()
+        # Отправитель прочитал группу до своего сообщения
+        advance_read_cursor(group_id, session['user_id'], new_message.id)
+        Group.bump_messages_version(group_id)
+        enqueue_group_message(new_message)
         db.session.commit()
-        # Добавляю имя отправителя
         sender = User.query.get(new_message.sender_id)
-        new_message.sender_name = sender.name if sender else ''
-        new_message.recipient_name = ''
-        try:
-            send_group_message_to_odoo(new_message)
-        except Exception as e:
-            logging.error(f"Odoo group sync error: {e}")
         
         # Return the message with sender info
         message_dict = new_message.to_dict()
         message_dict['sender_name'] = sender.name if sender else 'Unknown'
+        publish(group_member_ids(group_id), 'group_message', message_dict)
         
         return jsonify({
             'success': True,
@@ -416,6 +499,7 @@ def edit_group_message():
         message.content = content
         message.is_edited = True
         message.edited_at = datetime.datetime.now()
+        Group.bump_messages_version(message.group_id)
         
         db.session.commit()
         
@@ -424,6 +508,7 @@ def edit_group_message():
         # Add sender name
         sender = User.query.get(session['user_id'])
         updated_message['sender_name'] = sender.name if sender else 'Unknown'
+        publish(group_member_ids(message.group_id), 'group_message_edited', updated_message)
         
         return jsonify({
             'success': True,
@@ -434,6 +519,48 @@ def edit_group_message():
         logging.error(f"Error editing group message: {str(e)}")
         return jsonify({'success': False, 'error': 'Server error'}), 500
 
+@groups_bp.route('/mark_group_read', methods=['POST'])
+def mark_group_read():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'}), 401
+    try:
+        data = request.get_json() or {}
+        group_id = data.get('group_id')
+        message_id = data.get('message_id')
+        if not group_id:
+            return jsonify({'success': False, 'error': 'Group ID is required'}), 400
+        if not is_group_member(group_id, session['user_id']):
+            return jsonify({'success': False, 'error': 'You are not a member of this group'}), 403
+        
+        # Без message_id группа читается целиком; курсор не уходит дальше последнего сообщения
+        latest_id = latest_group_message_id(group_id)
+        read_up_to = latest_id if message_id is None else min(int(message_id), latest_id)
+        advance_read_cursor(group_id, session['user_id'], read_up_to)
+        db.session.commit()
+        
+        last_read_message_id = db.session.query(GroupMember.last_read_message_id).filter_by(
+            group_id=group_id,
+            user_id=session['user_id']
+        ).scalar()
+        unread_count = group_unread_count(group_id, last_read_message_id)
+        # Другие вкладки пользователя обновляют счетчик
+        publish([session['user_id']], 'group_read', {
+            'group_id': int(group_id),
+            'last_read_message_id': last_read_message_id,
+            'unread_count': unread_count
+        })
+        return jsonify({
+            'success': True,
+            'last_read_message_id': last_read_message_id,
+            'unread_count': unread_count
+        })
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid message ID'}), 400
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error marking group read: {str(e)}")
+        return jsonify({'success': False, 'error': 'Server error'}), 500
+
 @groups_bp.route('/leave_group', methods=['POST'])
 def leave_group():
     if 'user_id' not in session:
@@ -476,7 +603,9 @@ def leave_group():
                 if earliest_member:
                     earliest_member.role = 'admin'
 
+        Group.bump_members_version(group_id)
         db.session.commit()
+        members_changed(group_id)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -495,15 +624,11 @@ def add_group_members():
         if not group_id or not user_ids:
             return jsonify({'success': False, 'error': 'Group ID and user_ids are required'}), 400
         # Проверить, что вызывающий — админ
-        member = GroupMember.query.filter_by(
-            group_id=group_id,
-            user_id=session['user_id'],
-            invitation_status='accepted'
-        ).first()
-        if not member or member.role != 'admin':
+        if not is_group_admin(group_id, session['user_id']):
             return jsonify({'success': False, 'error': 'Only group admin can add members'}), 403
-        # Добавить новых участников
+        # Добавить новых участников; история до вступления не считается непрочитанной
         user_ids = [int(uid) for uid in user_ids]
+        latest_id = latest_group_message_id(group_id)
         added = 0
         for uid in user_ids:
             try:
@@ -513,7 +638,8 @@ def add_group_members():
                         group_id=group_id,
                         user_id=uid,
                         role='member',
-                        invitation_status='accepted'
+                        invitation_status='accepted',
+                        last_read_message_id=latest_id
                     )
                     db.session.add(new_member)
                     added += 1
@@ -521,7 +647,11 @@ def add_group_members():
             except Exception as e:
                 logging.error(f'Failed to add user {uid} to group {group_id}: {e}')
                 continue
+        if added:
+            Group.bump_members_version(group_id)
         db.session.commit()
+        if added:
+            members_changed(group_id)
         return jsonify({'success': True, 'added': added})
     except Exception as e:
         db.session.rollback()
@@ -539,8 +669,7 @@ def edit_group():
         name = data.get('name', '').strip()
         description = data.get('description', '').strip()
         # Проверить права
-        member = GroupMember.query.filter_by(group_id=group_id, user_id=session['user_id'], invitation_status='accepted').first()
-        if not member or member.role != 'admin':
+        if not is_group_admin(group_id, session['user_id']):
             return jsonify({'success': False, 'error': 'Only admin can edit group'}), 403
         group = Group.query.get(group_id)
         if not group:
@@ -549,6 +678,7 @@ def edit_group():
             group.name = name
         group.description = description
         # Аватар (опционально)
+        new_avatar = None
         if 'avatar' in request.files:
             avatar_file = request.files['avatar']
             if avatar_file and avatar_file.filename:
@@ -562,9 +692,12 @@ def edit_group():
                 os.makedirs(avatars_dir, exist_ok=True)
                 
                 file_path = os.path.join(avatars_dir, unique_filename)
-                avatar_file.save(file_path)
-                group.avatar_path = f"avatars/{unique_filename}"
+                store_stream(avatar_file.stream, file_path)
+                new_avatar = group.avatar_path = f"avatars/{unique_filename}"
+        group.version = Group.version + 1
         db.session.commit()
+        if new_avatar:
+            schedule_variants(new_avatar)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -579,14 +712,15 @@ def set_group_admin():
         group_id = data.get('group_id')
         user_id = data.get('user_id')
         # Проверить права
-        member = GroupMember.query.filter_by(group_id=group_id, user_id=session['user_id'], invitation_status='accepted').first()
-        if not member or member.role != 'admin':
+        if not is_group_admin(group_id, session['user_id']):
             return jsonify({'success': False, 'error': 'Only admin can set admin'}), 403
         target = GroupMember.query.filter_by(group_id=group_id, user_id=user_id, invitation_status='accepted').first()
         if not target:
             return jsonify({'success': False, 'error': 'User not in group'}), 404
         target.role = 'admin'
+        Group.bump_members_version(group_id)
         db.session.commit()
+        members_changed(group_id)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -601,14 +735,15 @@ def remove_group_admin():
         group_id = data.get('group_id')
         user_id = data.get('user_id')
         # Проверить права
-        member = GroupMember.query.filter_by(group_id=group_id, user_id=session['user_id'], invitation_status='accepted').first()
-        if not member or member.role != 'admin':
+        if not is_group_admin(group_id, session['user_id']):
             return jsonify({'success': False, 'error': 'Only admin can remove admin'}), 403
         target = GroupMember.query.filter_by(group_id=group_id, user_id=user_id, invitation_status='accepted').first()
         if not target:
             return jsonify({'success': False, 'error': 'User not in group'}), 404
         target.role = 'member'
+        Group.bump_members_version(group_id)
         db.session.commit()
+        members_changed(group_id)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -623,14 +758,15 @@ def kick_group_member():
         group_id = data.get('group_id')
         user_id = data.get('user_id')
         # Проверить права
-        member = GroupMember.query.filter_by(group_id=group_id, user_id=session['user_id'], invitation_status='accepted').first()
-        if not member or member.role != 'admin':
+        if not is_group_admin(group_id, session['user_id']):
             return jsonify({'success': False, 'error': 'Only admin can kick'}), 403
         target = GroupMember.query.filter_by(group_id=group_id, user_id=user_id, invitation_status='accepted').first()
         if not target:
             return jsonify({'success': False, 'error': 'User not in group'}), 404
         db.session.delete(target)
+        Group.bump_members_version(group_id)
         db.session.commit()
+        members_changed(group_id)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -653,6 +789,7 @@ def delete_group():
         GroupMessage.query.filter_by(group_id=group_id).delete()
         db.session.delete(group)
         db.session.commit()
+        members_changed(group_id)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -673,8 +810,14 @@ def delete_group_message():
             return jsonify({'success': False, 'error': 'Message not found'}), 404
         if message.sender_id != session['user_id']:
             return jsonify({'success': False, 'error': 'You can only delete your own messages'}), 403
+        group_id = message.group_id
         db.session.delete(message)
+        Group.bump_messages_version(group_id)
         db.session.commit()
+        publish(group_member_ids(group_id), 'group_message_deleted', {
+            'id': int(message_id),
+            'group_id': group_id
+        })
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -687,24 +830,24 @@ def upload_group_file():
         return jsonify({'success': False, 'error': 'Not logged in'}), 401
 
     try:
-        group_id = request.form.get('group_id')
+        # Файл приходит либо целиком в multipart, либо как upload_id завершенной загрузки по частям
+        data = request.form if request.form else (request.get_json(silent=True) or {})
+        group_id = data.get('group_id')
         file = request.files.get('file')
-        caption = request.form.get('caption', '').strip() # Optional caption
+        upload_id = data.get('upload_id')
+        caption = (data.get('caption') or '').strip() # Optional caption
 
-        if not group_id or not file:
+        if not group_id or not (file or upload_id):
             return jsonify({'success': False, 'error': 'Group ID and file are required'}), 400
+        upload = get_upload(upload_id, session['user_id']) if upload_id else None
 
         # Check if user is a member
-        member = GroupMember.query.filter_by(
-            group_id=group_id,
-            user_id=session['user_id'],
-            invitation_status='accepted'
-        ).first()
-        if not member:
+        if not is_group_member(group_id, session['user_id']):
             return jsonify({'success': False, 'error': 'You are not a member of this group'}), 403
 
         # --- File Saving Logic ---
-        original_filename = secure_filename(file.filename)
+        original_filename = upload.original_filename if upload else secure_filename(file.filename)
+        mime_type = upload.mime_type if upload else file.mimetype
         file_ext = os.path.splitext(original_filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_ext}"
         
@@ -716,7 +859,10 @@ def upload_group_file():
         os.makedirs(full_save_dir, exist_ok=True)
         
         file_path_full = os.path.join(full_save_dir, unique_filename)
-        file.save(file_path_full)
+        if upload:
+            finish_upload(upload, file_path_full)
+        else:
+            store_stream(file.stream, file_path_full)
         
         # Store the relative path in the database
         db_file_path = os.path.join(relative_save_dir, unique_filename).replace('\\', '/') # Use forward slashes for consistency
@@ -733,21 +879,23 @@ def upload_group_file():
             content=caption, # Use the optional caption as content
             message_type='file', # Set the type to 'file'
             file_path=db_file_path, # Store the relative path
-            mime_type=file.mimetype,
+            mime_type=mime_type,
             original_filename=original_filename
         )
         
         db.session.add(new_message)
+        db.session.flush()
+        # Отправитель прочитал группу до своего сообщения
+        advance_read_cursor(group_id, session['user_id'], new_message.id)
+        Group.bump_messages_version(group_id)
+        enqueue_group_message(new_message)
         db.session.commit()
-        # Добавляю имя отправителя
-        sender = User.query.get(new_message.sender_id)
-        new_message.sender_name = sender.name if sender else ''
-        new_message.recipient_name = ''
-        try:
-            send_group_message_to_odoo(new_message)
-        except Exception as e:
-            logging.error(f"Odoo group sync error: {e}")
+        if upload:
+            # Временный файл нужен до коммита: при ошибке загрузку можно завершить повторно
+            discard_partial(upload_id)
         logging.info(f"GroupMessage created for file upload: ID {new_message.id}")
+        # Превью строятся в фоне, ответ их не ждет
+        schedule_variants(db_file_path, mime_type, GroupMessage, new_message.id)
         # --- End Database Saving Logic ---
 
         # Fetch sender name for the response
@@ -757,12 +905,15 @@ def upload_group_file():
         # Convert the *actual* saved message to dict
         message_data = new_message.to_dict()
         message_data['sender_name'] = sender_name
+        publish(group_member_ids(group_id), 'group_message', message_data)
 
         return jsonify({
             'success': True,
             'message': message_data # Return the actual message data
         })
 
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error uploading group file: {str(e)}")
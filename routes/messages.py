@@ -1,96 +1,72 @@
 from flask import Blueprint, request, session, jsonify, current_app
-from models.user import db, User, Message, Block, Contact
+from models.user import db, User, Message
 from sqlalchemy import text
 import logging
 import datetime
 from werkzeug.utils import secure_filename
 import os
 import uuid
-from utils.odoo_sync import send_message_to_odoo
+import heapq
+from utils.odoo_sync import enqueue_message
+from utils.events import publish
+from utils.relations import get_relations, is_blocked_between
+from utils.pagination import DEFAULT_PAGE_SIZE, parse_page_args
+from utils.search import search_messages as run_message_search, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, MAX_SEARCH_OFFSET
+from utils.conversations import (record_message, refresh_conversation, update_preview,
+                                 mark_messages_read, delete_conversation)
+from utils.serialization import (MESSAGE_COLUMNS, STREAM_BATCH_SIZE, serialize_message_row,
+                                 json_response, stream_json)
+from utils.uploads import UploadError, get_upload, finish_upload, discard_partial
+from utils.blobs import store_stream
+from utils.thumbnails import schedule_variants
 
 # Create blueprint for messages routes with explicit URL prefix of nothing
 messages_bp = Blueprint('messages', __name__, url_prefix='')
 
+# Список чатов читается из таблицы conversation (диапазон по индексу user_id,
+# last_timestamp); контакт и блокировки берутся из кеша связей, так что
+# число запросов не зависит от количества собеседников
+CHAT_LIST_QUERY = text("""
+    SELECT
+        u.id AS user_id,
+        u.name AS name,
+        u.avatar_path AS avatar_path,
+        conv.last_preview AS last_message,
+        conv.last_timestamp AS last_timestamp,
+        conv.unread_count AS unread_count
+    FROM conversation conv
+    JOIN user u ON u.id = conv.peer_id
+    WHERE conv.user_id = :user_id
+    ORDER BY conv.last_timestamp DESC
+""").columns(last_timestamp=db.DateTime)
+
 @messages_bp.route('/get_chat_list')
 def get_chat_list():
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     try:
         logging.debug(f"Getting chat list for user {session['user_id']}")
-        # Получаем уникальных пользователей, с которыми есть переписка
-        # Подзапрос для получения id пользователей, с которыми общались
-        subquery1 = db.session.query(Message.recipient_id.label('user_id')).filter(
-            Message.sender_id == session['user_id']
-        ).distinct()
-        
-        subquery2 = db.session.query(Message.sender_id.label('user_id')).filter(
-            Message.recipient_id == session['user_id']
-        ).distinct()
-        
-        # Объединяем подзапросы
-        chat_user_ids = subquery1.union(subquery2).all()
-        chat_user_ids = [item.user_id for item in chat_user_ids]
-        
-        logging.debug(f"Found {len(chat_user_ids)} chat users for user {session['user_id']}")
+        relations = get_relations(session['user_id'])
+        result = db.session.execute(CHAT_LIST_QUERY, {'user_id': session['user_id']})
         
-        # Получаем пользователей из списка ID
-        chat_users = User.query.filter(User.id.in_(chat_user_ids)).all()
-        
-        # Формируем информацию о чатах
-        chats = []
-        for user in chat_users:
-            # Получаем последнее сообщение
-            last_message = Message.query.filter(
-                ((Message.sender_id == session['user_id']) & (Message.recipient_id == user.id)) |
-                ((Message.sender_id == user.id) & (Message.recipient_id == session['user_id']))
-            ).order_by(Message.timestamp.desc()).first()
-            
-            # Считаем непрочитанные сообщения
-            unread_count = Message.query.filter(
-                (Message.sender_id == user.id) &
-                (Message.recipient_id == session['user_id']) &
-                (Message.is_read == False)
-            ).count()
-            
-            # Проверяем, является ли пользователь контактом
-            is_contact = Contact.query.filter_by(
-                user_id=session['user_id'],
-                contact_id=user.id
-            ).first() is not None
-            
-            # Check if any blocks exist between users
-            is_blocked_by_you = Block.query.filter_by(
-                user_id=session['user_id'],
-                blocked_user_id=user.id
-            ).first() is not None
-            
-            has_blocked_you = Block.query.filter_by(
-                user_id=user.id,
-                blocked_user_id=session['user_id']
-            ).first() is not None
-            
-            # Добавляем информацию о чате
-            chat_info = {
-                'user_id': user.id,
-                'name': user.name,
-                'avatar_path': user.avatar_path if hasattr(user, 'avatar_path') else None,
-                'last_message': last_message.content if last_message else "",
-                'last_timestamp': last_message.timestamp.isoformat() if last_message else None,
-                'unread_count': unread_count,
-                'is_contact': is_contact,
-                'is_blocked_by_you': is_blocked_by_you,
-                'has_blocked_you': has_blocked_you
+        # Формируем информацию о чатах (уже отсортированы: новые сверху)
+        def serialize_chat(row):
+            return {
+                'user_id': row.user_id,
+                'name': row.name,
+                'avatar_path': row.avatar_path,
+                'last_message': row.last_message if row.last_message is not None else "",
+                'last_timestamp': row.last_timestamp.isoformat() if row.last_timestamp else None,
+                'unread_count': row.unread_count or 0,
+                'is_contact': row.user_id in relations.contacts,
+                'is_blocked_by_you': row.user_id in relations.blocked,
+                'has_blocked_you': row.user_id in relations.blocked_by
             }
-            chats.append(chat_info)
         
-        # Сортируем чаты по времени последнего сообщения (новые сверху)
-        chats.sort(key=lambda x: x['last_timestamp'] if x['last_timestamp'] else "", reverse=True)
-        
-        logging.debug(f"Returning {len(chats)} chats for user {session['user_id']}")
-        return jsonify({
-            'success': True,
-            'chats': chats
-        })
+        # Список чатов ограничен числом собеседников: собирается целиком, чтобы ошибка
+        # дала 500, а не обрезанный JSON (stream_json — только для выгрузок)
+        chats = [serialize_chat(row) for row in result]
+        return json_response({'success': True, 'chats': chats})
     except Exception as e:
         logging.error(f"Ошибка при получении списка чатов: {str(e)}")
         return jsonify({'success': False, 'error': f'Failed to retrieve chat list: {str(e)}'}), 500
@@ -112,17 +88,10 @@ def send_message():
             return jsonify({'success': False, 'error': 'Recipient not found'}), 404
         
         # Check if either user has blocked the other
-        blocked_by_sender = Block.query.filter_by(
-            user_id=session['user_id'],
-            blocked_user_id=recipient_id
-        ).first()
+        blocked_by_sender, blocked_by_recipient = is_blocked_between(session['user_id'], recipient_id)
         if blocked_by_sender:
             return jsonify({'success': False, 'error': 'You cannot send messages to this user because you have blocked them'}), 403
         
-        blocked_by_recipient = Block.query.filter_by(
-            user_id=recipient_id,
-            blocked_user_id=session['user_id']
-        ).first()
         if blocked_by_recipient:
             return jsonify({'success': False, 'error': 'You cannot send messages to this user because they have blocked you'}), 403
         
@@ -134,90 +103,184 @@ def send_message():
             is_read=False
         )
         db.session.add(new_message)
+        db.session.flush()
+        record_message(new_message)
+        enqueue_message(new_message)
         db.session.commit()
-        # Добавляю имена отправителя и получателя
-        sender = User.query.get(new_message.sender_id)
-        recipient = User.query.get(new_message.recipient_id)
-        new_message.sender_name = sender.name if sender else ''
-        new_message.recipient_name = recipient.name if recipient else ''
-        try:
-            send_message_to_odoo(new_message)
-        except Exception as e:
-            logging.error(f"Odoo sync error: {e}")
+        
+        message_data = new_message.to_dict()
+        publish([new_message.sender_id, new_message.recipient_id], 'message', message_data)
         
         # Return formatted message data
         return jsonify({
             'success': True,
-            'message': new_message.to_dict()
+            'message': message_data
         })
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error sending message: {str(e)}")
         return jsonify({'success': False, 'error': 'Server error'}), 500
 
+def get_message_page(user_id, other_user_id, before_id=None, after_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Returns (rows, has_more) for a conversation using keyset pagination on id.
+    Each direction of the pair is read with its own range scan on
+    (sender_id, recipient_id, id) and the two pages are merged.
+    Rows are plain column tuples (MESSAGE_COLUMNS), not ORM objects.
+    Messages are returned in ascending order. With after_id, has_more means
+    there are newer messages beyond the page; otherwise it means older ones.
+    """
+    directions = {(int(user_id), int(other_user_id)), (int(other_user_id), int(user_id))}
+    rows = []
+    for sender_id, recipient_id in directions:
+        query = db.session.query(*MESSAGE_COLUMNS).filter(
+            Message.sender_id == sender_id,
+            Message.recipient_id == recipient_id
+        )
+        if after_id is not None:
+            query = query.filter(Message.id > after_id).order_by(Message.id.asc())
+        else:
+            if before_id is not None:
+                query = query.filter(Message.id < before_id)
+            query = query.order_by(Message.id.desc())
+        rows.extend(query.limit(limit + 1).all())
+
+    rows.sort(key=lambda row: row.id, reverse=after_id is None)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is None:
+        rows.reverse()
+    return rows, has_more
+
 @messages_bp.route('/get_messages')
 def get_messages():
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Not authenticated'}), 401
     try:
-        user_id = request.args.get('user_id')
+        user_id = request.args.get('user_id', type=int)
         if not user_id:
             return jsonify({'success': False, 'error': 'Missing user_id'}), 400
-        # Get messages between users
-        messages_query = Message.query.filter(
-            ((Message.sender_id == session['user_id']) & (Message.recipient_id == user_id)) |
-            ((Message.sender_id == user_id) & (Message.recipient_id == session['user_id']))
-        ).order_by(Message.timestamp.asc())
-        messages = [message.to_dict() for message in messages_query.all()]
-        # Mark messages as read
-        unread_messages = Message.query.filter_by(
-            sender_id=user_id,
-            recipient_id=session['user_id'],
-            is_read=False
-        ).all()
+        before_id, after_id, limit = parse_page_args(request.args)
         
-        for message in unread_messages:
-            message.is_read = True
-        db.session.commit()
+        # Get a page of messages between users
+        page, has_more = get_message_page(session['user_id'], user_id, before_id, after_id, limit)
+        messages = [serialize_message_row(row) for row in page]
         
-        return jsonify({
+        # Mark messages as read when the newest part of the chat is loaded
+        if before_id is None:
+            marked = mark_messages_read(session['user_id'], user_id)
+            db.session.commit()
+            if marked:
+                publish_read(session['user_id'], user_id, None)
+        
+        return json_response({
             'success': True,
-            'messages': messages
+            'messages': messages,
+            'has_more': has_more
         })
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error getting messages: {str(e)}")
         return jsonify({'success': False, 'error': 'Server error'}), 500
 
+@messages_bp.route('/export_messages')
+def export_messages():
+    """
+    Whole history of a conversation, oldest first, streamed. Both directions
+    are read by range scans on (sender_id, recipient_id, id) and merged by id
+    as they stream, so nothing is sorted or held in memory.
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    try:
+        user_id = request.args.get('user_id', type=int)
+        if not user_id:
+            return jsonify({'success': False, 'error': 'Missing user_id'}), 400
+
+        directions = {(session['user_id'], user_id), (user_id, session['user_id'])}
+        streams = [
+            db.session.query(*MESSAGE_COLUMNS).filter(
+                Message.sender_id == sender_id,
+                Message.recipient_id == recipient_id
+            ).order_by(Message.id.asc()).yield_per(STREAM_BATCH_SIZE)
+            for sender_id, recipient_id in directions
+        ]
+        rows = heapq.merge(*(iter(stream) for stream in streams), key=lambda row: row.id)
+        return stream_json({'success': True}, 'messages', rows, serialize_message_row)
+    except Exception as e:
+        logging.error(f"Error exporting messages: {str(e)}")
+        return jsonify({'success': False, 'error': 'Server error'}), 500
+
+def publish_read(reader_id, peer_id, up_to_id):
+    """Сообщает обоим участникам, до какого сообщения прочитан диалог (None — весь)"""
+    publish([peer_id, reader_id], 'read', {
+        'reader_id': int(reader_id),
+        'peer_id': int(peer_id),
+        'up_to_id': up_to_id
+    })
+
+@messages_bp.route('/mark_read', methods=['POST'])
+def mark_read():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    try:
+        data = request.get_json() or {}
+        peer_id = data.get('user_id')
+        up_to_id = data.get('message_id')
+        if not peer_id:
+            return jsonify({'success': False, 'error': 'Missing user_id'}), 400
+        peer_id = int(peer_id)
+        up_to_id = int(up_to_id) if up_to_id is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid user_id or message_id'}), 400
+    try:
+        marked = mark_messages_read(session['user_id'], peer_id, up_to_id)
+        db.session.commit()
+        if marked:
+            publish_read(session['user_id'], peer_id, up_to_id)
+        return jsonify({'success': True, 'marked': marked})
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error marking messages read: {str(e)}")
+        return jsonify({'success': False, 'error': 'Server error'}), 500
+
+@messages_bp.route('/search_messages')
+def search_messages():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'Not authenticated'}), 401
+    query = request.args.get('q', '').strip()
+    if len(query) < 2:
+        return jsonify({'success': True, 'results': [], 'has_more': False})
+    try:
+        limit = max(1, min(request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT))
+        offset = max(0, min(request.args.get('offset', 0, type=int), MAX_SEARCH_OFFSET))
+        results, has_more = run_message_search(session['user_id'], query, limit, offset)
+        return jsonify({
+            'success': True,
+            'results': results,
+            'has_more': has_more,
+            'next_offset': offset + len(results) if has_more else None
+        })
+    except Exception as e:
+        logging.error(f"Error searching messages: {str(e)}")
+        return jsonify({'success': False, 'error': 'Server error'}), 500
+
 @messages_bp.route('/get_recent_conversations')
 def get_recent_conversations():
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Not authenticated'}), 401
     try:
         user_id = session['user_id']
-        # Get users this user has exchanged messages with
-        # This query finds all users where there are messages between them and the current user
-        query = """
-            SELECT u.id, u.name, u.avatar_path, u.bio, m.content as last_message, m.timestamp, 
-                   (SELECT count(*) FROM message 
-                    WHERE sender_id = u.id AND recipient_id = :user_id AND is_read = 0) as unread_count
-            FROM user u
-            JOIN (
-                SELECT 
-                    CASE 
-                        WHEN sender_id = :user_id THEN recipient_id 
-                        ELSE sender_id 
-                    END as user_id, 
-                    MAX(timestamp) as max_time
-                FROM message
-                WHERE sender_id = :user_id OR recipient_id = :user_id
-                GROUP BY user_id
-            ) latest ON latest.user_id = u.id
-            JOIN message m ON ((m.sender_id = u.id AND m.recipient_id = :user_id) OR 
-                              (m.sender_id = :user_id AND m.recipient_id = u.id)) 
-                         AND m.timestamp = latest.max_time
-            ORDER BY m.timestamp DESC
-        """
-        result = db.session.execute(text(query), {'user_id': user_id})
+        # Get users this user has exchanged messages with, from the conversation summaries
+        query = text("""
+            SELECT u.id, u.name, u.avatar_path, u.bio, conv.last_preview as last_message,
+                   conv.last_timestamp as timestamp, conv.unread_count
+            FROM conversation conv
+            JOIN user u ON u.id = conv.peer_id
+            WHERE conv.user_id = :user_id
+            ORDER BY conv.last_timestamp DESC
+        """).columns(timestamp=db.DateTime)
+        result = db.session.execute(query, {'user_id': user_id})
         conversations = []
         for row in result:
             # Format the data for the frontend
@@ -263,13 +326,17 @@ def edit_message():
         message.content = content
         message.is_edited = True
         message.edited_at = datetime.datetime.now()
+        update_preview(message)
         
         db.session.commit()
         
+        message_data = message.to_dict()
+        publish([message.sender_id, message.recipient_id], 'message_edited', message_data)
+        
         # Return updated message
         return jsonify({
             'success': True,
-            'message': message.to_dict()
+            'message': message_data
         })
     except Exception as e:
         db.session.rollback()
@@ -291,7 +358,14 @@ def delete_message():
         if message.sender_id != session['user_id']:
             return jsonify({'success': False, 'error': 'You can only delete your own messages'}), 403
         db.session.delete(message)
+        db.session.flush()
+        refresh_conversation(message.sender_id, message.recipient_id)
         db.session.commit()
+        publish([message.sender_id, message.recipient_id], 'message_deleted', {
+            'id': message.id,
+            'sender_id': message.sender_id,
+            'recipient_id': message.recipient_id
+        })
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -311,7 +385,11 @@ def delete_chat():
             ((Message.sender_id == session['user_id']) & (Message.recipient_id == other_user_id)) |
             ((Message.sender_id == other_user_id) & (Message.recipient_id == session['user_id']))
         ).delete(synchronize_session=False)
+        delete_conversation(session['user_id'], other_user_id)
         db.session.commit()
+        publish([session['user_id'], other_user_id], 'chat_deleted', {
+            'user_ids': [int(session['user_id']), int(other_user_id)]
+        })
         return jsonify({'success': True, 'deleted': num_deleted})
     except Exception as e:
         db.session.rollback()
@@ -322,12 +400,16 @@ def upload_direct_file():
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'Not logged in'}), 401
     try:
-        recipient_id = request.form.get('recipient_id')
+        # Файл приходит либо целиком в multipart, либо как upload_id завершенной загрузки по частям
+        data = request.form if request.form else (request.get_json(silent=True) or {})
+        recipient_id = data.get('recipient_id')
         file = request.files.get('file')
-        caption = request.form.get('caption', '').strip()  # Optional caption
+        upload_id = data.get('upload_id')
+        caption = (data.get('caption') or '').strip()  # Optional caption
 
-        if not recipient_id or not file:
+        if not recipient_id or not (file or upload_id):
             return jsonify({'success': False, 'error': 'Recipient ID and file are required'}), 400
+        upload = get_upload(upload_id, session['user_id']) if upload_id else None
 
         # Verify the recipient exists
         recipient = User.query.get(recipient_id)
@@ -335,22 +417,16 @@ def upload_direct_file():
             return jsonify({'success': False, 'error': 'Recipient not found'}), 404
 
         # Check if either user has blocked the other
-        blocked_by_sender = Block.query.filter_by(
-            user_id=session['user_id'],
-            blocked_user_id=recipient_id
-        ).first()
+        blocked_by_sender, blocked_by_recipient = is_blocked_between(session['user_id'], recipient_id)
         if blocked_by_sender:
             return jsonify({'success': False, 'error': 'You cannot send files to this user because you have blocked them'}), 403
 
-        blocked_by_recipient = Block.query.filter_by(
-            user_id=recipient_id,
-            blocked_user_id=session['user_id']
-        ).first()
         if blocked_by_recipient:
             return jsonify({'success': False, 'error': 'You cannot send files to this user because they have blocked you'}), 403
 
         # --- File Saving Logic ---
-        original_filename = secure_filename(file.filename)
+        original_filename = upload.original_filename if upload else secure_filename(file.filename)
+        mime_type = upload.mime_type if upload else file.mimetype
         file_ext = os.path.splitext(original_filename)[1]
         unique_filename = f"{uuid.uuid4()}{file_ext}"
 
@@ -361,7 +437,10 @@ def upload_direct_file():
         os.makedirs(full_save_dir, exist_ok=True)
 
         file_path_full = os.path.join(full_save_dir, unique_filename)
-        file.save(file_path_full)
+        if upload:
+            finish_upload(upload, file_path_full)
+        else:
+            store_stream(file.stream, file_path_full)
 
         # Store the relative path in the database
         db_file_path = os.path.join(relative_save_dir, unique_filename).replace('\\', '/')
@@ -374,25 +453,29 @@ def upload_direct_file():
             is_read=False,
             message_type='file',
             file_path=db_file_path,
-            mime_type=file.mimetype,
+            mime_type=mime_type,
             original_filename=original_filename
         )
         db.session.add(new_message)
+        db.session.flush()
+        record_message(new_message)
+        enqueue_message(new_message)
         db.session.commit()
-        # Добавляю имена отправителя и получателя
-        sender = User.query.get(new_message.sender_id)
-        recipient = User.query.get(new_message.recipient_id)
-        new_message.sender_name = sender.name if sender else ''
-        new_message.recipient_name = recipient.name if recipient else ''
-        try:
-            send_message_to_odoo(new_message)
-        except Exception as e:
-            logging.error(f"Odoo sync error: {e}")
+        if upload:
+            # Временный файл нужен до коммита: при ошибке загрузку можно завершить повторно
+            discard_partial(upload_id)
+        # Превью строятся в фоне, ответ их не ждет
+        schedule_variants(db_file_path, mime_type, Message, new_message.id)
+
+        message_data = new_message.to_dict()
+        publish([new_message.sender_id, new_message.recipient_id], 'message', message_data)
 
         return jsonify({
             'success': True,
-            'message': new_message.to_dict()
+            'message': message_data
         })
+    except UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         import traceback
@@ -425,10 +508,13 @@ def translate_message():
         
         db.session.commit()
         
+        message_data = message.to_dict()
+        publish([message.sender_id, message.recipient_id], 'message_edited', message_data)
+        
         # Return updated message
         return jsonify({
             'success': True,
-            'message': message.to_dict()
+            'message': message_data
         })
     except Exception as e:
         db.session.rollback()
@@ -1,8 +1,13 @@
 from flask import Blueprint, request, session, jsonify, current_app
-from models.user import db, User
+from models.user import db, User, Group, GroupMember
 import os
+import uuid
 from werkzeug.utils import secure_filename
 import logging
+from utils.search import search_users as run_user_search
+from utils.http_cache import version_etag, not_modified, tag_response
+from utils.blobs import store_stream
+from utils.thumbnails import schedule_variants
 
 # Create blueprint for user routes
 user_bp = Blueprint('user', __name__)
@@ -15,6 +20,14 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def profile_changed(user, directory_changed=True):
+    """Bumps the profile version of a user (ETag of /get_user_info and /get_contacts)"""
+    user.profile_version = User.profile_version + 1
+    # Имя и аватар входят в справочники участников групп — помечаем их измененными
+    if directory_changed:
+        group_ids = [row.group_id for row in GroupMember.query.with_entities(GroupMember.group_id).filter_by(user_id=user.id)]
+        Group.bump_members_version(group_ids)
+
 @user_bp.route('/get_current_user_info')
 def get_current_user_info():
     if 'user_id' not in session:
@@ -24,6 +37,10 @@ def get_current_user_info():
         user = User.query.get(session['user_id'])
         if not user:
             return jsonify({'error': 'User not found'}), 404
+        etag = version_etag('current_user', user.id, user.profile_version)
+        cached = not_modified(etag)
+        if cached:
+            return cached
         # Проверяем наличие атрибута avatar_path безопасным способом
         avatar_path = None
         try:
@@ -32,13 +49,13 @@ def get_current_user_info():
         except Exception as avatar_error:
             logging.warning(f"Ошибка при получении avatar_path: {str(avatar_error)}")
         # Возвращаем актуальную информацию о пользователе
-        return jsonify({
+        return tag_response(jsonify({
             'user_id': user.id,
             'user_name': user.name,
             'email': user.email,
             'avatar_path': avatar_path,
             'bio': user.bio if hasattr(user, 'bio') else None
-        })
+        }), etag)
     except Exception as e:
         logging.error(f"Ошибка в get_current_user_info: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
@@ -51,20 +68,16 @@ def search_users():
     if not query or len(query) < 2:
         return jsonify({'users': []})
     try:
-        # Поиск пользователей по имени (частичное совпадение)
-        # Исключаем текущего пользователя из результатов
-        users = User.query.filter(
-            User.name.ilike(f'%{query}%'),
-            User.id != session['user_id']
-        ).limit(10).all()
+        # Точное совпадение, затем префикс, затем подстрока; без заблокированных
+        users = run_user_search(session['user_id'], query)
         
         results = []
         for user in users:
             results.append({
-                'id': user.id,
-                'name': user.name,
-                'avatar_path': user.avatar_path if hasattr(user, 'avatar_path') else None,
-                'bio': user.bio if hasattr(user, 'bio') else None
+                'id': user['id'],
+                'name': user['name'],
+                'avatar_path': user['avatar_path'],
+                'bio': user['bio']
             })
         return jsonify({'users': results})
     except Exception as e:
@@ -82,12 +95,16 @@ def get_user_info():
         user = User.query.get(user_id)
         if not user:
             return jsonify({'error': 'User not found'}), 404
-        return jsonify({
+        etag = version_etag('user_info', user.id, user.profile_version)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        return tag_response(jsonify({
             'id': user.id,
             'name': user.name,
             'avatar_path': user.avatar_path if hasattr(user, 'avatar_path') else None,
             'bio': user.bio if hasattr(user, 'bio') else None
-        })
+        }), etag)
     except Exception as e:
         logging.error(f"Ошибка при получении информации о пользователе: {str(e)}")
         return jsonify({'error': 'Server error'}), 500
@@ -111,8 +128,8 @@ def upload_avatar():
         if file and allowed_file(file.filename):
             # Безопасно сохраняем имя файла
             filename = secure_filename(file.filename)
-            # Добавляем user_id к имени файла для уникальности
-            filename = f"user_{session['user_id']}_{filename}"
+            # user_id и случайный суффикс: у каждой загрузки свое имя, поэтому аватар кешируется по URL
+            filename = f"user_{session['user_id']}_{uuid.uuid4().hex[:12]}_{filename}"
             
             # Создаем папку для аватаров, если её нет
             avatars_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'avatars')
@@ -127,7 +144,7 @@ def upload_avatar():
             filepath = os.path.join(avatars_dir, filename)
             # Сохраняем файл
             try:
-                file.save(filepath)
+                store_stream(file.stream, filepath)
                 logging.info(f"Файл сохранен: {filepath}")
             except Exception as save_error:
                 logging.error(f"Ошибка при сохранении файла: {str(save_error)}")
@@ -145,7 +162,9 @@ def upload_avatar():
                     # Относительный путь для URL (без 'static/' префикса)
                     relative_path = os.path.join('avatars', filename).replace('\\', '/')
                     user.avatar_path = relative_path
+                    profile_changed(user)
                     db.session.commit()
+                    schedule_variants(relative_path, file.mimetype)
                     logging.info(f"Обновлен avatar_path для пользователя {user.id}: {relative_path}")
                     return jsonify({
                         'success': True,
@@ -181,8 +200,12 @@ def update_profile():
             return jsonify({'success': False, 'error': 'Пользователь не найден'}), 404
         
         # Обновляем данные
+        name_changed = user.name != name
+        bio_changed = user.bio != bio
         user.name = name
         user.bio = bio
+        if name_changed or bio_changed:
+            profile_changed(user, directory_changed=name_changed)
         
         # Сохраняем в БД
         try:
@@ -138,10 +138,22 @@ function searchUsers(query) {
 }
 
 /**
- * Load message history
+ * Per-chat message cache: reopening a chat only fetches messages newer than
+ * the last cached one instead of the whole history
  */
-function fetchMessages(userId) {
-  return fetch(`/get_messages?user_id=${userId}`, {
+const messageCache = {};
+
+/**
+ * Load one page of message history.
+ * options: beforeId (older page), afterId (newer messages only), limit
+ */
+function fetchMessages(userId, options = {}) {
+  const params = new URLSearchParams({ user_id: userId });
+  if (options.beforeId) params.set('before_id', options.beforeId);
+  if (options.afterId) params.set('after_id', options.afterId);
+  if (options.limit) params.set('limit', options.limit);
+  
+  return fetch(`/get_messages?${params.toString()}`, {
     method: 'GET',
     headers: { 'Content-Type': 'application/json' }
   })
@@ -151,6 +163,120 @@ function fetchMessages(userId) {
   });
 }
 
+/**
+ * Load message history for a chat, using the cache when possible.
+ * Resolves with { success, messages, has_more } like /get_messages.
+ */
+function syncMessages(userId) {
+  const cached = messageCache[userId];
+  
+  if (!cached || cached.messages.length === 0) {
+    return fetchMessages(userId).then(data => {
+      if (data.success) {
+        messageCache[userId] = { messages: data.messages, hasMore: data.has_more };
+      }
+      return data;
+    });
+  }
+  
+  const lastId = cached.messages[cached.messages.length - 1].id;
+  return fetchMessages(userId, { afterId: lastId }).then(data => {
+    if (!data.success) return data;
+    if (data.has_more) {
+      // Too many new messages for one page: start over from the latest page
+      delete messageCache[userId];
+      return syncMessages(userId);
+    }
+    cached.messages.push(...data.messages);
+    return { success: true, messages: cached.messages, has_more: cached.hasMore };
+  });
+}
+
+/**
+ * Load the page of messages preceding the oldest cached one
+ */
+function fetchOlderMessages(userId) {
+  const cached = messageCache[userId];
+  if (!cached || !cached.hasMore || cached.messages.length === 0) {
+    return Promise.resolve({ success: true, messages: [], has_more: false });
+  }
+  
+  return fetchMessages(userId, { beforeId: cached.messages[0].id }).then(data => {
+    if (data.success) {
+      cached.messages.unshift(...data.messages);
+      cached.hasMore = data.has_more;
+    }
+    return data;
+  });
+}
+
+/**
+ * Replace a cached message after it was edited
+ */
+function updateCachedMessage(message) {
+  Object.values(messageCache).forEach(cached => {
+    const index = cached.messages.findIndex(m => m.id === message.id);
+    if (index !== -1) cached.messages[index] = message;
+  });
+}
+
+/**
+ * Record the previews built for a cached message; returns the message, if cached
+ */
+function setCachedVariants(cache, data) {
+  let updated = null;
+  Object.values(cache).forEach(cached => {
+    const message = cached.messages.find(m => String(m.id) === String(data.id));
+    if (message) {
+      message.variants = data.variants;
+      updated = message;
+    }
+  });
+  return updated;
+}
+
+/**
+ * Drop a deleted message from the cache
+ */
+function removeCachedMessage(messageId) {
+  Object.values(messageCache).forEach(cached => {
+    cached.messages = cached.messages.filter(m => String(m.id) !== String(messageId));
+  });
+}
+
+/**
+ * Apply a read receipt: messages sent by senderId to readerId up to upToId
+ * (or all of them when upToId is null) are now read
+ */
+function markCachedMessagesRead(readerId, senderId, upToId) {
+  const cached = messageCache[String(readerId) === String(ChatApp.currentUser.user_id) ? senderId : readerId];
+  if (!cached) return;
+  cached.messages.forEach(m => {
+    if (String(m.sender_id) === String(senderId) && (upToId === null || upToId === undefined || m.id <= upToId)) {
+      m.is_read = true;
+    }
+  });
+}
+
+/**
+ * Mark messages from a user as read, up to messageId or all of them
+ */
+function markRead(userId, messageId) {
+  const body = { user_id: userId };
+  if (messageId) body.message_id = messageId;
+  
+  return fetch('/mark_read', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  })
+    .then(response => response.json())
+    .catch(error => {
+      console.error('Error marking messages as read:', error);
+      return { success: false, error: 'Failed to mark messages as read' };
+    });
+}
+
 /**
  * Send a message
  */
@@ -188,6 +314,10 @@ function editMessage(messageId, content) {
   .then(response => {
     if (!response.ok) throw new Error('Failed to edit message');
     return response.json();
+  })
+  .then(data => {
+    if (data.success && data.message) updateCachedMessage(data.message);
+    return data;
   });
 }
 
@@ -359,10 +489,17 @@ function getGroupInfo(groupId) {
 }
 
 /**
- * Fetch messages for a group
+ * Fetch a page of messages for a group.
+ * options: beforeId, afterId, limit, membersVersion
  */
-function fetchGroupMessages(groupId) {
-  return fetch(`/get_group_messages?group_id=${groupId}`)
+function fetchGroupMessages(groupId, options = {}) {
+  const params = new URLSearchParams({ group_id: groupId });
+  if (options.beforeId) params.set('before_id', options.beforeId);
+  if (options.afterId) params.set('after_id', options.afterId);
+  if (options.limit) params.set('limit', options.limit);
+  if (options.membersVersion !== undefined) params.set('members_version', options.membersVersion);
+  
+  return fetch(`/get_group_messages?${params.toString()}`)
     .then(response => {
       if (!response.ok) {
         throw new Error(`HTTP error! Status: ${response.status}`);
@@ -375,6 +512,26 @@ function fetchGroupMessages(groupId) {
     });
 }
 
+/**
+ * Move the user's read cursor in a group forward.
+ * Without messageId the whole group is marked as read.
+ */
+function markGroupRead(groupId, messageId) {
+  const body = { group_id: groupId };
+  if (messageId) body.message_id = messageId;
+  
+  return fetch('/mark_group_read', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  })
+    .then(response => response.json())
+    .catch(error => {
+      console.error('Error marking group as read:', error);
+      return { success: false, error: 'Failed to mark group as read' };
+    });
+}
+
 /**
  * Send a message to a group
  */
@@ -450,5 +607,144 @@ function deleteChat(userId) {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ user_id: userId })
-  }).then(r => r.json());
+  }).then(r => r.json())
+  .then(data => {
+    if (data.success) delete messageCache[userId];
+    return data;
+  });
+}
+
+/**
+ * Subscribe to live updates pushed by the server.
+ * handlers: { eventType: function(data) }. EventSource reconnects on its own
+ * and sends Last-Event-ID, so missed events are replayed by the server.
+ */
+function subscribeToEvents(handlers) {
+  if (!window.EventSource) return null;
+  
+  const source = new EventSource('/events');
+  Object.keys(handlers).forEach(eventType => {
+    source.addEventListener(eventType, event => {
+      try {
+        handlers[eventType](event.data ? JSON.parse(event.data) : {});
+      } catch (error) {
+        console.error(`Error handling ${eventType} event:`, error);
+      }
+    });
+  });
+  source.onerror = () => console.warn('Live updates connection lost, reconnecting...');
+  return source;
+}
+
+/**
+ * Full-text search over the user's direct and group messages.
+ * Snippets mark matches with \u0002 ... \u0003; use highlightSnippet to render them.
+ */
+function searchMessages(query, options = {}) {
+  const params = new URLSearchParams({ q: query });
+  if (options.limit) params.set('limit', options.limit);
+  if (options.offset) params.set('offset', options.offset);
+  
+  return fetch(`/search_messages?${params.toString()}`)
+    .then(response => {
+      if (!response.ok) throw new Error('Search failed');
+      return response.json();
+    });
+}
+
+/**
+ * Escape a search snippet and turn its match markers into <mark> tags
+ */
+function highlightSnippet(snippet) {
+  const div = document.createElement('div');
+  div.textContent = snippet || '';
+  return div.innerHTML.replace(/\u0002/g, '<mark>').replace(/\u0003/g, '</mark>');
+}
+
+// Сколько раз повторять часть после обрыва соединения и пауза перед повтором
+const UPLOAD_CHUNK_RETRIES = 5;
+const UPLOAD_RETRY_DELAY_MS = 1000;
+
+function sha256Hex(buffer) {
+  return crypto.subtle.digest('SHA-256', buffer).then(hash =>
+    Array.from(new Uint8Array(hash)).map(b => b.toString(16).padStart(2, '0')).join(''));
+}
+
+function uploadRequest(url, options) {
+  return fetch(url, options).then(response => response.json().then(data => {
+    if (!response.ok || !data.success) {
+      const error = new Error(data.error || `HTTP error! status: ${response.status}`);
+      error.status = response.status;
+      throw error;
+    }
+    return data;
+  }));
+}
+
+/**
+ * Upload a file in checksummed chunks and resolve with its upload_id.
+ * The id is kept in localStorage, so a retry after a dropped connection or a
+ * page reload continues from the first chunk the server does not have yet.
+ */
+function uploadFileInChunks(file, onProgress) {
+  const storageKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  const savedId = localStorage.getItem(storageKey);
+  const start = savedId
+    ? uploadRequest(`/upload_status/${savedId}`).catch(() => null)
+    : Promise.resolve(null);
+
+  return start
+    .then(status => status || uploadRequest('/upload_init', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ filename: file.name, size: file.size, mime_type: file.type })
+    }))
+    .then(status => {
+      localStorage.setItem(storageKey, status.upload_id);
+
+      const sendChunk = (index, attempt) => {
+        if (index >= status.total_chunks) return Promise.resolve();
+        const chunk = file.slice(index * status.chunk_size, (index + 1) * status.chunk_size);
+        return chunk.arrayBuffer()
+          .then(buffer => sha256Hex(buffer).then(checksum => uploadRequest(`/upload_chunk/${status.upload_id}/${index}`, {
+            method: 'PUT',
+            headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': checksum },
+            body: buffer
+          })))
+          .then(result => {
+            if (onProgress) onProgress(result.next_chunk / result.total_chunks);
+            return sendChunk(result.next_chunk, 0);
+          })
+          .catch(error => {
+            if (attempt >= UPLOAD_CHUNK_RETRIES || error.status === 404) throw error;
+            // Сервер подскажет, с какой части продолжить
+            return new Promise(resolve => setTimeout(resolve, UPLOAD_RETRY_DELAY_MS * (attempt + 1)))
+              .then(() => uploadRequest(`/upload_status/${status.upload_id}`))
+              .then(current => current.next_chunk, () => index)
+              .then(next => sendChunk(next, attempt + 1));
+          });
+      };
+      return sendChunk(status.next_chunk, 0).then(() => {
+        localStorage.removeItem(storageKey);
+        return status.upload_id;
+      });
+    });
+}
+
+/**
+ * Send a file message: upload it in chunks, then post upload_id with fields
+ * to url (/upload_direct_file or /upload_group_file). Without crypto.subtle
+ * (plain http) the file is posted whole, as before. Resolves with the Response.
+ */
+function sendFileMessage(url, file, fields, onProgress) {
+  const formData = new FormData();
+  Object.keys(fields).forEach(key => formData.append(key, fields[key]));
+  if (!(window.crypto && crypto.subtle)) {
+    formData.append('file', file);
+    return fetch(url, { method: 'POST', body: formData });
+  }
+  return uploadFileInChunks(file, onProgress).then(uploadId => {
+    formData.append('upload_id', uploadId);
+    return fetch(url, { method: 'POST', body: formData });
+  });
 }
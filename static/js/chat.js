@@ -103,7 +103,7 @@ function createChatInterface(user) {
   if (user.avatar_path) {
     let avatarSrc = user.avatar_path;
     if (!avatarSrc.startsWith('http')) {
-      avatarSrc = `/uploads/${avatarSrc}`;
+      avatarSrc = `/uploads/${avatarSrc}?size=160`;
     }
     userAvatar.innerHTML = `<img src="${avatarSrc}" alt="${user.name}">`;
   } else {
@@ -636,16 +636,8 @@ function handleFileSelection(files, user) {
     messagesContainer.appendChild(tempMsgElement);
     chatMessages.scrollTop = chatMessages.scrollHeight;
 
-    // Prepare FormData
-    const formData = new FormData();
-    formData.append('file', file);
-    formData.append('recipient_id', user.id);
-
-    // Upload to backend
-    fetch('/upload_direct_file', {
-      method: 'POST',
-      body: formData
-    })
+    // Upload to backend in chunks, then create the message
+    sendFileMessage('/upload_direct_file', file, { recipient_id: user.id })
     .then(response => {
       if (!response.ok) {
         return response.json().then(err => { throw new Error(err.error || `HTTP error! status: ${response.status}`); });
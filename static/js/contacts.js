@@ -128,7 +128,7 @@ function createGroupElement(group) {
   if (group.avatar_path) {
     let avatarSrc = group.avatar_path;
     if (!avatarSrc.startsWith('http')) {
-      avatarSrc = `/uploads/${avatarSrc}`;
+      avatarSrc = `/uploads/${avatarSrc}?size=160`;
     }
     groupAvatar.innerHTML = `<img src="${avatarSrc}" alt="${group.name}" class="avatar-image">`;
   } else {
@@ -225,7 +225,7 @@ function createContactElement(contact) {
   if (contact.avatar_path) {
     let avatarSrc = contact.avatar_path;
     if (!avatarSrc.startsWith('http')) {
-      avatarSrc = `/uploads/${avatarSrc}`;
+      avatarSrc = `/uploads/${avatarSrc}?size=160`;
     }
     contactAvatar.innerHTML = `<img src="${avatarSrc}" alt="${contact.name}">`;
   } else {
@@ -270,7 +270,7 @@ function createChatElement(chat) {
   if (chat.avatar_path) {
     let avatarSrc = chat.avatar_path;
     if (!avatarSrc.startsWith('http')) {
-      avatarSrc = `/uploads/${avatarSrc}`;
+      avatarSrc = `/uploads/${avatarSrc}?size=160`;
     }
     chatAvatar.innerHTML = `<img src="${avatarSrc}" alt="${chat.name}">`;
   } else {
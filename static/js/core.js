@@ -54,6 +54,25 @@ function escapeHtml(text) {
   return div.innerHTML;
 }
 
+/**
+ * URL of a message attachment; with size, its preview from message.variants
+ * when the server has built one ('160', '480', '960' or 'poster')
+ */
+function attachmentUrl(message, size) {
+  const fileUrl = `/uploads/${message.file_path}`;
+  const variants = (message.variants || '').split(',');
+  return size && variants.includes(String(size)) ? `${fileUrl}?size=${size}` : fileUrl;
+}
+
+/**
+ * Poster frame for a video attachment, '' while there is none
+ */
+function videoPosterUrl(message) {
+  const variants = (message.variants || '').split(',');
+  if (variants.includes('480')) return attachmentUrl(message, 480);
+  return variants.includes('poster') ? attachmentUrl(message, 'poster') : '';
+}
+
 /**
  * Format file size in human-readable format
  */
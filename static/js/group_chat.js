@@ -126,7 +126,7 @@ function createGroupChatInterface(group) {
   if (group.avatar_path) {
     let avatarSrc = group.avatar_path;
     if (!avatarSrc.startsWith('http')) {
-      avatarSrc = `/uploads/${avatarSrc}`;
+      avatarSrc = `/uploads/${avatarSrc}?size=160`;
     }
     groupAvatar.innerHTML = `<img src="${avatarSrc}" alt="${group.name}" class="avatar-image">`;
   } else {
@@ -341,16 +341,8 @@ function createGroupChatInterface(group) {
       chatMessages.appendChild(tempMsgElement);
       chatMessages.scrollTop = chatMessages.scrollHeight;
 
-      // Prepare FormData
-      const formData = new FormData();
-      formData.append('file', file);
-      formData.append('group_id', group.id);
-
-      // Upload to backend
-      fetch('/upload_group_file', {
-        method: 'POST',
-        body: formData
-      })
+      // Upload to backend in chunks, then create the message
+      sendFileMessage('/upload_group_file', file, { group_id: group.id })
       .then(response => {
         if (!response.ok) {
           return response.json().then(err => { throw new Error(err.error || `HTTP error! status: ${response.status}`); });
@@ -385,29 +377,20 @@ function createGroupChatInterface(group) {
  * Upload a file to the group chat
  */
 function uploadGroupFile(file, groupId, chatMessages) {
-  // Basic validation (e.g., size limit - 10MB)
-  const maxSize = 10 * 1024 * 1024; // 10 MB
+  // Basic validation: the server's MAX_UPLOAD_SIZE for chunked uploads
+  const maxSize = 1024 * 1024 * 1024; // 1 GB
   if (file.size > maxSize) {
     showErrorNotification(`File is too large (max ${maxSize / 1024 / 1024} MB)`);
     return;
   }
 
-  // Create FormData
-  const formData = new FormData();
-  formData.append('file', file);
-  formData.append('group_id', groupId);
-
   // Show temporary "Uploading..." message in chat
   const tempMsgId = `temp_upload_${Date.now()}`;
   const tempMsgElement = createTemporaryMessageElement(tempMsgId, `Uploading ${file.name}...`);
   addMessageElementToChat(tempMsgElement, chatMessages);
 
-  // Perform the upload
-  fetch('/upload_group_file', { // Needs backend route
-    method: 'POST',
-    body: formData
-    // Headers are automatically set by browser for FormData
-  })
+  // Perform the upload in chunks, then create the message
+  sendFileMessage('/upload_group_file', file, { group_id: groupId })
   .then(response => {
     if (!response.ok) {
       // Try to get error message from backend response
@@ -1190,8 +1173,8 @@ function loadGroupMessages(groupId) {
   loadingIndicator.style.color = '#888';
   chatMessages.appendChild(loadingIndicator);
   
-  // Fetch messages
-  return fetchGroupMessages(groupId)
+  // Fetch messages (only the new ones if the group is cached)
+  return syncGroupMessages(groupId)
     .then(data => {
       console.log('Group messages loaded:', data);
       
@@ -1201,6 +1184,9 @@ function loadGroupMessages(groupId) {
       // Render messages
       if (data.success && data.messages && data.messages.length > 0) {
         renderGroupMessages(data.messages, data.members, chatMessages);
+        setupOlderGroupMessagesLoading(groupId, chatMessages);
+        // Everything on screen is read now; the group_read event refreshes the sidebar
+        markGroupRead(groupId, data.messages[data.messages.length - 1].id);
       } else {
         // Show "no messages" placeholder
         const noMessages = document.createElement('div');
@@ -1228,6 +1214,56 @@ function loadGroupMessages(groupId) {
     });
 }
 
+/**
+ * Load older pages of group history when the chat is scrolled to the top
+ */
+function setupOlderGroupMessagesLoading(groupId, chatMessages) {
+  let loading = false;
+  
+  chatMessages.onscroll = function() {
+    if (loading || chatMessages.scrollTop > 50) return;
+    
+    const messagesContainer = chatMessages.querySelector('.messages-container');
+    if (!messagesContainer) return;
+    
+    loading = true;
+    fetchOlderGroupMessages(groupId)
+      .then(data => {
+        if (!data.success || data.messages.length === 0) {
+          if (!data.has_more) chatMessages.onscroll = null;
+          return;
+        }
+        
+        const memberMap = {};
+        (groupMessageCache[groupId].members || []).forEach(member => {
+          memberMap[member.id] = member.name;
+        });
+        
+        // Prepend older messages while keeping the visible position
+        const previousHeight = chatMessages.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        let currentDate = '';
+        data.messages.forEach(message => {
+          const messageDate = new Date(message.timestamp);
+          if (messageDate.toLocaleDateString() !== currentDate) {
+            currentDate = messageDate.toLocaleDateString();
+            const dateSeparator = document.createElement('div');
+            dateSeparator.className = 'date-separator';
+            dateSeparator.textContent = formatDate(messageDate);
+            fragment.appendChild(dateSeparator);
+          }
+          fragment.appendChild(createGroupMessageElement(message, memberMap));
+        });
+        messagesContainer.insertBefore(fragment, messagesContainer.firstChild);
+        chatMessages.scrollTop = chatMessages.scrollHeight - previousHeight;
+        
+        if (!data.has_more) chatMessages.onscroll = null;
+      })
+      .catch(error => console.error('Error loading older group messages:', error))
+      .finally(() => { loading = false; });
+  };
+}
+
 /**
  * Render messages in the group chat
  */
@@ -1550,7 +1586,7 @@ function createGroupMessageElement(message, memberMap) {
           const fileBubbleHTML = `
               <div class="message-file-bubble">
                 <a href="${fileUrl}" target="_blank" rel="noopener noreferrer">
-                  <img src="${fileUrl}" alt="${escapeHtml(message.original_filename)}" class="file-thumb" loading="lazy">
+                  <img src="${attachmentUrl(message, 480)}" alt="${escapeHtml(message.original_filename)}" class="file-thumb" loading="lazy">
                 </a>
                 <div class="file-info">
                   <div class="file-name">${escapeHtml(message.original_filename)}</div>
@@ -1576,7 +1612,7 @@ function createGroupMessageElement(message, memberMap) {
       } else if (message.mime_type.startsWith('video/')) {
           // Display video player
            messageContentHTML = `
-              <video controls class="message-video-attachment" preload="metadata">
+              <video controls class="message-video-attachment" preload="metadata" poster="${videoPosterUrl(message)}">
                  <source src="${fileUrl}" type="${message.mime_type}">
                  Your browser does not support the video tag.
               </video>
@@ -1667,7 +1703,7 @@ function createGroupMessageElement(message, memberMap) {
           messageContentHTML = `
               <div class="image-card">
                 <a href="${fileUrl}" target="_blank" rel="noopener noreferrer" class="message-image-link">
-                  <img src="${fileUrl}" alt="${escapeHtml(message.original_filename)}" class="message-image-attachment" loading="lazy">
+                  <img src="${attachmentUrl(message, 480)}" alt="${escapeHtml(message.original_filename)}" class="message-image-attachment" loading="lazy">
                 </a>
                 <div class="image-time">${timeFormatted}</div>
               </div>
@@ -1780,7 +1816,11 @@ function deleteGroupMessage(messageId) {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ message_id: messageId })
-  }).then(r => r.json());
+  }).then(r => r.json())
+  .then(data => {
+    if (data.success) removeCachedGroupMessage(messageId);
+    return data;
+  });
 }
 
 /**
@@ -1877,10 +1917,23 @@ function getGroupInfo(groupId) {
 }
 
 /**
- * Fetch messages for a group chat
+ * Per-group cache of loaded messages and the member directory, so reopening
+ * a group only fetches new messages and the directory only when it changed
+ */
+const groupMessageCache = {};
+
+/**
+ * Fetch one page of messages for a group chat.
+ * options: beforeId, afterId, limit, membersVersion
  */
-function fetchGroupMessages(groupId) {
-  return fetch(`/get_group_messages?group_id=${groupId}`)
+function fetchGroupMessages(groupId, options = {}) {
+  const params = new URLSearchParams({ group_id: groupId });
+  if (options.beforeId) params.set('before_id', options.beforeId);
+  if (options.afterId) params.set('after_id', options.afterId);
+  if (options.limit) params.set('limit', options.limit);
+  if (options.membersVersion !== undefined) params.set('members_version', options.membersVersion);
+  
+  return fetch(`/get_group_messages?${params.toString()}`)
     .then(response => response.json())
     .catch(error => {
       console.error('Error fetching group messages:', error);
@@ -1888,6 +1941,84 @@ function fetchGroupMessages(groupId) {
     });
 }
 
+/**
+ * Load group history using the cache when possible.
+ * Resolves with { success, messages, members, has_more }.
+ */
+function syncGroupMessages(groupId) {
+  const cached = groupMessageCache[groupId];
+  const options = {};
+  if (cached) {
+    options.membersVersion = cached.membersVersion;
+    if (cached.messages.length > 0) {
+      options.afterId = cached.messages[cached.messages.length - 1].id;
+    }
+  }
+  
+  return fetchGroupMessages(groupId, options).then(data => {
+    if (!data.success) return data;
+    
+    if (!cached || !options.afterId) {
+      groupMessageCache[groupId] = {
+        messages: data.messages,
+        hasMore: data.has_more,
+        members: data.members || (cached ? cached.members : []),
+        membersVersion: data.members_version
+      };
+    } else if (data.has_more) {
+      // Too many new messages for one page: start over from the latest page
+      delete groupMessageCache[groupId];
+      return syncGroupMessages(groupId);
+    } else {
+      cached.messages.push(...data.messages);
+      if (data.members) cached.members = data.members;
+      cached.membersVersion = data.members_version;
+    }
+    
+    const current = groupMessageCache[groupId];
+    return { success: true, messages: current.messages, members: current.members, has_more: current.hasMore };
+  });
+}
+
+/**
+ * Load the page of group messages preceding the oldest cached one
+ */
+function fetchOlderGroupMessages(groupId) {
+  const cached = groupMessageCache[groupId];
+  if (!cached || !cached.hasMore || cached.messages.length === 0) {
+    return Promise.resolve({ success: true, messages: [], has_more: false });
+  }
+  
+  return fetchGroupMessages(groupId, {
+    beforeId: cached.messages[0].id,
+    membersVersion: cached.membersVersion
+  }).then(data => {
+    if (data.success) {
+      cached.messages.unshift(...data.messages);
+      cached.hasMore = data.has_more;
+      if (data.members) cached.members = data.members;
+      cached.membersVersion = data.members_version;
+    }
+    return data;
+  });
+}
+
+/**
+ * Apply an edit or deletion to cached group messages
+ */
+function updateCachedGroupMessage(message) {
+  Object.values(groupMessageCache).forEach(cached => {
+    const index = cached.messages.findIndex(m => m.id === message.id);
+    if (index !== -1) cached.messages[index] = message;
+  });
+}
+
+function removeCachedGroupMessage(messageId) {
+  Object.values(groupMessageCache).forEach(cached => {
+    cached.messages = cached.messages.filter(m => String(m.id) !== String(messageId));
+  });
+}
+
 /**
  * Send a message to a group
  */
@@ -2014,7 +2145,11 @@ function editGroupMessage(messageId, content) {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ message_id: messageId, content: content })
-  }).then(r => r.json());
+  }).then(r => r.json())
+  .then(data => {
+    if (data.success && data.message) updateCachedGroupMessage(data.message);
+    return data;
+  });
 }
 
 /**
@@ -23,6 +23,9 @@ function initializeChat() {
       // Load sidebar with contacts and chats
       loadSidebar();
       
+      // Receive new messages without polling
+      setupLiveUpdates();
+      
       // Setup event listeners
       setupEventListeners();
     })
@@ -32,6 +35,115 @@ function initializeChat() {
     });
 }
 
+/**
+ * Apply events from the server push channel to caches and the open chat
+ */
+function setupLiveUpdates() {
+  let sidebarTimer = null;
+  const refreshSidebar = () => {
+    clearTimeout(sidebarTimer);
+    sidebarTimer = setTimeout(loadSidebar, 300);
+  };
+  
+  const findMessageElement = messageId =>
+    document.querySelector(`.chat-messages [data-message-id="${messageId}"]`);
+  
+  const isOpenChat = (type, id) =>
+    ChatApp.activeChat && ChatApp.activeChat.type === type && String(ChatApp.activeChat.id) === String(id);
+  
+  const peerOf = message =>
+    String(message.sender_id) === String(ChatApp.currentUser.user_id) ? message.recipient_id : message.sender_id;
+  
+  subscribeToEvents({
+    message: message => {
+      const peerId = peerOf(message);
+      const cached = messageCache[peerId];
+      if (cached && !cached.messages.some(m => m.id === message.id)) {
+        cached.messages.push(message);
+      }
+      const chatMessages = document.querySelector('.chat-messages');
+      if (isOpenChat('user', peerId) && chatMessages && !findMessageElement(message.id)) {
+        addMessageToChat(message, chatMessages);
+        if (String(message.sender_id) === String(peerId)) markRead(peerId, message.id);
+      }
+      refreshSidebar();
+    },
+    message_edited: message => {
+      updateCachedMessage(message);
+      const existing = findMessageElement(message.id);
+      if (existing && isOpenChat('user', peerOf(message))) {
+        existing.replaceWith(createMessageElement(message));
+      }
+      refreshSidebar();
+    },
+    message_variants: data => {
+      // Previews are ready: redraw the attachment with them
+      const message = setCachedVariants(messageCache, data);
+      const existing = findMessageElement(data.id);
+      if (message && existing && isOpenChat('user', peerOf(data))) {
+        existing.replaceWith(createMessageElement(message));
+      }
+    },
+    message_deleted: data => {
+      removeCachedMessage(data.id);
+      const existing = findMessageElement(data.id);
+      if (existing && isOpenChat('user', peerOf(data))) existing.remove();
+      refreshSidebar();
+    },
+    chat_deleted: data => {
+      data.user_ids.forEach(userId => delete messageCache[userId]);
+      refreshSidebar();
+    },
+    read: data => {
+      // Receipts are pushed to both sides: the reader's other tabs and the sender
+      markCachedMessagesRead(data.reader_id, data.peer_id, data.up_to_id);
+      refreshSidebar();
+    },
+    group_message: message => {
+      const cached = groupMessageCache[message.group_id];
+      if (cached && !cached.messages.some(m => m.id === message.id)) {
+        cached.messages.push(message);
+      }
+      const chatMessages = document.querySelector('.chat-messages');
+      if (isOpenChat('group', message.group_id) && chatMessages && !findMessageElement(message.id)) {
+        addMessageToGroupChat(message, chatMessages);
+        markGroupRead(message.group_id, message.id);
+      }
+      refreshSidebar();
+    },
+    group_read: () => refreshSidebar(),
+    group_message_edited: message => {
+      updateCachedGroupMessage(message);
+      const existing = findMessageElement(message.id);
+      if (existing && isOpenChat('group', message.group_id)) {
+        const memberMap = { [message.sender_id]: message.sender_name };
+        existing.replaceWith(createGroupMessageElement(message, memberMap));
+      }
+    },
+    group_message_variants: data => {
+      const message = setCachedVariants(groupMessageCache, data);
+      const existing = findMessageElement(data.id);
+      if (message && existing && isOpenChat('group', data.group_id)) {
+        // Keep the sender name the element already shows
+        const sender = existing.querySelector('.message-sender');
+        const memberMap = { [message.sender_id]: sender ? sender.textContent : message.sender_name };
+        existing.replaceWith(createGroupMessageElement(message, memberMap));
+      }
+    },
+    group_message_deleted: data => {
+      removeCachedGroupMessage(data.id);
+      const existing = findMessageElement(data.id);
+      if (existing && isOpenChat('group', data.group_id)) existing.remove();
+    },
+    resync: () => {
+      // Events were missed: drop cached history and reload from the server
+      Object.keys(messageCache).forEach(key => delete messageCache[key]);
+      Object.keys(groupMessageCache).forEach(key => delete groupMessageCache[key]);
+      refreshSidebar();
+    }
+  });
+}
+
 /**
  * Setup create group button functionality
  */
@@ -19,8 +19,8 @@ function loadMessages(userId) {
   loadingIndicator.style.color = '#888';
   chatMessages.appendChild(loadingIndicator);
   
-  // Fetch messages
-  return fetchMessages(userId)
+  // Fetch messages (only the new ones if the chat is cached)
+  return syncMessages(userId)
     .then(data => {
       console.log('Messages loaded:', data);
       
@@ -30,6 +30,7 @@ function loadMessages(userId) {
       // Render messages
       if (data.success && data.messages && data.messages.length > 0) {
         renderMessages(data.messages, chatMessages);
+        setupOlderMessagesLoading(userId, chatMessages);
       } else {
         // Show "no messages" placeholder
         const noMessages = document.createElement('div');
@@ -91,6 +92,51 @@ function renderMessages(messages, chatMessages) {
   chatMessages.scrollTop = chatMessages.scrollHeight;
 }
 
+/**
+ * Load older pages of history when the chat is scrolled to the top
+ */
+function setupOlderMessagesLoading(userId, chatMessages) {
+  let loading = false;
+  
+  chatMessages.onscroll = function() {
+    if (loading || chatMessages.scrollTop > 50) return;
+    
+    const messagesContainer = chatMessages.querySelector('.messages-container');
+    if (!messagesContainer) return;
+    
+    loading = true;
+    fetchOlderMessages(userId)
+      .then(data => {
+        if (!data.success || data.messages.length === 0) {
+          if (!data.has_more) chatMessages.onscroll = null;
+          return;
+        }
+        
+        // Prepend older messages while keeping the visible position
+        const previousHeight = chatMessages.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        let currentDate = '';
+        data.messages.forEach(message => {
+          const dateString = new Date(message.timestamp).toLocaleDateString();
+          if (dateString !== currentDate) {
+            currentDate = dateString;
+            const dateSeparator = document.createElement('div');
+            dateSeparator.className = 'date-separator';
+            dateSeparator.textContent = formatDate(new Date(message.timestamp));
+            fragment.appendChild(dateSeparator);
+          }
+          fragment.appendChild(createMessageElement(message));
+        });
+        messagesContainer.insertBefore(fragment, messagesContainer.firstChild);
+        chatMessages.scrollTop = chatMessages.scrollHeight - previousHeight;
+        
+        if (!data.has_more) chatMessages.onscroll = null;
+      })
+      .catch(error => console.error('Error loading older messages:', error))
+      .finally(() => { loading = false; });
+  };
+}
+
 /**
  * Format date for date separators
  */
@@ -180,7 +226,7 @@ function createMessageElement(message) {
       messageContentHTML = `
         <div class="message-file-bubble">
           <a href="${fileUrl}" target="_blank" rel="noopener noreferrer">
-            <img src="${fileUrl}" alt="${escapeHtml(message.original_filename)}" class="file-thumb" loading="lazy">
+            <img src="${attachmentUrl(message, 480)}" alt="${escapeHtml(message.original_filename)}" class="file-thumb" loading="lazy">
           </a>
           <div class="file-info">
             <div class="file-name">${escapeHtml(message.original_filename)}</div>
@@ -198,7 +244,7 @@ function createMessageElement(message) {
       return messageDiv;
     } else if (message.mime_type.startsWith('video/')) {
       messageContentHTML = `
-        <video controls class="message-video-attachment" preload="metadata">
+        <video controls class="message-video-attachment" preload="metadata" poster="${videoPosterUrl(message)}">
           <source src="${fileUrl}" type="${message.mime_type}">
           Your browser does not support the video tag.
         </video>
@@ -744,7 +790,11 @@ function deleteMessage(messageId) {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
     body: JSON.stringify({ message_id: messageId })
-  }).then(r => r.json());
+  }).then(r => r.json())
+  .then(data => {
+    if (data.success) removeCachedMessage(messageId);
+    return data;
+  });
 }
 
 // --- Image Lightbox Modal for Full Image View ---
@@ -0,0 +1,95 @@
+import datetime
+import io
+import os
+import unittest
+from models.user import db, Message, GroupMessage
+from utils.blobs import blob_folder, collect_garbage, deduplicate_uploads, store_stream, store_file
+from test_files import UploadFolderTestCase
+
+NOW = datetime.timedelta(0)
+
+class BlobStoreTestCase(UploadFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.login(self.me)
+
+    def path(self, relative):
+        return os.path.join(self.uploads.name, relative)
+
+    def inode(self, relative):
+        return os.stat(self.path(relative)).st_ino
+
+    def blobs(self):
+        with self.app.app_context():
+            root = blob_folder()
+        return [os.path.join(d, f) for d, _, files in os.walk(root) if not d.endswith('tmp') for f in files]
+
+    def send_direct(self, data, name='photo.png'):
+        response = self.client.post('/upload_direct_file', data={
+            'recipient_id': self.peer, 'file': (io.BytesIO(data), name)
+        }, content_type='multipart/form-data')
+        return response.get_json()['message']
+
+    def send_group(self, data, name='photo.png'):
+        response = self.client.post('/upload_group_file', data={
+            'group_id': self.group_id, 'file': (io.BytesIO(data), name)
+        }, content_type='multipart/form-data')
+        return response.get_json()['message']
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.send_direct(b'same picture')
+        second = self.send_direct(b'same picture', 'copy.png')
+        in_group = self.send_group(b'same picture')
+        other = self.send_direct(b'another picture')
+
+        self.assertNotEqual(first['file_path'], second['file_path'])
+        self.assertEqual(self.inode(first['file_path']), self.inode(second['file_path']))
+        self.assertEqual(self.inode(first['file_path']), self.inode(in_group['file_path']))
+        self.assertNotEqual(self.inode(first['file_path']), self.inode(other['file_path']))
+        self.assertEqual(len(self.blobs()), 2)
+        self.assertEqual(os.stat(self.path(first['file_path'])).st_nlink, 4)
+        self.assertEqual(self.get(second['file_path']).status_code, 200)
+
+    def test_store_file_and_stream_agree(self):
+        self.write('.partial/x.part', b'chunked')
+        with self.app.app_context():
+            digest = store_file(self.path('.partial/x.part'), self.path('avatars/a.png'))
+            self.assertEqual(store_stream(io.BytesIO(b'chunked'), self.path('avatars/b.png')), digest)
+        self.assertFalse(os.path.exists(self.path('.partial/x.part')))
+        self.assertEqual(self.inode('avatars/a.png'), self.inode('avatars/b.png'))
+        self.assertEqual(os.listdir(os.path.join(self.uploads.name, 'blobs', 'tmp')), [])
+
+    def test_garbage_collection(self):
+        first = self.send_direct(b'same picture')
+        second = self.send_group(b'same picture')
+        with self.app.app_context():
+            # Свежие ссылки не трогаются, даже если сообщение уже удалено
+            db.session.delete(db.session.get(Message, first['id']))
+            db.session.commit()
+            self.assertEqual(collect_garbage(), (0, 0))
+            self.assertEqual(collect_garbage(NOW, dry_run=True), (1, 0))
+            self.assertEqual(collect_garbage(NOW), (1, 0))
+            self.assertFalse(os.path.exists(self.path(first['file_path'])))
+            self.assertTrue(os.path.exists(self.path(second['file_path'])))
+
+            db.session.delete(db.session.get(GroupMessage, second['id']))
+            db.session.commit()
+            self.assertEqual(collect_garbage(NOW), (1, 1))
+        self.assertEqual(self.blobs(), [])
+        # Файлы, сохраненные до хранилища блобов, сборщик не удаляет
+        self.assertTrue(os.path.exists(self.path(self.video)))
+
+    def test_deduplicate_uploads(self):
+        self.write('avatars/old_1.png', b'png')
+        self.write('direct_files/1_2/old.png', b'png')
+        with self.app.app_context():
+            self.assertEqual(deduplicate_uploads(), 2)
+            self.assertEqual(deduplicate_uploads(), 0)
+        self.assertEqual(self.inode('avatars/old_1.png'), self.inode(self.avatar))
+        self.assertEqual(self.inode('direct_files/1_2/old.png'), self.inode(self.avatar))
+        with open(self.path(self.avatar), 'rb') as f:
+            self.assertEqual(f.read(), b'png')
+        self.assertEqual(len(self.blobs()), 3)
+
+if __name__ == '__main__':
+    unittest.main()
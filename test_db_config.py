@@ -0,0 +1,54 @@
+import os
+import tempfile
+import threading
+import unittest
+from sqlalchemy import create_engine, text
+from utils.db_config import configure_sqlite, sqlite_engine_options, BUSY_TIMEOUT_MS
+
+class SQLitePragmaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, 'chat.db')
+        self.engine = create_engine(f'sqlite:///{path}', **sqlite_engine_options())
+        configure_sqlite(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def pragma(self, connection, name):
+        return connection.execute(text(f'PRAGMA {name}')).scalar()
+
+    def test_every_connection_is_tuned(self):
+        # Два одновременно занятых соединения — оба должны получить настройки
+        with self.engine.connect() as first, self.engine.connect() as second:
+            for connection in (first, second):
+                self.assertEqual(self.pragma(connection, 'journal_mode'), 'wal')
+                self.assertEqual(self.pragma(connection, 'synchronous'), 1)
+                self.assertEqual(self.pragma(connection, 'busy_timeout'), BUSY_TIMEOUT_MS)
+                self.assertEqual(self.pragma(connection, 'cache_size'), -8 * 1024)
+                self.assertEqual(self.pragma(connection, 'temp_store'), 2)
+
+    def test_reader_not_blocked_by_open_write(self):
+        with self.engine.begin() as connection:
+            connection.execute(text('CREATE TABLE item (id INTEGER PRIMARY KEY)'))
+            connection.execute(text('INSERT INTO item DEFAULT VALUES'))
+
+        writer = self.engine.connect()
+        writer.execute(text('BEGIN IMMEDIATE'))
+        writer.execute(text('INSERT INTO item DEFAULT VALUES'))
+        result = []
+
+        def read():
+            with self.engine.connect() as connection:
+                result.append(connection.execute(text('SELECT COUNT(*) FROM item')).scalar())
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=2)
+        writer.rollback()
+        writer.close()
+        self.assertEqual(result, [1])
+
+if __name__ == '__main__':
+    unittest.main()
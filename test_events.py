@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from models.user import db, User
+from utils.events import EventBroker, SQLiteEventBus, format_sse
+from utils.testing import create_test_app
+
+class EventBrokerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.broker = EventBroker(history_size=3)
+
+    def test_events_are_addressed(self):
+        self.broker.publish([1, 2], 'message', {'id': 1})
+        self.broker.publish([3], 'message', {'id': 2})
+        events, seq = self.broker.wait(1, 0, timeout=0)
+        self.assertEqual([data for _, _, data in events], [{'id': 1}])
+        self.assertEqual(seq, 2)
+        events, _ = self.broker.wait(1, seq, timeout=0)
+        self.assertEqual(events, [])
+
+    def test_resume_from_last_event_id(self):
+        first_id = self.broker.publish([1], 'message', {'id': 1})
+        self.broker.publish([1], 'message', {'id': 2})
+        seq = self.broker.parse_event_id(first_id)
+        self.assertTrue(self.broker.is_resumable(seq))
+        events, _ = self.broker.wait(1, seq, timeout=0)
+        self.assertEqual([data['id'] for _, _, data in events], [2])
+
+    def test_unknown_or_expired_ids_are_not_resumable(self):
+        first_id = self.broker.publish([1], 'message', {})
+        for _ in range(4):
+            self.broker.publish([1], 'message', {})
+        self.assertFalse(self.broker.is_resumable(self.broker.parse_event_id(first_id)))
+        self.assertIsNone(self.broker.parse_event_id('0-1'))
+        self.assertIsNone(self.broker.parse_event_id('garbage'))
+
+    def test_format_sse(self):
+        self.assertEqual(format_sse('1-2', 'read', {'a': 1}), 'id: 1-2\nevent: read\ndata: {"a": 1}\n\n')
+
+class SQLiteEventBusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, 'events.db')
+        # Two bus instances on one file stand in for two worker processes
+        self.worker_a = SQLiteEventBus(path)
+        self.worker_b = SQLiteEventBus(path)
+
+    def tearDown(self):
+        self.worker_a.close()
+        self.worker_b.close()
+        self.tmpdir.cleanup()
+
+    def test_events_cross_workers(self):
+        self.assertEqual(self.worker_a.epoch, self.worker_b.epoch)
+        start = self.worker_b.current_seq()
+        event_id = self.worker_a.publish([1, 2], 'message', {'id': 7})
+        self.worker_b.poll()
+        events, _ = self.worker_b.wait(2, start, timeout=0)
+        self.assertEqual(events, [(event_id, 'message', {'id': 7})])
+
+    def test_resume_on_another_worker(self):
+        first_id = self.worker_a.publish([1], 'message', {'id': 1})
+        self.worker_a.publish([1], 'message', {'id': 2})
+        self.worker_b.poll()
+        seq = self.worker_b.parse_event_id(first_id)
+        self.assertTrue(self.worker_b.is_resumable(seq))
+        events, _ = self.worker_b.wait(1, seq, timeout=0)
+        self.assertEqual([data['id'] for _, _, data in events], [2])
+
+    def test_events_before_startup_require_resync(self):
+        old_id = self.worker_a.publish([1], 'message', {})
+        self.worker_a.publish([1], 'message', {})
+        late_worker = SQLiteEventBus(self.worker_a.path)
+        self.assertFalse(late_worker.is_resumable(late_worker.parse_event_id(old_id)))
+
+class EventsEndpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', password_hash='x') for i in range(2)]
+            db.session.add_all(users)
+            db.session.commit()
+            self.user_ids = [u.id for u in users]
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_requires_login(self):
+        self.assertEqual(self.client.get('/events').status_code, 401)
+
+    def test_send_message_publishes_to_both_sides(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.user_ids[0]
+        with mock.patch('routes.messages.publish') as publish:
+            self.client.post('/send_message', json={'recipient_id': self.user_ids[1], 'content': 'hi'})
+        user_ids, event_type, data = publish.call_args.args
+        self.assertEqual(set(user_ids), set(self.user_ids))
+        self.assertEqual(event_type, 'message')
+        self.assertEqual(data['content'], 'hi')
+
+    def test_stream_starts_with_retry_and_resync(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.user_ids[0]
+        response = self.client.get('/events', headers={'Last-Event-ID': 'stale-1'})
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        stream = response.iter_encoded()
+        self.assertTrue(next(stream).startswith(b'retry:'))
+        self.assertIn(b'event: resync', next(stream))
+        response.close()
+
+if __name__ == '__main__':
+    unittest.main()
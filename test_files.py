@@ -0,0 +1,293 @@
+import datetime
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from sqlalchemy import event
+from models.user import db, User, Group, GroupMember, Message, GroupMessage, Upload
+from utils.uploads import expire_uploads, get_upload, partial_path, write_chunk
+from utils.testing import create_test_app
+
+VIDEO = bytes(range(256)) * 40
+
+class UploadFolderTestCase(unittest.TestCase):
+    """Users, a group and a few files in a temporary UPLOAD_FOLDER"""
+
+    def setUp(self):
+        self.app = create_test_app()
+        self.uploads = tempfile.TemporaryDirectory()
+        self.app.config['UPLOAD_FOLDER'] = self.uploads.name
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', password_hash='x') for i in range(3)]
+            db.session.add_all(users)
+            db.session.flush()
+            group = Group(name='Team', creator_id=users[0].id)
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMember(group_id=group.id, user_id=users[0].id, role='admin'))
+            db.session.commit()
+            self.me, self.peer, self.outsider = (user.id for user in users)
+            self.group_id = group.id
+        self.video = f'direct_files/{self.me}_{self.peer}/0b5e6f1c.mp4'
+        self.group_file = f'group_files/{self.group_id}/9d2a.txt'
+        self.avatar = f'avatars/user_{self.peer}_1f2e_a.png'
+        self.write(self.video, VIDEO)
+        self.write(self.group_file, b'group note')
+        self.write(self.avatar, b'png')
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+        self.uploads.cleanup()
+
+    def write(self, path, data):
+        full_path = os.path.join(self.uploads.name, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'wb') as f:
+            f.write(data)
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+
+    def get(self, path, **kwargs):
+        response = self.client.get('/uploads/' + path, **kwargs)
+        response.close()
+        return response
+
+class UploadServingTestCase(UploadFolderTestCase):
+    def test_access_checks(self):
+        self.assertEqual(self.get(self.video).status_code, 401)
+        self.login(self.outsider)
+        self.assertEqual(self.get(self.video).status_code, 403)
+        self.assertEqual(self.get(self.group_file).status_code, 403)
+        self.assertEqual(self.get(self.avatar).status_code, 200)
+        self.assertEqual(self.get('direct_files/../secret').status_code, 403)
+        self.assertEqual(self.get('other/file.txt').status_code, 403)
+        self.login(self.me)
+        self.assertEqual(self.get(self.group_file).status_code, 200)
+
+    def test_missing_file_does_not_create_directories(self):
+        self.login(self.me)
+        self.assertEqual(self.get(f'group_files/{self.group_id}/missing/x.txt').status_code, 404)
+        self.assertFalse(os.path.exists(os.path.join(self.uploads.name, 'group_files', str(self.group_id), 'missing')))
+
+    def test_cache_headers(self):
+        self.login(self.me)
+        response = self.get(self.video)
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.get(self.avatar).headers['Cache-Control'], 'public, max-age=86400')
+        revalidated = self.get(self.video, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_range_requests(self):
+        self.login(self.me)
+        response = self.client.get('/uploads/' + self.video, headers={'Range': 'bytes=1000-1999'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], f'bytes 1000-1999/{len(VIDEO)}')
+        self.assertEqual(response.data, VIDEO[1000:2000])
+
+        response = self.client.get('/uploads/' + self.video, headers={'Range': 'bytes=-100'})
+        self.assertEqual(response.data, VIDEO[-100:])
+
+        response = self.get(self.video, headers={'Range': f'bytes={len(VIDEO)}-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_x_accel_redirect(self):
+        self.app.config['FILE_OFFLOAD'] = 'x-accel'
+        self.app.config['X_ACCEL_PREFIX'] = '/protected_uploads/'
+        self.login(self.me)
+        response = self.client.get('/uploads/' + self.video, headers={'Range': 'bytes=0-9'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/protected_uploads/' + self.video)
+        self.assertEqual(response.mimetype, 'video/mp4')
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertEqual(self.get(self.group_file.replace('9d2a', 'nope')).status_code, 404)
+
+    def test_x_sendfile(self):
+        self.app.config['FILE_OFFLOAD'] = 'x-sendfile'
+        self.app.config['USE_X_SENDFILE'] = True
+        self.login(self.me)
+        response = self.client.get('/uploads/' + self.video)
+        self.assertEqual(response.headers['X-Sendfile'], os.path.join(self.uploads.name, self.video))
+        self.assertEqual(response.data, b'')
+
+class ResumableUploadTestCase(UploadFolderTestCase):
+    CHUNK = 1000
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['UPLOAD_CHUNK_SIZE'] = self.CHUNK
+        self.app.config['MAX_UPLOAD_SIZE'] = 100000
+        self.login(self.me)
+
+    def partial_path(self, upload_id):
+        with self.app.app_context():
+            return partial_path(upload_id)
+
+    def init(self, data=VIDEO, name='clip.mp4'):
+        response = self.client.post('/upload_init', json={'filename': name, 'size': len(data), 'mime_type': 'video/mp4'})
+        return response.status_code, response.get_json()
+
+    def put(self, upload_id, index, data=VIDEO, checksum=None):
+        chunk = data[index * self.CHUNK:(index + 1) * self.CHUNK]
+        checksum = checksum or hashlib.sha256(chunk).hexdigest()
+        response = self.client.put(f'/upload_chunk/{upload_id}/{index}', data=chunk,
+                                   headers={'X-Chunk-SHA256': checksum, 'Content-Type': 'application/octet-stream'})
+        return response.status_code, response.get_json()
+
+    def upload(self, data=VIDEO):
+        status, info = self.init(data)
+        self.assertEqual(status, 200)
+        for index in range(info['total_chunks']):
+            self.assertEqual(self.put(info['upload_id'], index, data)[0], 200)
+        return info['upload_id']
+
+    def test_chunks_are_verified_and_resumable(self):
+        _, info = self.init()
+        upload_id = info['upload_id']
+        self.assertEqual((info['total_chunks'], info['next_chunk']), (11, 0))
+
+        self.assertEqual(self.put(upload_id, 0)[1]['next_chunk'], 1)
+        self.assertEqual(self.put(upload_id, 2)[0], 409)
+        self.assertEqual(self.put(upload_id, 1, checksum='0' * 64)[0], 422)
+        self.assertEqual(os.path.getsize(self.partial_path(upload_id)), self.CHUNK)
+        # Повтор уже принятой части подтверждается и ничего не меняет
+        self.assertEqual(self.put(upload_id, 0)[1]['next_chunk'], 1)
+        self.assertEqual(self.client.get(f'/upload_status/{upload_id}').get_json()['next_chunk'], 1)
+
+        self.login(self.peer)
+        self.assertEqual(self.client.get(f'/upload_status/{upload_id}').status_code, 404)
+        self.assertEqual(self.put(upload_id, 1)[0], 404)
+
+    def test_duplicate_chunk_in_flight_is_rejected(self):
+        _, info = self.init()
+        upload_id = info['upload_id']
+        chunk = VIDEO[:self.CHUNK]
+        duplicates = []
+        put = self.put
+
+        class InFlight(io.BytesIO):
+            # Пока первый запрос читает тело, клиент повторяет ту же часть
+            def read(self, size=-1):
+                if not duplicates:
+                    duplicates.append(put(upload_id, 0))
+                return super().read(size)
+
+        with self.app.app_context():
+            upload = write_chunk(get_upload(upload_id, self.me), 0, InFlight(chunk), hashlib.sha256(chunk).hexdigest())
+            self.assertEqual(upload.received_chunks, 1)
+        self.assertEqual(duplicates[0][0], 409)
+        self.assertEqual(os.path.getsize(self.partial_path(upload_id)), self.CHUNK)
+        self.assertEqual(self.put(upload_id, 0)[1]['next_chunk'], 1)
+
+        # Захват упавшего запроса освобождается по таймауту
+        with self.app.app_context():
+            Upload.query.filter_by(id=upload_id).update({
+                'chunk_lock': 'f' * 32, 'updated_at': datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+            })
+            db.session.commit()
+        self.assertEqual(self.put(upload_id, 1)[1]['next_chunk'], 2)
+        # Неудачная запись отпускает захват: повтор сразу проходит
+        self.assertEqual(self.put(upload_id, 2, checksum='0' * 64)[0], 422)
+        self.assertEqual(self.put(upload_id, 2)[1]['next_chunk'], 3)
+
+    def test_limits(self):
+        self.assertEqual(self.init(b'x' * 100001)[0], 413)
+        _, info = self.init(b'')
+        self.assertEqual(info['total_chunks'], 1)
+        status, info = self.init(b'x' * 10)
+        response = self.client.put(f'/upload_chunk/{info["upload_id"]}/0', data=b'x' * 11,
+                                   headers={'X-Chunk-SHA256': hashlib.sha256(b'x' * 11).hexdigest()})
+        self.assertEqual(response.status_code, 413)
+
+    def test_finish_creates_direct_message(self):
+        _, info = self.init()
+        self.put(info['upload_id'], 0)
+        response = self.client.post('/upload_direct_file', data={'recipient_id': self.peer, 'upload_id': info['upload_id']})
+        self.assertEqual(response.status_code, 409)
+
+        upload_id = self.upload()
+        response = self.client.post('/upload_direct_file', data={
+            'recipient_id': self.peer, 'upload_id': upload_id, 'caption': 'look'
+        }).get_json()
+        self.assertTrue(response['success'])
+        message = response['message']
+        self.assertEqual((message['content'], message['mime_type'], message['original_filename']),
+                         ('look', 'video/mp4', 'clip.mp4'))
+        with open(os.path.join(self.uploads.name, message['file_path']), 'rb') as f:
+            self.assertEqual(f.read(), VIDEO)
+        self.assertFalse(os.path.exists(self.partial_path(upload_id)))
+        with self.app.app_context():
+            self.assertIsNone(db.session.get(Upload, upload_id))
+            self.assertEqual(Message.query.count(), 1)
+        # upload_id одноразовый
+        response = self.client.post('/upload_direct_file', data={'recipient_id': self.peer, 'upload_id': upload_id})
+        self.assertEqual(response.status_code, 404)
+
+    def test_failed_finish_can_be_retried(self):
+        upload_id = self.upload()
+
+        def fail(*args):
+            raise RuntimeError('insert failed')
+        event.listen(Message, 'before_insert', fail)
+        try:
+            response = self.client.post('/upload_direct_file', data={'recipient_id': self.peer, 'upload_id': upload_id})
+        finally:
+            event.remove(Message, 'before_insert', fail)
+        self.assertEqual(response.status_code, 500)
+        # Откат вернул сессию загрузки, временный файл на месте
+        self.assertTrue(os.path.exists(self.partial_path(upload_id)))
+        self.assertEqual(self.client.get(f'/upload_status/{upload_id}').status_code, 200)
+
+        message = self.client.post('/upload_direct_file', data={
+            'recipient_id': self.peer, 'upload_id': upload_id
+        }).get_json()['message']
+        with open(os.path.join(self.uploads.name, message['file_path']), 'rb') as f:
+            self.assertEqual(f.read(), VIDEO)
+        self.assertFalse(os.path.exists(self.partial_path(upload_id)))
+
+    def test_finish_creates_group_message(self):
+        upload_id = self.upload()
+        response = self.client.post('/upload_group_file', json={'group_id': self.group_id, 'upload_id': upload_id})
+        message = response.get_json()['message']
+        self.assertEqual(message['group_id'], self.group_id)
+        self.assertEqual(self.get(message['file_path']).status_code, 200)
+        with self.app.app_context():
+            self.assertEqual(GroupMessage.query.count(), 1)
+
+    def test_active_upload_does_not_expire(self):
+        _, info = self.init()
+        with self.app.app_context():
+            # Загрузка начата двое суток назад, последняя часть пришла сейчас
+            Upload.query.filter_by(id=info['upload_id']).update({
+                'created_at': datetime.datetime.utcnow() - datetime.timedelta(days=2),
+                'updated_at': datetime.datetime.utcnow() - datetime.timedelta(days=2)
+            })
+            db.session.commit()
+        self.assertEqual(self.put(info['upload_id'], 0)[0], 200)
+        with self.app.app_context():
+            self.assertEqual(expire_uploads(), 0)
+            self.assertEqual(expire_uploads(datetime.timedelta(hours=1)), 0)
+        self.assertEqual(self.put(info['upload_id'], 1)[0], 200)
+
+    def test_expire_uploads(self):
+        _, info = self.init()
+        with self.app.app_context():
+            self.assertEqual(expire_uploads(), 0)
+            self.assertEqual(expire_uploads(datetime.timedelta(seconds=-1)), 1)
+            self.assertFalse(os.path.exists(partial_path(info['upload_id'])))
+        # Временный файл завершенной загрузки, оставшийся после сбоя
+        self.write('.partial/0123abcd.part', b'left over')
+        with self.app.app_context():
+            expire_uploads(datetime.timedelta(seconds=-1))
+        self.assertFalse(os.path.exists(os.path.join(self.uploads.name, '.partial', '0123abcd.part')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+from models.user import db, User, Group, GroupMember, GroupMessage
+from utils.testing import create_test_app, QueryCounter
+
+class GroupMessagesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', password_hash='x') for i in range(3)]
+            db.session.add_all(users)
+            db.session.flush()
+            group = Group(name='Team', creator_id=users[0].id)
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMember(group_id=group.id, user_id=users[0].id, role='admin'))
+            db.session.add(GroupMember(group_id=group.id, user_id=users[1].id, role='member'))
+            db.session.commit()
+            self.user_ids = [u.id for u in users]
+            self.group_id = group.id
+        self.login(self.user_ids[0])
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+
+    def add_messages(self, count):
+        with self.app.app_context():
+            for i in range(count):
+                db.session.add(GroupMessage(group_id=self.group_id, sender_id=self.user_ids[i % 2], content=f'g{i}'))
+            db.session.commit()
+
+    def get_messages(self, **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client.get(f'/get_group_messages?group_id={self.group_id}&{query}').get_json()
+
+    def test_keyset_pages(self):
+        self.add_messages(7)
+        latest = self.get_messages(limit=3)
+        self.assertEqual([m['content'] for m in latest['messages']], ['g4', 'g5', 'g6'])
+        self.assertTrue(latest['has_more'])
+
+        older = self.get_messages(limit=5, before_id=latest['messages'][0]['id'])
+        self.assertEqual([m['content'] for m in older['messages']], ['g0', 'g1', 'g2', 'g3'])
+        self.assertFalse(older['has_more'])
+
+        newer = self.get_messages(after_id=latest['messages'][-1]['id'])
+        self.assertEqual(newer['messages'], [])
+
+    def test_member_directory_sent_only_when_changed(self):
+        first = self.get_messages()
+        self.assertEqual({m['id'] for m in first['members']}, set(self.user_ids[:2]))
+        version = first['members_version']
+
+        unchanged = self.get_messages(members_version=version)
+        self.assertNotIn('members', unchanged)
+
+        self.client.post('/add_group_members', json={'group_id': self.group_id, 'user_ids': [self.user_ids[2]]})
+        changed = self.get_messages(members_version=version)
+        self.assertEqual(len(changed['members']), 3)
+        self.assertNotEqual(changed['members_version'], version)
+
+        self.login(self.user_ids[1])
+        self.client.post('/update_profile', data={'name': 'Renamed', 'bio': ''})
+        self.login(self.user_ids[0])
+        renamed = self.get_messages(members_version=changed['members_version'])
+        self.assertIn('Renamed', [m['name'] for m in renamed['members']])
+
+    def test_poll_cost_is_constant(self):
+        self.add_messages(5)
+        version = self.get_messages()['members_version']
+        with self.app.app_context():
+            with QueryCounter(db.engine) as small:
+                self.get_messages(members_version=version)
+        self.add_messages(300)
+        with self.app.app_context():
+            with QueryCounter(db.engine) as large:
+                data = self.get_messages(members_version=version)
+        self.assertEqual(len(data['messages']), 50)
+        self.assertEqual(small.count, large.count)
+
+    def add_groups(self, count):
+        with self.app.app_context():
+            for i in range(count):
+                group = Group(name=f'Extra {i}', creator_id=self.user_ids[1])
+                db.session.add(group)
+                db.session.flush()
+                db.session.add(GroupMember(group_id=group.id, user_id=self.user_ids[0], role='member'))
+                db.session.add(GroupMember(group_id=group.id, user_id=self.user_ids[1], role='admin'))
+                db.session.add(GroupMessage(group_id=group.id, sender_id=self.user_ids[1], content=f'last {i}'))
+            db.session.commit()
+
+    def test_user_groups(self):
+        self.add_messages(3)
+        self.add_groups(1)
+        groups = self.client.get('/get_user_groups').get_json()['groups']
+        self.assertEqual([g['name'] for g in groups], ['Team', 'Extra 0'])
+        team, extra = groups
+        self.assertEqual(team['member_count'], 2)
+        self.assertTrue(team['is_admin'])
+        self.assertEqual(team['last_message']['content'], 'g2')
+        self.assertEqual(team['last_message']['sender_name'], 'User 0')
+        self.assertFalse(extra['is_admin'])
+        self.assertEqual(extra['last_message']['sender_name'], 'User 1')
+
+        self.login(self.user_ids[2])
+        self.client.post('/create_group', json={'name': 'Empty', 'members': []})
+        empty = self.client.get('/get_user_groups').get_json()['groups']
+        self.assertEqual(empty[0]['member_count'], 1)
+        self.assertIsNone(empty[0]['last_message'])
+
+    def test_user_groups_query_count_is_constant(self):
+        self.add_groups(2)
+        with self.app.app_context():
+            with QueryCounter(db.engine) as small:
+                self.client.get('/get_user_groups')
+        self.add_groups(50)
+        with self.app.app_context():
+            with QueryCounter(db.engine) as large:
+                data = self.client.get('/get_user_groups').get_json()
+        self.assertEqual(len(data['groups']), 53)
+        self.assertEqual(small.count, large.count)
+
+    def unread_counts(self):
+        return {g['id']: g['unread_count'] for g in self.client.get('/get_user_groups').get_json()['groups']}
+
+    def test_group_read_cursor(self):
+        self.login(self.user_ids[1])
+        self.add_messages(1)
+        for i in range(3):
+            self.client.post('/send_group_message', json={'group_id': self.group_id, 'content': f'from member {i}'})
+        # Отправка сдвигает курсор отправителя
+        self.assertEqual(self.unread_counts()[self.group_id], 0)
+
+        self.login(self.user_ids[0])
+        self.assertEqual(self.unread_counts()[self.group_id], 4)
+        messages = self.get_messages()['messages']
+
+        partial = self.client.post('/mark_group_read', json={'group_id': self.group_id, 'message_id': messages[1]['id']}).get_json()
+        self.assertEqual(partial['unread_count'], 2)
+        # Курсор не двигается назад
+        self.client.post('/mark_group_read', json={'group_id': self.group_id, 'message_id': messages[0]['id']})
+        self.assertEqual(self.unread_counts()[self.group_id], 2)
+
+        full = self.client.post('/mark_group_read', json={'group_id': self.group_id, 'message_id': 10 ** 9}).get_json()
+        self.assertEqual(full['last_read_message_id'], messages[-1]['id'])
+        self.assertEqual(self.unread_counts()[self.group_id], 0)
+
+        # Новый участник не видит историю до вступления как непрочитанную
+        self.client.post('/add_group_members', json={'group_id': self.group_id, 'user_ids': [self.user_ids[2]]})
+        self.login(self.user_ids[2])
+        self.assertEqual(self.unread_counts()[self.group_id], 0)
+        self.client.post('/send_group_message', json={'group_id': self.group_id, 'content': 'hello'})
+        self.login(self.user_ids[1])
+        self.assertEqual(self.unread_counts()[self.group_id], 1)
+
+    def test_mark_group_read_requires_membership(self):
+        self.login(self.user_ids[2])
+        response = self.client.post('/mark_group_read', json={'group_id': self.group_id})
+        self.assertEqual(response.status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()
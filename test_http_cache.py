@@ -0,0 +1,115 @@
+import io
+import tempfile
+import unittest
+from models.user import db, User, Contact, Group, GroupMember, GroupMessage
+from utils.testing import create_test_app, QueryCounter
+
+class ConditionalRequestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.uploads = tempfile.TemporaryDirectory()
+        self.app.config['UPLOAD_FOLDER'] = self.uploads.name
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', password_hash='x') for i in range(3)]
+            db.session.add_all(users)
+            db.session.flush()
+            me, peer, other = users
+            db.session.add(Contact(user_id=me.id, contact_id=peer.id))
+            group = Group(name='Team', creator_id=me.id)
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMember(group_id=group.id, user_id=me.id, role='admin'))
+            db.session.add(GroupMember(group_id=group.id, user_id=peer.id, role='member'))
+            db.session.add(GroupMessage(group_id=group.id, sender_id=peer.id, content='hello'))
+            db.session.commit()
+            self.me, self.peer, self.other, self.group_id = me.id, peer.id, other.id, group.id
+        self.urls = [
+            '/get_current_user_info',
+            f'/get_user_info?user_id={self.peer}',
+            '/get_contacts',
+            '/get_user_groups',
+            f'/get_group_info?group_id={self.group_id}',
+        ]
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+        self.uploads.cleanup()
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+
+    def etags(self):
+        self.login(self.me)
+        return {url: self.client.get(url).headers['ETag'] for url in self.urls}
+
+    def test_matching_etag_gets_304(self):
+        for url, etag in self.etags().items():
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.data, b'', url)
+            self.assertEqual(response.headers['ETag'], etag, url)
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': 'W/"stale"'}).status_code, 200, url)
+
+    def test_304_skips_the_listing_query(self):
+        etag = self.etags()['/get_user_groups']
+        with self.app.app_context():
+            with QueryCounter(db.engine) as counter:
+                self.client.get('/get_user_groups', headers={'If-None-Match': etag})
+        self.assertEqual(counter.count, 1)
+
+    def changed_urls(self, change):
+        before = self.etags()
+        change()
+        after = self.etags()
+        return {url for url in self.urls if before[url] != after[url]}
+
+    def test_writes_change_the_affected_etags(self):
+        def rename_peer():
+            self.login(self.peer)
+            self.client.post('/update_profile', data={'name': 'Peer', 'bio': ''})
+        self.assertEqual(self.changed_urls(rename_peer),
+                         {f'/get_user_info?user_id={self.peer}', '/get_contacts', '/get_user_groups',
+                          f'/get_group_info?group_id={self.group_id}'})
+
+        def change_bio():
+            self.client.post('/update_profile', data={'name': 'User 0', 'bio': 'hi'})
+        self.assertEqual(self.changed_urls(change_bio), {'/get_current_user_info'})
+
+        def add_contact():
+            self.client.post('/add_contact', json={'contact_id': self.other})
+        self.assertEqual(self.changed_urls(add_contact), {'/get_contacts'})
+
+        def peer_posts():
+            self.login(self.peer)
+            self.client.post('/send_group_message', json={'group_id': self.group_id, 'content': 'news'})
+        self.assertEqual(self.changed_urls(peer_posts), {'/get_user_groups'})
+
+        def read_group():
+            self.client.post('/mark_group_read', json={'group_id': self.group_id})
+        self.assertEqual(self.changed_urls(read_group), {'/get_user_groups'})
+
+        def edit_group():
+            self.client.post('/edit_group', data={'group_id': str(self.group_id), 'name': 'Team 2', 'description': ''})
+        self.assertEqual(self.changed_urls(edit_group),
+                         {'/get_user_groups', f'/get_group_info?group_id={self.group_id}'})
+
+        def avatar():
+            self.login(self.peer)
+            self.client.post('/upload_avatar', data={'avatar': (io.BytesIO(b'img'), 'a.png')})
+        self.assertEqual(self.changed_urls(avatar),
+                         {f'/get_user_info?user_id={self.peer}', '/get_contacts', '/get_user_groups',
+                          f'/get_group_info?group_id={self.group_id}'})
+
+    def test_outsider_gets_403_not_304(self):
+        etag = self.etags()[f'/get_group_info?group_id={self.group_id}']
+        self.login(self.other)
+        response = self.client.get(f'/get_group_info?group_id={self.group_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()
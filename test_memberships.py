@@ -0,0 +1,86 @@
+import unittest
+from models.user import db, User, Group, GroupMember
+from utils.memberships import membership_cache, member_role, is_group_member
+from utils.testing import create_test_app, QueryCounter
+
+class MembershipCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', password_hash='x') for i in range(3)]
+            db.session.add_all(users)
+            db.session.flush()
+            group = Group(name='Team', creator_id=users[0].id)
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMember(group_id=group.id, user_id=users[0].id, role='admin'))
+            db.session.add(GroupMember(group_id=group.id, user_id=users[1].id, role='member'))
+            db.session.commit()
+            self.admin, self.member, self.outsider = (u.id for u in users)
+            self.group_id = group.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+
+    def send(self, user_id):
+        self.login(user_id)
+        return self.client.post('/send_group_message', json={'group_id': self.group_id, 'content': 'hi'}).status_code
+
+    def post_as_admin(self, url, user_id):
+        self.login(self.admin)
+        return self.client.post(url, json={'group_id': self.group_id, 'user_id': user_id, 'user_ids': [user_id]}).get_json()
+
+    def test_checks_cost_no_sql_once_loaded(self):
+        with self.app.app_context():
+            self.assertEqual(member_role(self.group_id, self.admin), 'admin')
+            group = db.session.get(Group, self.group_id)
+            with QueryCounter(db.engine) as counter:
+                self.assertTrue(is_group_member(self.group_id, self.member))
+                self.assertFalse(is_group_member(self.group_id, self.outsider))
+                self.assertTrue(group.is_admin(self.admin))
+                self.assertFalse(group.is_admin(self.member))
+                self.assertFalse(group.is_member(self.outsider))
+            self.assertEqual(counter.count, 0)
+
+    def test_membership_changes_invalidate(self):
+        self.assertEqual(self.send(self.outsider), 403)
+        self.post_as_admin('/add_group_members', self.outsider)
+        self.assertEqual(self.send(self.outsider), 200)
+
+        self.post_as_admin('/set_group_admin', self.outsider)
+        with self.app.app_context():
+            self.assertEqual(member_role(self.group_id, self.outsider), 'admin')
+        self.post_as_admin('/remove_group_admin', self.outsider)
+        with self.app.app_context():
+            self.assertEqual(member_role(self.group_id, self.outsider), 'member')
+
+        self.post_as_admin('/kick_group_member', self.outsider)
+        self.assertEqual(self.send(self.outsider), 403)
+
+        self.login(self.member)
+        self.client.post('/leave_group', json={'group_id': self.group_id})
+        self.assertEqual(self.send(self.member), 403)
+
+        self.login(self.admin)
+        self.client.post('/delete_group', json={'group_id': self.group_id})
+        with self.app.app_context():
+            self.assertEqual(dict(membership_cache.get(self.group_id)), {})
+
+    def test_new_group_is_not_shadowed_by_cached_miss(self):
+        with self.app.app_context():
+            self.assertFalse(is_group_member(self.group_id + 1, self.admin))
+        self.login(self.admin)
+        created = self.client.post('/create_group', json={'name': 'New', 'members': []}).get_json()
+        self.assertEqual(created['group_id'], self.group_id + 1)
+        self.assertEqual(self.client.get(f'/get_group_info?group_id={self.group_id + 1}').status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+import unittest
+import datetime
+from unittest import mock
+from sqlalchemy import text
+from models.user import db, User, Message, Contact, Block, Conversation
+from utils.conversations import rebuild_conversations, MARK_READ_QUERY
+from utils.events import get_broker
+from utils.relations import relation_cache, Relations
+from utils.testing import create_test_app, QueryCounter
+
+class ChatListTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            me = User(name='Me', email='me@example.com')
+            me.set_password('password123')
+            db.session.add(me)
+            db.session.commit()
+            self.me_id = me.id
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.me_id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def add_peers(self, count):
+        """Creates peers, each with two messages in the conversation"""
+        peer_ids = []
+        with self.app.app_context():
+            base = datetime.datetime(2025, 1, 1)
+            for i in range(count):
+                peer = User(name=f'Peer {i}', email=f'peer{i}@example.com', password_hash='x')
+                db.session.add(peer)
+                db.session.flush()
+                db.session.add(Message(sender_id=self.me_id, recipient_id=peer.id, content=f'hi {i}',
+                                       timestamp=base + datetime.timedelta(minutes=2 * i), is_read=True))
+                db.session.add(Message(sender_id=peer.id, recipient_id=self.me_id, content=f'reply {i}',
+                                       timestamp=base + datetime.timedelta(minutes=2 * i + 1), is_read=False))
+                peer_ids.append(peer.id)
+            db.session.commit()
+            rebuild_conversations()
+        return peer_ids
+
+    def test_chat_list_shape_and_order(self):
+        peer_ids = self.add_peers(3)
+        with self.app.app_context():
+            db.session.add(Contact(user_id=self.me_id, contact_id=peer_ids[0]))
+            db.session.add(Block(user_id=self.me_id, blocked_user_id=peer_ids[1]))
+            db.session.add(Block(user_id=peer_ids[2], blocked_user_id=self.me_id))
+            db.session.commit()
+
+        data = self.client.get('/get_chat_list').get_json()
+        self.assertTrue(data['success'])
+        chats = data['chats']
+        self.assertEqual([c['user_id'] for c in chats], list(reversed(peer_ids)))
+        newest = chats[0]
+        self.assertEqual(set(newest.keys()), {
+            'user_id', 'name', 'avatar_path', 'last_message', 'last_timestamp',
+            'unread_count', 'is_contact', 'is_blocked_by_you', 'has_blocked_you'
+        })
+        self.assertEqual(newest['last_message'], 'reply 2')
+        self.assertEqual(newest['last_timestamp'], '2025-01-01T00:05:00')
+        self.assertEqual(newest['unread_count'], 1)
+        self.assertTrue(newest['has_blocked_you'])
+        self.assertTrue(chats[1]['is_blocked_by_you'])
+        self.assertTrue(chats[2]['is_contact'])
+        self.assertFalse(chats[2]['is_blocked_by_you'])
+
+    def test_chat_list_query_count_is_constant(self):
+        self.add_peers(2)
+        with self.app.app_context():
+            # Оба замера с холодным кешем связей
+            relation_cache.clear()
+            with QueryCounter(db.engine) as small:
+                self.client.get('/get_chat_list')
+        with self.app.app_context():
+            for i in range(20):
+                peer = User(name=f'Extra {i}', email=f'extra{i}@example.com', password_hash='x')
+                db.session.add(peer)
+                db.session.flush()
+                db.session.add(Message(sender_id=peer.id, recipient_id=self.me_id, content='x'))
+            db.session.commit()
+            rebuild_conversations()
+            relation_cache.clear()
+            with QueryCounter(db.engine) as large:
+                data = self.client.get('/get_chat_list').get_json()
+        self.assertEqual(len(data['chats']), 22)
+        self.assertEqual(small.count, large.count)
+
+    def test_chat_list_error_is_not_a_truncated_200(self):
+        class Broken(frozenset):
+            def __contains__(self, item):
+                raise RuntimeError('broken row')
+
+        self.add_peers(2)
+        relations = Relations(blocked=frozenset(), blocked_by=frozenset(), contacts=Broken())
+        with mock.patch('routes.messages.get_relations', return_value=relations):
+            response = self.client.get('/get_chat_list')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(response.get_json()['success'])
+
+class ConversationSummaryTestCase(ChatListTestCase):
+    def snapshot(self):
+        with self.app.app_context():
+            return sorted(
+                (c.user_id, c.peer_id, c.last_message_id, c.last_preview, c.unread_count)
+                for c in Conversation.query.all()
+            )
+
+    def test_summaries_follow_writes(self):
+        peer_id = self.add_peers(1)[0]
+        response = self.client.post('/send_message', json={'recipient_id': peer_id, 'content': 'latest'})
+        latest_id = response.get_json()['message']['id']
+        chat = self.client.get('/get_chat_list').get_json()['chats'][0]
+        self.assertEqual(chat['last_message'], 'latest')
+
+        self.client.post('/edit_message', json={'message_id': latest_id, 'content': 'edited'})
+        self.assertIn((peer_id, self.me_id, latest_id, 'edited', 1), self.snapshot())
+
+        self.client.post('/delete_message', json={'message_id': latest_id})
+        chat = self.client.get('/get_chat_list').get_json()['chats'][0]
+        self.assertEqual(chat['last_message'], 'reply 0')
+        self.assertEqual(chat['unread_count'], 1)
+
+        self.client.get(f'/get_messages?user_id={peer_id}')
+        chat = self.client.get('/get_chat_list').get_json()['chats'][0]
+        self.assertEqual(chat['unread_count'], 0)
+
+        self.client.post('/delete_chat', json={'user_id': peer_id})
+        self.assertEqual(self.snapshot(), [])
+
+    def test_incremental_matches_rebuild(self):
+        peer_ids = self.add_peers(3)
+        for peer_id in peer_ids:
+            self.client.post('/send_message', json={'recipient_id': peer_id, 'content': f'to {peer_id}'})
+        self.client.get(f'/get_messages?user_id={peer_ids[0]}')
+        incremental = self.snapshot()
+        with self.app.app_context():
+            rebuild_conversations()
+        self.assertEqual(incremental, self.snapshot())
+
+class MessagePaginationTestCase(ChatListTestCase):
+    def test_keyset_pages(self):
+        peer_id = self.add_peers(1)[0]
+        for i in range(5):
+            self.client.post('/send_message', json={'recipient_id': peer_id, 'content': f'm{i}'})
+
+        latest = self.client.get(f'/get_messages?user_id={peer_id}&limit=3').get_json()
+        self.assertTrue(latest['has_more'])
+        self.assertEqual([m['content'] for m in latest['messages']], ['m2', 'm3', 'm4'])
+
+        older = self.client.get(
+            f"/get_messages?user_id={peer_id}&limit=3&before_id={latest['messages'][0]['id']}"
+        ).get_json()
+        self.assertTrue(older['has_more'])
+        self.assertEqual([m['content'] for m in older['messages']], ['reply 0', 'm0', 'm1'])
+
+        last_id = latest['messages'][-1]['id']
+        delta = self.client.get(f'/get_messages?user_id={peer_id}&after_id={last_id}').get_json()
+        self.assertEqual(delta['messages'], [])
+        self.client.post('/send_message', json={'recipient_id': peer_id, 'content': 'new'})
+        delta = self.client.get(f'/get_messages?user_id={peer_id}&after_id={last_id}').get_json()
+        self.assertEqual([m['content'] for m in delta['messages']], ['new'])
+        self.assertFalse(delta['has_more'])
+
+    def test_default_page_size(self):
+        peer_id = self.add_peers(1)[0]
+        with self.app.app_context():
+            for i in range(60):
+                db.session.add(Message(sender_id=peer_id, recipient_id=self.me_id, content=f'bulk {i}'))
+            db.session.commit()
+        data = self.client.get(f'/get_messages?user_id={peer_id}').get_json()
+        self.assertEqual(len(data['messages']), 50)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(data['messages'][-1]['content'], 'bulk 59')
+
+class ReadReceiptTestCase(ChatListTestCase):
+    def add_unread(self, peer_id, count):
+        with self.app.app_context():
+            messages = [Message(sender_id=peer_id, recipient_id=self.me_id, content=f'unread {i}') for i in range(count)]
+            db.session.add_all(messages)
+            db.session.commit()
+            rebuild_conversations()
+            return [m.id for m in messages]
+
+    def unread_ids(self, peer_id):
+        with self.app.app_context():
+            return [m.id for m in Message.query.filter_by(sender_id=peer_id, recipient_id=self.me_id, is_read=False)]
+
+    def test_mark_read_up_to_id(self):
+        peer_id = self.add_peers(1)[0]
+        ids = self.add_unread(peer_id, 4)
+        broker = get_broker()
+        after = broker.current_seq()
+
+        data = self.client.post('/mark_read', json={'user_id': peer_id, 'message_id': ids[1]}).get_json()
+        self.assertEqual(data['marked'], 3)
+        self.assertEqual(self.unread_ids(peer_id), ids[2:])
+        chat = self.client.get('/get_chat_list').get_json()['chats'][0]
+        self.assertEqual(chat['unread_count'], 2)
+
+        # Отправитель получает квитанцию о прочтении
+        events, _ = broker.wait(peer_id, after, 0)
+        self.assertEqual([(e[1], e[2]['up_to_id']) for e in events], [('read', ids[1])])
+
+        data = self.client.post('/mark_read', json={'user_id': peer_id}).get_json()
+        self.assertEqual(data['marked'], 2)
+        self.assertEqual(self.unread_ids(peer_id), [])
+        self.assertEqual(self.client.post('/mark_read', json={'user_id': peer_id}).get_json()['marked'], 0)
+
+    def test_marking_is_one_statement_regardless_of_backlog(self):
+        peer_id = self.add_peers(1)[0]
+        self.add_unread(peer_id, 3)
+        with self.app.app_context():
+            with QueryCounter(db.engine) as small:
+                self.client.post('/mark_read', json={'user_id': peer_id})
+        self.add_unread(peer_id, 300)
+        with self.app.app_context():
+            with QueryCounter(db.engine) as large:
+                self.client.post('/mark_read', json={'user_id': peer_id})
+        self.assertEqual(small.count, large.count)
+        self.assertEqual(self.unread_ids(peer_id), [])
+
+    def test_get_messages_marks_incoming_read(self):
+        peer_id = self.add_peers(1)[0]
+        self.add_unread(peer_id, 2)
+        self.client.get(f'/get_messages?user_id={peer_id}')
+        self.assertEqual(self.unread_ids(peer_id), [])
+
+    def test_update_uses_partial_index(self):
+        with self.app.app_context():
+            plan = db.session.execute(text('EXPLAIN QUERY PLAN ' + MARK_READ_QUERY.text),
+                                      {'reader_id': 1, 'peer_id': 2, 'up_to_id': 10}).fetchall()
+        self.assertIn('ix_message_unread', ' '.join(row[-1] for row in plan))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+from sqlalchemy import inspect, text
+from models.user import db, User, Message, normalize_name
+from utils.search import search_users
+from utils.migrations import migrate, check_schema_version, latest_version
+from utils.testing import create_test_app, QueryCounter
+
+class MigrationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        with db.engine.begin() as connection:
+            connection.execute(text("DROP TABLE IF EXISTS schema_version"))
+        self.context.pop()
+
+    def columns(self, table_name):
+        return {column['name'] for column in inspect(db.engine).get_columns(table_name)}
+
+    def test_empty_database_is_created_at_latest_version(self):
+        self.assertEqual(migrate(), [])
+        self.assertEqual(check_schema_version(), (latest_version(), latest_version()))
+        self.assertIn('members_version', self.columns('group'))
+        test_user = User.query.filter_by(email='test@example.com').first()
+        self.assertEqual(test_user.name_search, normalize_name('Test User'))
+        # Точный и префиксный поиск идут по name_search
+        self.assertIn(test_user.id, [user['id'] for user in search_users(0, 'test us')])
+
+    def test_legacy_database_is_upgraded(self):
+        # Схема в состоянии до появления сводок, версии участников, очереди Odoo и индексов
+        db.create_all()
+        with db.engine.begin() as connection:
+            for statement in (
+                'DROP TABLE conversation',
+                'DROP TABLE odoo_outbox',
+                'DROP INDEX ix_message_sender_recipient_id',
+                'DROP INDEX ix_group_message_group_id_id',
+                'ALTER TABLE "group" DROP COLUMN members_version',
+                'ALTER TABLE message DROP COLUMN translation',
+            ):
+                connection.execute(text(statement))
+            connection.execute(text(
+                "INSERT INTO user (name, email, password_hash) VALUES ('A', 'a@example.com', 'x'), ('B', 'b@example.com', 'x')"
+            ))
+            connection.execute(text(
+                "INSERT INTO message (sender_id, recipient_id, content, is_read, message_type) VALUES (1, 2, 'hi', 0, 'text')"
+            ))
+        self.assertEqual(check_schema_version()[0], None)
+
+        applied = migrate()
+        self.assertEqual(len(applied), latest_version())
+        self.assertIn('translation', self.columns('message'))
+        self.assertIn('members_version', self.columns('group'))
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes('message')}
+        self.assertIn('ix_message_sender_recipient_id', indexes)
+        unread = db.session.execute(text("SELECT unread_count FROM conversation WHERE user_id = 2")).scalar()
+        self.assertEqual(unread, 1)
+
+        self.assertEqual(migrate(), [])
+
+    def test_boot_check_is_a_single_query(self):
+        migrate()
+        with QueryCounter(db.engine) as counter:
+            current, latest = check_schema_version()
+        self.assertEqual(current, latest)
+        self.assertEqual(counter.count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
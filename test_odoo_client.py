@@ -0,0 +1,133 @@
+import socket
+import threading
+import time
+import unittest
+import xmlrpc.client
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from utils.odoo_client import OdooClient, OdooUnavailable, OdooAuthError
+
+class KeepAliveHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    rpc_paths = ('/xmlrpc/2/common', '/xmlrpc/2/object')
+
+class FakeOdooServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """Local stand-in for Odoo that counts connections and authenticate calls"""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), requestHandler=KeepAliveHandler, logRequests=False, allow_none=True)
+        self.connections = 0
+        self.auth_calls = 0
+        self.valid_uid = 7
+        self.counter_lock = threading.Lock()
+        self.register_function(self.authenticate, 'authenticate')
+        self.register_function(self.execute_kw, 'execute_kw')
+
+    def process_request(self, request, client_address):
+        with self.counter_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def authenticate(self, db_name, login, password, context):
+        with self.counter_lock:
+            self.auth_calls += 1
+        return self.valid_uid if password == 'secret' else False
+
+    def execute_kw(self, db_name, uid, password, model, method, args, kwargs):
+        if uid != self.valid_uid:
+            raise xmlrpc.client.Fault(3, 'odoo.exceptions.AccessDenied: Access Denied')
+        if method == 'create':
+            return list(range(1, len(args[0]) + 1))
+        return [model, method]
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class OdooClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOdooServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = OdooClient(self.server.url, 'db', 'admin', 'secret')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_uid_and_connection_are_reused(self):
+        for _ in range(20):
+            self.assertEqual(self.client.execute_kw('messenger.message', 'create', [[{}, {}]]), [1, 2])
+        self.assertEqual(self.server.auth_calls, 1)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_reauthenticates_only_on_access_denied(self):
+        self.client.execute_kw('res.partner', 'read', [[1]])
+        self.server.valid_uid = 8
+        self.assertEqual(self.client.execute_kw('res.partner', 'read', [[1]]), ['res.partner', 'read'])
+        self.client.execute_kw('res.partner', 'read', [[1]])
+        self.assertEqual(self.server.auth_calls, 2)
+
+    def test_bad_credentials(self):
+        client = OdooClient(self.server.url, 'db', 'admin', 'wrong')
+        with self.assertRaises(OdooAuthError):
+            client.execute_kw('res.partner', 'read', [[1]])
+
+    def test_thread_safe_sharing(self):
+        errors = []
+
+        def work():
+            try:
+                for _ in range(10):
+                    self.client.execute_kw('messenger.message', 'create', [[{}]])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        # Один транспорт на поток, uid общий для всех
+        self.assertLessEqual(self.server.connections, 4)
+        self.assertEqual(self.server.auth_calls, 1)
+
+class CircuitBreakerTestCase(unittest.TestCase):
+    def test_opens_after_failures_and_retries_after_timeout(self):
+        client = OdooClient(f'http://127.0.0.1:{unused_port()}', 'db', 'admin', 'secret',
+                            timeout=1, failure_threshold=2, reset_timeout=0.2)
+        for _ in range(2):
+            with self.assertRaises(ConnectionRefusedError):
+                client.execute_kw('res.partner', 'read', [[1]])
+        self.assertTrue(client.is_open)
+        with self.assertRaises(OdooUnavailable):
+            client.execute_kw('res.partner', 'read', [[1]])
+
+        time.sleep(0.25)
+        # Пробный вызов снова идет в сеть и при неудаче опять открывает предохранитель
+        with self.assertRaises(ConnectionRefusedError):
+            client.execute_kw('res.partner', 'read', [[1]])
+        with self.assertRaises(OdooUnavailable):
+            client.execute_kw('res.partner', 'read', [[1]])
+
+    def test_faults_do_not_open_the_breaker(self):
+        server = FakeOdooServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            client = OdooClient(server.url, 'db', 'admin', 'secret', failure_threshold=1)
+            server.register_function(lambda *args: (_ for _ in ()).throw(ValueError('bad')), 'execute_kw')
+            with self.assertRaises(xmlrpc.client.Fault):
+                client.execute_kw('res.partner', 'read', [[1]])
+            self.assertFalse(client.is_open)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
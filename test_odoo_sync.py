@@ -0,0 +1,129 @@
+import json
+import unittest
+import xmlrpc.client
+from unittest import mock
+from models.user import db, User, Group, GroupMember, OdooOutbox
+from utils import odoo_sync
+from utils.odoo_sync import drain_outbox, requeue_dead_letters, OUTBOX_MAX_ATTEMPTS
+from utils.testing import create_test_app
+
+class FakeClient:
+    """Stands in for OdooClient and records create calls"""
+    is_open = False
+
+    def __init__(self, fail=None):
+        self.calls = []
+        self.fail = fail
+        self.next_id = 1
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        records = args[0]
+        self.calls.append((model, method, records))
+        if self.fail:
+            raise self.fail(records)
+        ids = list(range(self.next_id, self.next_id + len(records)))
+        self.next_id += len(records)
+        return ids
+
+class OdooOutboxTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', password_hash='x') for i in range(2)]
+            db.session.add_all(users)
+            db.session.flush()
+            group = Group(name='Team', creator_id=users[0].id)
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMember(group_id=group.id, user_id=users[0].id, role='admin'))
+            db.session.commit()
+            self.user_ids = [u.id for u in users]
+            self.group_id = group.id
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.user_ids[0]
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def send(self, count):
+        for i in range(count):
+            self.client.post('/send_message', json={'recipient_id': self.user_ids[1], 'content': f'm{i}'})
+
+    def drain(self, client):
+        with self.app.app_context():
+            return drain_outbox(client=client)
+
+    def statuses(self):
+        with self.app.app_context():
+            return [row.status for row in OdooOutbox.query.order_by(OdooOutbox.id)]
+
+    def test_sends_are_queued_not_sent(self):
+        with mock.patch.object(odoo_sync.odoo_client, 'execute_kw') as execute_kw:
+            self.send(1)
+            self.client.post('/send_group_message', json={'group_id': self.group_id, 'content': 'hello team'})
+        execute_kw.assert_not_called()
+        with self.app.app_context():
+            payloads = [json.loads(row.payload) for row in OdooOutbox.query.order_by(OdooOutbox.id)]
+        self.assertEqual(payloads[0]['recipient_name'], 'User 1')
+        self.assertEqual(payloads[0]['content'], 'm0')
+        self.assertEqual(payloads[1]['group_ext_id'], f'group_{self.group_id}')
+        self.assertEqual(payloads[1]['group_name'], 'Team')
+
+    def test_drain_creates_batch_in_one_call(self):
+        self.send(3)
+        client = FakeClient()
+        self.assertEqual(self.drain(client), 3)
+        self.assertEqual(len(client.calls), 1)
+        model, method, records = client.calls[0]
+        self.assertEqual((model, method), ('messenger.message', 'create'))
+        self.assertEqual([r['content'] for r in records], ['m0', 'm1', 'm2'])
+        self.assertEqual(self.statuses(), ['sent'] * 3)
+        self.assertEqual(self.drain(client), 0)
+
+    def test_failures_back_off_then_dead_letter(self):
+        self.send(1)
+        down = FakeClient(fail=lambda records: ConnectionRefusedError('down'))
+        self.drain(down)
+        self.assertEqual(self.statuses(), ['pending'])
+        # Запись с отложенным повтором не берется раньше времени
+        self.assertEqual(self.drain(down), 0)
+
+        with self.app.app_context():
+            for _ in range(OUTBOX_MAX_ATTEMPTS - 1):
+                OdooOutbox.query.update({'next_attempt_at': db.func.datetime('now', '-1 day')})
+                db.session.commit()
+                drain_outbox(client=down)
+        self.assertEqual(self.statuses(), ['dead'])
+
+        with self.app.app_context():
+            self.assertEqual(requeue_dead_letters(), 1)
+        self.drain(FakeClient())
+        self.assertEqual(self.statuses(), ['sent'])
+
+    def test_open_circuit_leaves_queue_untouched(self):
+        self.send(1)
+        client = FakeClient()
+        client.is_open = True
+        self.assertEqual(self.drain(client), 0)
+        with self.app.app_context():
+            self.assertEqual(OdooOutbox.query.one().attempts, 0)
+
+    def test_rejected_record_does_not_block_batch(self):
+        self.send(3)
+
+        class PickyModels(FakeClient):
+            def execute_kw(self, model, method, args, kwargs=None):
+                if any(r['content'] == 'm1' for r in args[0]):
+                    self.calls.append((model, method, args[0]))
+                    raise xmlrpc.client.Fault(2, 'invalid record')
+                return super().execute_kw(model, method, args, kwargs)
+
+        self.drain(PickyModels())
+        self.assertEqual(self.statuses(), ['sent', 'pending', 'sent'])
+
+if __name__ == '__main__':
+    unittest.main()
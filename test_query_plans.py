@@ -0,0 +1,230 @@
+import hashlib
+import io
+import re
+import tempfile
+import unittest
+from sqlalchemy import event, text
+from models.user import db, User, Contact, Block, Message, Group, GroupMember, GroupMessage
+from utils.conversations import rebuild_conversations
+from utils.uploads import expire_uploads
+from utils.testing import create_test_app
+
+# Полный проход: "SCAN message", "SCAN m" (под псевдонимом) или "SCAN m USING [COVERING] INDEX ..."
+FULL_SCAN = re.compile(r'^SCAN (\S+)')
+# Результаты CTE в плане: "MATERIALIZE my_groups", "CO-ROUTINE my_groups"
+MATERIALIZED = re.compile(r'^(?:MATERIALIZE|CO-ROUTINE) (\S+)')
+# Имена CTE в тексте запроса: "WITH name AS (", ", name AS MATERIALIZED ("
+CTE_NAME = re.compile(r'(?:\bWITH|,)\s+(\w+)\s+AS\s+(?:NOT\s+)?(?:MATERIALIZED\s+)?\(', re.I)
+# Источник и псевдоним: "FROM message m", "JOIN \"group\" AS g"
+SOURCE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?(?:\s+(?:AS\s+)?(\w+))?', re.I)
+NOT_ALIASES = {'where', 'join', 'left', 'inner', 'cross', 'outer', 'on', 'group', 'order', 'limit',
+               'using', 'union', 'natural', 'set', 'values', 'having', 'window'}
+# Явные исключения: таблица (не псевдоним) -> причина
+ALLOWED_SCANS = {}
+
+def full_scans(plan, statement):
+    """
+    Detail lines of EXPLAIN QUERY PLAN rows that walk a whole table or index.
+    SQLite names a scan by the alias used in the statement, so aliases are
+    resolved first; every scan counts except those of a CTE or subquery
+    result (their own rows are checked separately), FTS virtual tables, the
+    constant row and ALLOWED_SCANS.
+    """
+    details = [row[-1] for row in plan]
+    derived = {match.group(1) for match in map(MATERIALIZED.match, details) if match}
+    derived.update(CTE_NAME.findall(statement))
+    sources = {}
+    for table, alias in SOURCE.findall(statement):
+        sources[table] = table
+        if alias and alias.lower() not in NOT_ALIASES:
+            sources[alias] = table
+    scans = []
+    for detail in details:
+        match = FULL_SCAN.match(detail)
+        if not match or 'VIRTUAL TABLE' in detail or detail == 'SCAN CONSTANT ROW':
+            continue
+        source = sources.get(match.group(1), match.group(1))
+        if source in derived or source.startswith('(subquery') or source in ALLOWED_SCANS:
+            continue
+        scans.append(detail)
+    return scans
+
+class FullScanCheckTestCase(unittest.TestCase):
+    """The plan check itself: aliases must not hide a scan"""
+
+    def setUp(self):
+        self.app = create_test_app()
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def scans(self, sql):
+        with self.app.app_context():
+            return full_scans(db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).fetchall(), sql)
+
+    def test_aliased_scan_is_reported(self):
+        self.assertEqual(self.scans("SELECT * FROM message m WHERE m.content = 'x'"), ['SCAN m'])
+        self.assertEqual(self.scans("SELECT * FROM message AS m WHERE m.content = 'x'"), ['SCAN m'])
+        # Так прошел полный проход в CTE списка групп: псевдоним внутри CTE
+        scans = self.scans(
+            "WITH counts AS MATERIALIZED (SELECT gm.group_id, COUNT(*) AS n FROM group_member gm GROUP BY gm.group_id) "
+            'SELECT g.id, c.n FROM counts c JOIN "group" g ON g.id = c.group_id'
+        )
+        self.assertEqual([scan.split()[1] for scan in scans], ['gm'])
+
+    def test_searches_cte_results_and_fts_are_not_reported(self):
+        self.assertEqual(self.scans("SELECT * FROM message m WHERE m.id = 1"), [])
+        self.assertEqual(self.scans(
+            "WITH recent AS MATERIALIZED (SELECT id FROM message WHERE id > 5) SELECT * FROM recent r"
+        ), [])
+        self.assertEqual(self.scans("SELECT rowid FROM message_fts WHERE message_fts MATCH 'x'"), [])
+
+class QueryPlanTestCase(unittest.TestCase):
+    """
+    Exercises every blueprint endpoint, records each SQL statement it runs and
+    checks EXPLAIN QUERY PLAN for it: no statement may walk a whole table or
+    index of the application tables.
+    """
+
+    def setUp(self):
+        self.app = create_test_app()
+        self.uploads = tempfile.TemporaryDirectory()
+        self.app.config['UPLOAD_FOLDER'] = self.uploads.name
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', email_confirmed=True) for i in range(4)]
+            for user in users:
+                user.set_password('password123')
+            db.session.add_all(users)
+            db.session.flush()
+            me, peer, other, stranger = users
+            db.session.add(Contact(user_id=me.id, contact_id=peer.id))
+            db.session.add(Contact(user_id=other.id, contact_id=me.id))
+            db.session.add(Block(user_id=stranger.id, blocked_user_id=me.id))
+            for i in range(3):
+                db.session.add(Message(sender_id=me.id, recipient_id=peer.id, content=f'to peer {i}'))
+                db.session.add(Message(sender_id=peer.id, recipient_id=me.id, content=f'from peer {i}'))
+            group = Group(name='Team', creator_id=me.id)
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMember(group_id=group.id, user_id=me.id, role='admin'))
+            db.session.add(GroupMember(group_id=group.id, user_id=peer.id, role='member'))
+            for i in range(3):
+                db.session.add(GroupMessage(group_id=group.id, sender_id=peer.id, content=f'group {i}'))
+            db.session.commit()
+            rebuild_conversations()
+            self.ids = {'me': me.id, 'peer': peer.id, 'other': other.id, 'stranger': stranger.id, 'group': group.id}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+        self.uploads.cleanup()
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+
+    def exercise_endpoints(self):
+        ids = self.ids
+        c = self.client
+        c.post('/login', data={'email': 'user0@example.com', 'password': 'wrong-password'},
+               headers={'X-Requested-With': 'XMLHttpRequest'})
+        c.get('/confirm-email/unknown-token')
+        self.login(ids['me'])
+
+        c.get('/get_current_user_info')
+        c.get('/get_user_info?user_id=%d' % ids['peer'])
+        c.get('/search_users?query=User')
+        c.get('/search_users?query=ser')
+        c.post('/update_profile', data={'name': 'Me', 'bio': 'hello'})
+
+        c.get('/get_contacts')
+        c.post('/check_contact', json={'contact_id': ids['peer']})
+        c.post('/check_block_status', json={'user_id': ids['stranger']})
+        c.post('/add_contact', json={'contact_id': ids['other']})
+        c.post('/remove_contact', json={'contact_id': ids['other']})
+        c.post('/block_user', json={'user_id': ids['other']})
+        c.post('/unblock_user', json={'user_id': ids['other']})
+
+        c.get('/get_chat_list').get_data()
+        c.get('/get_recent_conversations')
+        sent = c.post('/send_message', json={'recipient_id': ids['peer'], 'content': 'hello'}).get_json()
+        message_id = sent['message']['id']
+        c.get('/get_messages?user_id=%d' % ids['peer'])
+        c.get('/get_messages?user_id=%d&before_id=%d' % (ids['peer'], message_id))
+        c.get('/get_messages?user_id=%d&after_id=1' % ids['peer'])
+        c.get('/export_messages?user_id=%d' % ids['peer']).get_data()
+        c.post('/edit_message', json={'message_id': message_id, 'content': 'edited'})
+        c.get('/search_messages?q=peer')
+        c.post('/mark_read', json={'user_id': ids['peer'], 'message_id': message_id})
+        c.post('/upload_direct_file', data={'recipient_id': str(ids['peer']),
+                                            'file': (io.BytesIO(b'data'), 'note.txt')})
+        upload = c.post('/upload_init', json={'filename': 'big.bin', 'size': 4}).get_json()
+        c.put('/upload_chunk/%s/0' % upload['upload_id'], data=b'data',
+              headers={'X-Chunk-SHA256': hashlib.sha256(b'data').hexdigest()})
+        c.get('/upload_status/%s' % upload['upload_id'])
+        c.post('/upload_direct_file', data={'recipient_id': str(ids['peer']), 'upload_id': upload['upload_id']})
+        c.post('/delete_message', json={'message_id': message_id})
+
+        c.get('/get_user_groups')
+        c.get('/get_users_for_group')
+        c.get('/get_group_info?group_id=%d' % ids['group'])
+        c.get('/get_group_messages?group_id=%d' % ids['group'])
+        c.get('/get_group_messages?group_id=%d&before_id=3' % ids['group'])
+        c.get('/export_group_messages?group_id=%d' % ids['group']).get_data()
+        group_message = c.post('/send_group_message', json={'group_id': ids['group'], 'content': 'hi team'}).get_json()
+        group_message_id = group_message['message']['id']
+        c.post('/edit_group_message', json={'message_id': group_message_id, 'content': 'edited'})
+        c.post('/delete_group_message', json={'message_id': group_message_id})
+        c.post('/mark_group_read', json={'group_id': ids['group']})
+        with self.app.app_context():
+            expire_uploads()
+        c.post('/edit_group', data={'group_id': str(ids['group']), 'name': 'Team 2', 'description': ''})
+        c.post('/add_group_members', json={'group_id': ids['group'], 'user_ids': [ids['other']]})
+        c.post('/set_group_admin', json={'group_id': ids['group'], 'user_id': ids['other']})
+        c.post('/remove_group_admin', json={'group_id': ids['group'], 'user_id': ids['other']})
+        c.post('/kick_group_member', json={'group_id': ids['group'], 'user_id': ids['other']})
+        c.post('/create_group', json={'name': 'Second', 'members': [ids['peer']]})
+
+        self.login(ids['peer'])
+        c.post('/leave_group', json={'group_id': ids['group']})
+        self.login(ids['me'])
+        c.post('/delete_chat', json={'user_id': ids['peer']})
+        c.post('/delete_group', json={'group_id': ids['group']})
+
+    def test_no_full_table_scans(self):
+        statements = {}
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+                statements.setdefault(statement, parameters)
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                self.exercise_endpoints()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+
+            failures = []
+            raw = db.engine.raw_connection()
+            try:
+                cursor = raw.cursor()
+                for statement, parameters in statements.items():
+                    plan = cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                    for detail in full_scans(plan, statement):
+                        failures.append(f"{detail}\n    {' '.join(statement.split())}")
+            finally:
+                raw.close()
+
+        self.assertGreater(len(statements), 40)
+        self.assertEqual(failures, [], '\n' + '\n'.join(failures))
+
+if __name__ == '__main__':
+    unittest.main()
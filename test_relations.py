@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+from models.user import db, User, Block, Contact
+from utils.events import SQLiteEventBus
+from utils.cache import InvalidatingCache
+from utils.relations import load_relations, relation_cache, RELATIONS_CHANGED
+from utils.testing import create_test_app, QueryCounter
+
+class RelationCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', password_hash='x') for i in range(3)]
+            db.session.add_all(users)
+            db.session.flush()
+            self.me, self.peer, self.other = (user.id for user in users)
+            db.session.add(Contact(user_id=self.me, contact_id=self.peer))
+            db.session.add(Block(user_id=self.other, blocked_user_id=self.me))
+            db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.me
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_relations_are_loaded_once(self):
+        with self.app.app_context():
+            relations = relation_cache.get(self.me)
+            self.assertEqual(relations.contacts, {self.peer})
+            self.assertEqual(relations.blocked_by, {self.other})
+            self.assertEqual(relations.blocked, set())
+            with QueryCounter(db.engine) as counter:
+                relation_cache.get(self.me)
+            self.assertEqual(counter.count, 0)
+
+    def test_writes_invalidate_both_users(self):
+        status = self.client.post('/check_block_status', json={'user_id': self.peer}).get_json()
+        self.assertFalse(status['is_blocked_by_you'])
+        self.assertTrue(self.client.post('/check_contact', json={'contact_id': self.peer}).get_json()['is_contact'])
+
+        self.client.post('/block_user', json={'user_id': self.peer})
+        status = self.client.post('/check_block_status', json={'user_id': self.peer}).get_json()
+        self.assertTrue(status['is_blocked_by_you'])
+        self.assertFalse(self.client.post('/check_contact', json={'contact_id': self.peer}).get_json()['is_contact'])
+        with self.app.app_context():
+            self.assertEqual(relation_cache.get(self.peer).blocked_by, {self.me})
+        response = self.client.post('/send_message', json={'recipient_id': self.peer, 'content': 'hi'})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.post('/unblock_user', json={'user_id': self.peer})
+        self.client.post('/add_contact', json={'contact_id': self.peer})
+        self.assertTrue(self.client.post('/check_contact', json={'contact_id': self.peer}).get_json()['is_contact'])
+        response = self.client.post('/send_message', json={'recipient_id': self.peer, 'content': 'hi'})
+        self.assertEqual(response.status_code, 200)
+
+        self.client.post('/remove_contact', json={'contact_id': self.peer})
+        self.assertFalse(self.client.post('/check_contact', json={'contact_id': self.peer}).get_json()['is_contact'])
+
+    def test_send_message_blocked_by_recipient(self):
+        response = self.client.post('/send_message', json={'recipient_id': self.other, 'content': 'hi'})
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('they have blocked you', response.get_json()['error'])
+
+    def test_lru_bound(self):
+        cache = InvalidatingCache(load_relations, max_entries=2)
+        with self.app.app_context():
+            cache.get(self.me)
+            cache.get(self.peer)
+            cache.get(self.me)
+            cache.get(self.other)
+        self.assertEqual(list(cache._entries), [self.me, self.other])
+
+    def test_load_racing_an_invalidation_is_not_stored(self):
+        def load_then_invalidate(user_id):
+            relations = load_relations(user_id)
+            cache.invalidate([user_id])
+            return relations
+
+        cache = InvalidatingCache(load_then_invalidate, max_entries=10)
+        with self.app.app_context():
+            cache.get(self.me)
+        self.assertNotIn(self.me, cache._entries)
+
+    def test_entries_expire_without_a_signal(self):
+        cache = InvalidatingCache(load_relations, max_entries=10, max_age=60)
+        with self.app.app_context():
+            self.assertEqual(cache.get(self.me).blocked, set())
+            # Сигнал об изменении потерялся: запись устарела, но еще моложе max_age
+            db.session.add(Block(user_id=self.me, blocked_user_id=self.peer))
+            db.session.commit()
+            self.assertEqual(cache.get(self.me).blocked, set())
+            value, loaded_at = cache._entries[self.me]
+            cache._entries[self.me] = (value, loaded_at - 60)
+            self.assertEqual(cache.get(self.me).blocked, {self.peer})
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+class CrossWorkerInvalidationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmpdir.name, 'events.db')
+        self.worker_a = SQLiteEventBus(path)
+        self.worker_b = SQLiteEventBus(path)
+
+    def tearDown(self):
+        self.worker_a.close()
+        self.worker_b.close()
+        self.tmpdir.cleanup()
+
+    def test_signal_reaches_other_worker(self):
+        received = []
+        self.worker_b.add_listener(lambda event_type, data: received.append((event_type, data)))
+        self.worker_a.publish([], RELATIONS_CHANGED, {'keys': [1, 2]})
+        self.worker_b.poll()
+        self.assertIn((RELATIONS_CHANGED, {'keys': [1, 2]}), received)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import datetime
+import unittest
+from sqlalchemy import text
+from models.user import db, User, Block, Message, Group, GroupMember, GroupMessage
+from utils.search import build_match_expression, rebuild_search_index, search_users, HIGHLIGHT_START, HIGHLIGHT_END
+from utils.testing import create_test_app
+
+class MessageSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            users = [User(name=f'User {i}', email=f'user{i}@example.com', password_hash='x') for i in range(3)]
+            db.session.add_all(users)
+            db.session.flush()
+            me, peer, stranger = users
+            team = Group(name='Team', creator_id=me.id)
+            other_team = Group(name='Other', creator_id=stranger.id)
+            db.session.add_all([team, other_team])
+            db.session.flush()
+            db.session.add(GroupMember(group_id=team.id, user_id=me.id, role='admin'))
+            db.session.add(GroupMember(group_id=other_team.id, user_id=stranger.id, role='admin'))
+            db.session.add_all([
+                Message(sender_id=me.id, recipient_id=peer.id, content='Встреча завтра в офисе'),
+                Message(sender_id=peer.id, recipient_id=me.id, content='Deployment finished without errors'),
+                Message(sender_id=peer.id, recipient_id=stranger.id, content='Secret deployment plan'),
+                GroupMessage(group_id=team.id, sender_id=me.id, content='Deployment checklist for the team'),
+                GroupMessage(group_id=other_team.id, sender_id=stranger.id, content='Deployment of the other team'),
+            ])
+            db.session.commit()
+            self.me_id, self.peer_id, self.team_id = me.id, peer.id, team.id
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.me_id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def search(self, query, **params):
+        params['q'] = query
+        return self.client.get('/search_messages', query_string=params).get_json()
+
+    def test_only_visible_messages_are_found(self):
+        data = self.search('deploy')
+        found = {(r['kind'], r['snippet'].split()[0].strip(HIGHLIGHT_START + HIGHLIGHT_END)) for r in data['results']}
+        self.assertEqual(found, {('direct', 'Deployment'), ('group', 'Deployment')})
+        group_result = next(r for r in data['results'] if r['kind'] == 'group')
+        self.assertEqual(group_result['group_name'], 'Team')
+        self.assertEqual(group_result['sender_name'], 'User 0')
+
+    def test_cyrillic_prefix_and_snippet(self):
+        data = self.search('встреч')
+        self.assertEqual(len(data['results']), 1)
+        self.assertIn(f'{HIGHLIGHT_START}Встреча{HIGHLIGHT_END}', data['results'][0]['snippet'])
+
+    def test_index_follows_edits_and_deletes(self):
+        sent = self.client.post('/send_message', json={'recipient_id': self.peer_id, 'content': 'pineapple pizza'}).get_json()
+        message_id = sent['message']['id']
+        self.assertEqual(len(self.search('pineapple')['results']), 1)
+
+        self.client.post('/edit_message', json={'message_id': message_id, 'content': 'mango pizza'})
+        self.assertEqual(self.search('pineapple')['results'], [])
+        self.assertEqual(len(self.search('mango')['results']), 1)
+
+        self.client.post('/delete_message', json={'message_id': message_id})
+        self.assertEqual(self.search('mango')['results'], [])
+
+    def test_pagination(self):
+        for i in range(5):
+            self.client.post('/send_message', json={'recipient_id': self.peer_id, 'content': f'report number {i}'})
+        first = self.search('report', limit=3)
+        self.assertTrue(first['has_more'])
+        second = self.search('report', limit=3, offset=first['next_offset'])
+        self.assertFalse(second['has_more'])
+        ids = [r['id'] for r in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_direct_and_group_results_are_merged_by_time(self):
+        with self.app.app_context():
+            base = datetime.datetime(2025, 1, 1)
+            db.session.add_all([
+                Message(sender_id=self.me_id, recipient_id=self.peer_id, content='quarterly old', timestamp=base),
+                GroupMessage(group_id=self.team_id, sender_id=self.me_id, content='quarterly middle',
+                             timestamp=base + datetime.timedelta(hours=1)),
+                Message(sender_id=self.peer_id, recipient_id=self.me_id, content='quarterly quarterly new',
+                        timestamp=base + datetime.timedelta(hours=2)),
+            ])
+            db.session.commit()
+        results = self.search('quarterly')['results']
+        self.assertEqual([(r['kind'], r['timestamp']) for r in results], [
+            ('direct', '2025-01-01T02:00:00'), ('group', '2025-01-01T01:00:00'), ('direct', '2025-01-01T00:00:00')
+        ])
+        second_page = self.search('quarterly', limit=1, offset=1)['results']
+        self.assertEqual(second_page[0]['kind'], 'group')
+
+    def test_fts_syntax_in_input_is_neutralised(self):
+        self.assertEqual(build_match_expression('"deploy" NEAR(x) content:*'), '"deploy"* "NEAR"* "x"* "content"*')
+        self.assertTrue(self.search('"unbalanced')['success'])
+        self.assertEqual(self.search('!!')['results'], [])
+
+    def test_rebuild(self):
+        with self.app.app_context():
+            db.session.execute(text("INSERT INTO message_fts (message_fts) VALUES ('delete-all')"))
+            db.session.commit()
+        self.assertEqual(self.search('встреча')['results'], [])
+        with self.app.app_context():
+            rebuild_search_index()
+        self.assertEqual(len(self.search('встреча')['results']), 1)
+
+class UserSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            names = ['Me', 'Анна Петрова', 'Анна', 'Annabel', 'Joanna', 'Hanna Blocked', 'Anna Blocker', 'Анатолий']
+            users = [User(name=name, email=f'user{i}@example.com', password_hash='x') for i, name in enumerate(names)]
+            db.session.add_all(users)
+            db.session.flush()
+            self.ids = {user.name: user.id for user in users}
+            db.session.add(Block(user_id=self.ids['Me'], blocked_user_id=self.ids['Hanna Blocked']))
+            db.session.add(Block(user_id=self.ids['Anna Blocker'], blocked_user_id=self.ids['Me']))
+            db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.ids['Me']
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def names(self, query):
+        return [user['name'] for user in self.client.get('/search_users', query_string={'query': query}).get_json()['users']]
+
+    def test_exact_then_prefix_then_substring(self):
+        self.assertEqual(self.names('анна'), ['Анна', 'Анна Петрова'])
+        self.assertEqual(self.names('ann'), ['Annabel', 'Joanna'])
+        self.assertEqual(self.names('ПЕТР'), ['Анна Петрова'])
+
+    def test_blocked_users_and_self_are_excluded(self):
+        self.assertEqual(self.names('nna b'), [])
+        self.assertEqual(self.names('me'), [])
+
+    def test_short_query_uses_prefix_only(self):
+        self.assertEqual(self.names('ан'), ['Анатолий', 'Анна', 'Анна Петрова'])
+
+    def test_index_follows_renames(self):
+        self.client.post('/update_profile', data={'name': 'Zed', 'bio': ''})
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.ids['Анна']
+        self.assertEqual(self.names('zed'), ['Zed'])
+        with self.app.app_context():
+            self.assertEqual([u['name'] for u in search_users(self.ids['Анна'], 'me')], [])
+
+    def test_limit(self):
+        with self.app.app_context():
+            self.assertEqual(len(search_users(self.ids['Me'], 'ан', limit=2)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
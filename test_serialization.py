@@ -0,0 +1,114 @@
+import datetime
+import json
+import unittest
+from unittest import mock
+from models.user import db, User, Message, Group, GroupMember, GroupMessage
+from utils import serialization
+from utils.serialization import (MESSAGE_FIELDS, GROUP_MESSAGE_FIELDS, MESSAGE_COLUMNS, GROUP_MESSAGE_COLUMNS,
+                                 row_serializer, serialize_message_row, dumps, stream_json)
+from utils.testing import create_test_app
+
+class MessageSerializationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_test_app()
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            alice = User(name='Alice', email='alice@example.com', password_hash='x')
+            bob = User(name='Bob', email='bob@example.com', password_hash='x')
+            db.session.add_all([alice, bob])
+            db.session.flush()
+            group = Group(name='Team', creator_id=alice.id)
+            db.session.add(group)
+            db.session.flush()
+            db.session.add(GroupMember(group_id=group.id, user_id=alice.id, role='admin'))
+            stamp = datetime.datetime(2024, 5, 1, 12, 30, 15, 123456)
+            db.session.add_all([
+                Message(sender_id=alice.id, recipient_id=bob.id, content='Привет "мир"', timestamp=stamp),
+                Message(sender_id=bob.id, recipient_id=alice.id, content='edited', timestamp=stamp,
+                        is_edited=True, edited_at=stamp.replace(microsecond=0)),
+                Message(sender_id=alice.id, recipient_id=bob.id, content='', message_type='file',
+                        file_path='/uploads/a.png', mime_type='image/png', original_filename='a.png'),
+                GroupMessage(group_id=group.id, sender_id=alice.id, content='hello', timestamp=stamp),
+                GroupMessage(group_id=group.id, sender_id=alice.id, content='x', is_edited=True, edited_at=stamp),
+            ])
+            db.session.commit()
+            self.alice, self.bob, self.group_id = alice.id, bob.id, group.id
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def login(self, user_id):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+
+    def test_rows_match_to_dict(self):
+        cases = [(Message, MESSAGE_FIELDS, MESSAGE_COLUMNS), (GroupMessage, GROUP_MESSAGE_FIELDS, GROUP_MESSAGE_COLUMNS)]
+        with self.app.app_context():
+            for model, fields, columns in cases:
+                expected = [message.to_dict() for message in model.query.order_by(model.id)]
+                rows = db.session.query(*columns).order_by(model.id).all()
+                for native_datetime in (False, True):
+                    if native_datetime and not serialization.orjson_available:
+                        continue
+                    serialize = row_serializer(fields, native_datetime)
+                    encoded = dumps([serialize(row) for row in rows])
+                    self.assertEqual(json.loads(encoded), expected)
+
+    def test_stdlib_fallback_matches_orjson(self):
+        if not serialization.orjson_available:
+            self.skipTest('orjson is not installed')
+        with self.app.app_context():
+            rows = db.session.query(*MESSAGE_COLUMNS).order_by(Message.id).all()
+            fast = dumps([serialize_message_row(row) for row in rows])
+            stdlib_serialize = row_serializer(MESSAGE_FIELDS, native_datetime=False)
+            with mock.patch.object(serialization, 'orjson_available', False):
+                slow = dumps([stdlib_serialize(row) for row in rows])
+        self.assertEqual(json.loads(fast), json.loads(slow))
+
+    def test_listing_endpoints_return_json(self):
+        self.login(self.alice)
+        response = self.client.get(f'/get_messages?user_id={self.bob}')
+        self.assertEqual(response.mimetype, 'application/json')
+        messages = response.get_json()['messages']
+        self.assertEqual([m['content'] for m in messages], ['Привет "мир"', 'edited', ''])
+        self.assertEqual(messages[0]['timestamp'], '2024-05-01T12:30:15.123456')
+        self.assertEqual(messages[1]['edited_at'], '2024-05-01T12:30:15')
+
+        response = self.client.get(f'/get_group_messages?group_id={self.group_id}')
+        data = response.get_json()
+        self.assertTrue(data['success'])
+        self.assertEqual([m['content'] for m in data['messages']], ['hello', 'x'])
+        self.assertEqual(data['members'], [{'id': self.alice, 'name': 'Alice'}])
+
+    def test_stream_json_sends_batches(self):
+        with self.app.test_request_context():
+            with mock.patch.object(serialization, 'STREAM_BATCH_SIZE', 2):
+                response = stream_json({'success': True}, 'items', iter(range(5)), lambda n: {'n': n})
+                chunks = list(response.response)
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(b''.join(chunks)), {'success': True, 'items': [{'n': n} for n in range(5)]})
+
+        with self.app.test_request_context():
+            response = stream_json({}, 'items', iter([]), lambda n: n)
+            self.assertEqual(json.loads(b''.join(response.response)), {'items': []})
+
+    def test_exports_stream_whole_history(self):
+        self.login(self.alice)
+        with mock.patch.object(serialization, 'STREAM_BATCH_SIZE', 1):
+            exported = self.client.get(f'/export_messages?user_id={self.bob}').get_json()
+        paged = self.client.get(f'/get_messages?user_id={self.bob}').get_json()
+        self.assertTrue(exported['success'])
+        self.assertEqual(exported['messages'], paged['messages'])
+
+        exported = self.client.get(f'/export_group_messages?group_id={self.group_id}').get_json()
+        paged = self.client.get(f'/get_group_messages?group_id={self.group_id}').get_json()
+        self.assertEqual(exported['messages'], paged['messages'])
+
+        self.login(self.bob)
+        self.assertEqual(self.client.get(f'/export_group_messages?group_id={self.group_id}').status_code, 403)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import datetime
+import io
+import os
+import shutil
+import subprocess
+import unittest
+from models.user import db, User, Message, GroupMessage
+from utils.blobs import collect_garbage, store_stream, variant_path
+from utils.events import get_broker
+from utils.thumbnails import (pil_available, init_thumbnails, process_upload, publish_variants,
+                              schedule_variants, variant_for)
+from test_files import UploadFolderTestCase
+
+ffmpeg_available = bool(shutil.which('ffmpeg'))
+
+class ThumbnailTestCase(UploadFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.login(self.me)
+        self.photo = f'direct_files/{self.me}_{self.peer}/5c1d.png'
+        self.write(self.photo, b'original')
+
+    def tearDown(self):
+        self.app.config['THUMBNAIL_WORKERS'] = 0
+        init_thumbnails(self.app)
+        super().tearDown()
+
+    def add_message(self, file_path, mime_type):
+        with self.app.app_context():
+            message = Message(sender_id=self.me, recipient_id=self.peer, content='', message_type='file',
+                              file_path=file_path, mime_type=mime_type, original_filename='x')
+            db.session.add(message)
+            db.session.commit()
+            return message.id
+
+    def variants(self, message_id):
+        with self.app.app_context():
+            return db.session.get(Message, message_id).to_dict()['variants']
+
+    def body(self, path):
+        response = self.client.get('/uploads/' + path)
+        data = response.data
+        response.close()
+        return response.status_code, data
+
+    def test_size_parameter(self):
+        # Превью еще нет: оригинал отдается без долгого кеширования, иначе браузер не увидит превью
+        self.assertEqual(self.get(self.photo + '?size=100').headers['Cache-Control'], 'private, no-cache')
+        self.assertEqual(self.get(self.avatar + '?size=100').headers['Cache-Control'], 'private, no-cache')
+        self.write(variant_path(self.photo, 160), b'small')
+        self.write(variant_path(self.photo, 480), b'medium')
+        self.assertEqual(self.body(self.photo + '?size=100'), (200, b'small'))
+        self.assertEqual(self.body(self.photo + '?size=200'), (200, b'medium'))
+        self.assertEqual(self.get(self.photo + '?size=100').headers['Cache-Control'],
+                         'private, max-age=31536000, immutable')
+        # Превью нужного размера нет — отдается оригинал
+        self.assertEqual(self.body(self.photo + '?size=2000'), (200, b'original'))
+        self.assertEqual(self.body(self.photo + '?size=poster'), (200, b'original'))
+        self.assertEqual(self.body(self.photo + '?size=big'), (200, b'original'))
+        self.login(self.outsider)
+        self.assertEqual(self.body(self.photo + '?size=100')[0], 403)
+
+    def test_video_poster(self):
+        self.write(variant_path(self.video, 'poster'), b'frame')
+        self.assertEqual(self.body(self.video + '?size=poster'), (200, b'frame'))
+        self.assertEqual(self.body(self.video + '?size=2000'), (200, b'frame'))
+        with self.app.app_context():
+            self.assertEqual(variant_for(self.video, None), self.video)
+
+    def test_without_workers_nothing_is_scheduled(self):
+        with self.app.app_context():
+            self.assertIsNone(schedule_variants(self.photo, 'image/png'))
+        self.app.config['THUMBNAIL_WORKERS'] = 1
+        init_thumbnails(self.app)
+        with self.app.app_context():
+            self.assertIsNone(schedule_variants(self.photo, 'application/pdf'))
+
+    def test_attachment_without_previews(self):
+        message_id = self.add_message(self.photo, 'application/pdf')
+        self.assertIsNone(self.variants(message_id))
+        self.assertEqual(process_upload(self.app, self.photo, 'application/pdf', Message, message_id), [])
+        self.assertEqual(self.variants(message_id), '')
+
+    def test_variants_are_published(self):
+        message_id = self.add_message(self.photo, 'image/png')
+        broker = get_broker()
+        after = broker.current_seq()
+        with self.app.app_context():
+            group_message = GroupMessage(group_id=self.group_id, sender_id=self.me, content='', message_type='file',
+                                         file_path=self.group_file, mime_type='image/png')
+            db.session.add(group_message)
+            db.session.commit()
+            group_message_id = group_message.id
+            publish_variants(Message, message_id, ['160', '480'])
+            publish_variants(GroupMessage, group_message_id, ['poster'])
+            publish_variants(Message, message_id, [])
+        events, _ = broker.wait(self.peer, after, 0)
+        self.assertEqual([(e[1], e[2]) for e in events], [('message_variants', {
+            'id': message_id, 'variants': '160,480', 'sender_id': self.me, 'recipient_id': self.peer
+        })])
+        events, _ = broker.wait(self.me, after, 0)
+        self.assertEqual([e[1] for e in events], ['message_variants', 'group_message_variants'])
+        self.assertEqual(events[1][2], {'id': group_message_id, 'variants': 'poster', 'group_id': self.group_id})
+
+    def test_variants_are_kept_with_their_upload(self):
+        message_id = self.add_message(self.photo, 'image/png')
+        with self.app.app_context():
+            store_stream(io.BytesIO(b'medium'), os.path.join(self.uploads.name, variant_path(self.photo, 480)))
+            self.assertEqual(collect_garbage(datetime.timedelta(0)), (0, 0))
+            Message.query.filter_by(id=message_id).update({'file_path': None})
+            db.session.commit()
+            self.assertEqual(collect_garbage(datetime.timedelta(0)), (1, 1))
+        self.assertFalse(os.path.exists(os.path.join(self.uploads.name, variant_path(self.photo, 480))))
+
+    def test_plain_variant_files_are_collected(self):
+        # Превью, записанные без жестких ссылок, — обычные файлы, не ссылки на блоб
+        message_id = self.add_message(self.photo, 'image/png')
+        self.write(variant_path(self.photo, 160), b'small')
+        self.write(variant_path(self.avatar, 160), b'avatar')
+        with self.app.app_context():
+            User.query.filter_by(id=self.peer).update({'avatar_path': self.avatar})
+            db.session.commit()
+            self.assertEqual(collect_garbage(datetime.timedelta(0)), (0, 0))
+            db.session.delete(db.session.get(Message, message_id))
+            User.query.filter_by(id=self.peer).update({'avatar_path': None})
+            db.session.commit()
+            self.assertEqual(collect_garbage(), (0, 0))
+            self.assertEqual(collect_garbage(datetime.timedelta(0), dry_run=True), (2, 0))
+            self.assertEqual(collect_garbage(datetime.timedelta(0)), (2, 0))
+        self.assertFalse(os.path.exists(os.path.join(self.uploads.name, variant_path(self.photo, 160))))
+        self.assertFalse(os.path.exists(os.path.join(self.uploads.name, variant_path(self.avatar, 160))))
+        # Сами файлы, сохраненные до хранилища блобов, остаются
+        self.assertTrue(os.path.exists(os.path.join(self.uploads.name, self.photo)))
+
+    @unittest.skipUnless(pil_available, 'Pillow is not installed')
+    def test_image_thumbnails_in_worker_pool(self):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGBA', (1200, 600), (255, 0, 0, 128)).save(buffer, 'PNG')
+        self.write(self.photo, buffer.getvalue())
+        message_id = self.add_message(self.photo, 'image/png')
+        self.app.config['THUMBNAIL_WORKERS'] = 1
+        init_thumbnails(self.app)
+        after = get_broker().current_seq()
+        with self.app.app_context():
+            future = schedule_variants(self.photo, 'image/png', Message, message_id)
+        self.assertEqual(future.result(timeout=30), ['160', '480', '960'])
+        self.assertEqual(self.variants(message_id), '160,480,960')
+        events, _ = get_broker().wait(self.peer, after, 0)
+        self.assertEqual([(e[1], e[2]['variants']) for e in events], [('message_variants', '160,480,960')])
+        with Image.open(os.path.join(self.uploads.name, variant_path(self.photo, 480))) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', (480, 240)))
+
+    @unittest.skipUnless(ffmpeg_available, 'ffmpeg is not installed')
+    def test_video_poster_frame(self):
+        video = os.path.join(self.uploads.name, self.video)
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc=duration=2:size=320x240:rate=10',
+                        video], check=True)
+        message_id = self.add_message(self.video, 'video/mp4')
+        names = process_upload(self.app, self.video, 'video/mp4', Message, message_id)
+        self.assertEqual(names[0], 'poster')
+        self.assertTrue(os.path.getsize(os.path.join(self.uploads.name, variant_path(self.video, 'poster'))) > 0)
+        self.assertEqual(self.variants(message_id), ','.join(names))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+from flask import current_app
+from models.user import db, User, Group, Message, GroupMessage
+
+# Блоки, которыми файл одновременно пишется на диск и хешируется
+HASH_BLOCK_SIZE = 64 * 1024
+# Папки UPLOAD_FOLDER, файлы которых ссылаются на блобы (пути из file_path/avatar_path)
+LINK_FOLDERS = ('direct_files', 'group_files', 'avatars')
+# Ссылки и блобы моложе этого не собираются: строка сообщения может быть еще не закоммичена
+BLOB_GRACE = timedelta(hours=1)
+# Производные файлы (превью) лежат рядом с исходным: <path>@<name>.jpg; secure_filename и uuid не дают '@' в именах
+VARIANT_SEPARATOR = '@'
+
+# Content-addressed storage: every uploaded file is stored once as
+# blobs/<sha[:2]>/<sha256> and the paths kept in Message.file_path,
+# GroupMessage.file_path and the avatar columns are hard links to it. URLs and
+# the path-based access checks stay the same; a blob's reference count is its
+# link count, and collect_garbage drops links no column refers to.
+
+def blob_folder():
+    """Blob store root; inside UPLOAD_FOLDER so that hard links to it are possible"""
+    return current_app.config.get('UPLOAD_BLOB_FOLDER') or os.path.join(
+        current_app.config['UPLOAD_FOLDER'], 'blobs'
+    )
+
+def blob_path(digest):
+    return os.path.join(blob_folder(), digest[:2], digest)
+
+def variant_path(path, name):
+    """Path of the derived file name (a thumbnail size or 'poster') of the upload at path"""
+    return f"{path}{VARIANT_SEPARATOR}{name}.jpg"
+
+def temp_path():
+    """A fresh name next to the blobs: files written there can become blobs without copying"""
+    folder = os.path.join(blob_folder(), 'tmp')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, uuid.uuid4().hex)
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def store_stream(stream, full_path):
+    """
+    Saves the file read from stream at full_path, hashing it while it is
+    written. Returns the SHA-256 hex digest.
+    """
+    temp = temp_path()
+    digest = hashlib.sha256()
+    try:
+        with open(temp, 'wb') as f:
+            for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+                f.write(block)
+        _place(temp, digest.hexdigest(), full_path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return digest.hexdigest()
+
+def store_file(source, full_path, keep_source=False):
+    """
+    Moves the finished file at source to full_path through the store; returns
+    its digest. With keep_source the file at source is left in place.
+    """
+    digest = file_digest(source)
+    _place(source, digest, full_path, keep_source)
+    return digest
+
+def _place(source, digest, full_path, keep_source=False):
+    """
+    Makes full_path a link to the blob of digest. If the blob is new, source
+    becomes it; otherwise source is dropped (unless keep_source). Returns
+    True if the content was already stored.
+    """
+    blob = blob_path(digest)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    try:
+        os.link(source, blob)
+        existed = False
+    except FileExistsError:
+        existed = True
+    except OSError as e:
+        # ФС без жестких ссылок (или другой раздел): файл хранится как есть
+        logging.warning(f"Hard links unavailable, storing {full_path} without deduplication: {e}")
+        return _keep(source, full_path, keep_source)
+    if not existed and not keep_source:
+        return _keep(source, full_path)
+
+    link = temp_path()
+    try:
+        os.link(blob, link)
+    except FileNotFoundError:
+        # Блоб собран сборщиком мусора между проверками — храним файл без дедупликации
+        return _keep(source, full_path, keep_source)
+    os.replace(link, full_path)
+    if existed and not keep_source and os.path.abspath(source) != os.path.abspath(full_path):
+        os.remove(source)
+    return existed
+
+def _keep(source, full_path, keep_source=False):
+    if os.path.abspath(source) != os.path.abspath(full_path):
+        if keep_source:
+            shutil.copyfile(source, full_path)
+        else:
+            shutil.move(source, full_path)
+    return False
+
+def _normalize(path):
+    path = path.replace('\\', '/').lstrip('/')
+    return path[len('uploads/'):] if path.startswith('uploads/') else path
+
+def referenced_paths():
+    """Every upload path a message or avatar column refers to"""
+    queries = (
+        db.session.query(Message.file_path).filter(Message.file_path.isnot(None)),
+        db.session.query(GroupMessage.file_path).filter(GroupMessage.file_path.isnot(None)),
+        db.session.query(User.avatar_path).filter(User.avatar_path.isnot(None)),
+        db.session.query(Group.avatar_path).filter(Group.avatar_path.isnot(None)),
+    )
+    paths = set()
+    for query in queries:
+        paths.update(_normalize(path) for (path,) in query.execution_options(yield_per=1000))
+    return paths
+
+def _walk(folder):
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            yield os.path.join(dirpath, name)
+
+def _blobs():
+    """(st_dev, st_ino) -> [blob path, stat] for every stored blob"""
+    blobs = {}
+    root = blob_folder()
+    if not os.path.isdir(root):
+        return blobs
+    for prefix in os.listdir(root):
+        if prefix == 'tmp':
+            continue
+        for path in _walk(os.path.join(root, prefix)):
+            st = os.stat(path)
+            blobs[(st.st_dev, st.st_ino)] = [path, st]
+    return blobs
+
+def _link_files():
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for folder in LINK_FOLDERS:
+        for path in _walk(os.path.join(upload_folder, folder)):
+            yield path, os.path.relpath(path, upload_folder).replace(os.sep, '/')
+
+def collect_garbage(grace=BLOB_GRACE, dry_run=False):
+    """
+    Removes store links that no file_path/avatar_path refers to (variants go
+    together with their upload), then blobs left without links. Only files that
+    are links to a blob are touched, and variants, which may be plain files
+    (written without hard links or before the store); anything settled for
+    less than grace (st_ctime changes whenever a link is added or removed) is
+    kept, so a file saved for a message that is not yet committed survives.
+    Returns (links and variant files removed, blobs removed).
+    """
+    cutoff = time.time() - grace.total_seconds()
+    blobs = _blobs()
+    referenced = referenced_paths()
+    unlinked = {}
+    plain_variants = 0
+
+    for path, relative in _link_files():
+        st = os.lstat(path)
+        key = (st.st_dev, st.st_ino)
+        source, separator, _ = relative.partition(VARIANT_SEPARATOR)
+        # Файлы без блоба — загрузки до хранилища, их не трогаем; превью же без исходника не нужны
+        if (key not in blobs and not separator) or source in referenced or st.st_ctime > cutoff:
+            continue
+        if not dry_run:
+            os.remove(path)
+        if key in blobs:
+            unlinked[key] = unlinked.get(key, 0) + 1
+        else:
+            plain_variants += 1
+
+    removed = 0
+    for key, (path, st) in blobs.items():
+        # Последняя ссылка — сам блоб
+        if st.st_nlink - unlinked.get(key, 0) > 1 or st.st_ctime > cutoff:
+            continue
+        if not dry_run:
+            os.remove(path)
+        removed += 1
+
+    # Остатки оборванных сохранений (st_ctime: у свежей ссылки на старый блоб mtime старый)
+    temp_folder = os.path.join(blob_folder(), 'tmp')
+    if not dry_run and os.path.isdir(temp_folder):
+        for path in _walk(temp_folder):
+            if os.stat(path).st_ctime < cutoff:
+                os.remove(path)
+
+    links = sum(unlinked.values()) + plain_variants
+    logging.info(f"Сборка блобов: удалено ссылок {links}, блобов {removed}")
+    return links, removed
+
+def deduplicate_uploads():
+    """
+    Moves files saved before the blob store into it: identical files become
+    links to one blob. Returns the number of files whose copy was dropped.
+    """
+    blobs = _blobs()
+    merged = 0
+    for path, _ in _link_files():
+        st = os.lstat(path)
+        if os.path.islink(path) or (st.st_dev, st.st_ino) in blobs:
+            continue
+        if _place(path, file_digest(path), path):
+            merged += 1
+        st = os.stat(path)
+        blobs[(st.st_dev, st.st_ino)] = [path, st]
+    logging.info(f"Дедупликация загрузок: объединено файлов {merged}")
+    return merged
@@ -0,0 +1,82 @@
+import collections
+import logging
+import threading
+import time
+from utils.events import add_listener, publish
+
+# Сколько секунд запись живет без сигнала: если событие с другого воркера
+# потерялось или опоздало, устаревшие права доступа продержатся не дольше этого
+CACHE_MAX_AGE = 60
+
+class InvalidatingCache:
+    """
+    Per-process LRU cache of values produced by loader(key), with explicit
+    invalidation.
+
+    Writers call changed() after commit: it drops the keys here and publishes
+    the signal on the event bus so that every other worker drops them too.
+    Every invalidation bumps a generation counter, and a load that started
+    before it is not stored, so a reader cannot put data it read before the
+    commit back into the cache. Entries older than max_age seconds are
+    reloaded even without a signal, which bounds the damage of a lost one.
+    """
+
+    def __init__(self, loader, max_entries, signal=None, max_age=CACHE_MAX_AGE):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.signal = signal
+        self.max_age = max_age
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        if signal:
+            add_listener(self._on_event)
+
+    def get(self, key):
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, loaded_at = entry
+                if now - loaded_at < self.max_age:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            generation = self._generation
+
+        value = self.loader(key)
+        with self._lock:
+            if generation == self._generation:
+                # Возраст считается от начала загрузки: данные прочитаны не раньше
+                self._entries[key] = (value, now)
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, keys):
+        """Drops keys in this process only"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def changed(self, keys):
+        """Drops keys in this process and signals the other workers"""
+        keys = list(keys)
+        self.invalidate(keys)
+        if self.signal:
+            publish([], self.signal, {'keys': keys})
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def _on_event(self, event_type, data):
+        if event_type == self.signal:
+            self.invalidate(data.get('keys', []))
+            logging.debug(f"{self.signal}: cache invalidated for {data.get('keys')}")
@@ -0,0 +1,179 @@
+import logging
+from sqlalchemy import text, or_, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.user import db, Message, Conversation
+
+# Максимальная длина превью последнего сообщения в списке чатов
+PREVIEW_LENGTH = 255
+# Верхняя граница id для отметки прочтения всего диалога
+MAX_MESSAGE_ID = 2 ** 63 - 1
+
+def make_preview(content):
+    """Обрезает текст сообщения до длины превью"""
+    if content is None:
+        return ''
+    return content[:PREVIEW_LENGTH]
+
+def _pair_filter(user_id, peer_id):
+    return or_(
+        and_(Message.sender_id == user_id, Message.recipient_id == peer_id),
+        and_(Message.sender_id == peer_id, Message.recipient_id == user_id)
+    )
+
+def record_message(message):
+    """
+    Обновляет сводки обоих участников после добавления нового сообщения.
+    Вызывается после flush() и до commit(), в той же транзакции.
+    """
+    sender_id = int(message.sender_id)
+    recipient_id = int(message.recipient_id)
+    preview = make_preview(message.content)
+    sides = [(sender_id, recipient_id, 0)]
+    if sender_id != recipient_id:
+        sides.append((recipient_id, sender_id, 1))
+    for user_id, peer_id, unread_increment in sides:
+        stmt = sqlite_insert(Conversation).values(
+            user_id=user_id,
+            peer_id=peer_id,
+            last_message_id=message.id,
+            last_timestamp=message.timestamp,
+            last_preview=preview,
+            unread_count=unread_increment
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'peer_id'],
+            set_={
+                'last_message_id': stmt.excluded.last_message_id,
+                'last_timestamp': stmt.excluded.last_timestamp,
+                'last_preview': stmt.excluded.last_preview,
+                'unread_count': Conversation.unread_count + unread_increment
+            }
+        )
+        db.session.execute(stmt)
+
+def refresh_conversation(user_id, peer_id):
+    """
+    Пересчитывает сводки пары по таблице message (например, после удаления
+    сообщения). Если сообщений не осталось, сводки удаляются.
+    """
+    user_id, peer_id = int(user_id), int(peer_id)
+    last_message = Message.query.filter(_pair_filter(user_id, peer_id)).order_by(
+        Message.timestamp.desc(), Message.id.desc()
+    ).first()
+    if not last_message:
+        delete_conversation(user_id, peer_id)
+        return
+    sides = {(user_id, peer_id), (peer_id, user_id)}
+    for owner_id, other_id in sides:
+        unread_count = 0
+        if owner_id != other_id:
+            unread_count = Message.query.filter_by(
+                sender_id=other_id,
+                recipient_id=owner_id,
+                is_read=False
+            ).count()
+        stmt = sqlite_insert(Conversation).values(
+            user_id=owner_id,
+            peer_id=other_id,
+            last_message_id=last_message.id,
+            last_timestamp=last_message.timestamp,
+            last_preview=make_preview(last_message.content),
+            unread_count=unread_count
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'peer_id'],
+            set_={
+                'last_message_id': stmt.excluded.last_message_id,
+                'last_timestamp': stmt.excluded.last_timestamp,
+                'last_preview': stmt.excluded.last_preview,
+                'unread_count': stmt.excluded.unread_count
+            }
+        )
+        db.session.execute(stmt)
+
+def update_preview(message):
+    """Обновляет превью, если отредактированное сообщение — последнее в диалоге"""
+    Conversation.query.filter_by(last_message_id=message.id).filter(
+        Conversation.user_id.in_([int(message.sender_id), int(message.recipient_id)])
+    ).update({'last_preview': make_preview(message.content)}, synchronize_session=False)
+
+# Литерал is_read = 0 (а не параметр) позволяет SQLite выбрать частичный индекс ix_message_unread
+MARK_READ_QUERY = text("""
+    UPDATE message SET is_read = 1
+    WHERE recipient_id = :reader_id AND sender_id = :peer_id AND is_read = 0 AND id <= :up_to_id
+""")
+
+def mark_messages_read(reader_id, peer_id, up_to_id=None):
+    """
+    Отмечает прочитанными входящие сообщения собеседника с id <= up_to_id
+    (все, если up_to_id не задан) одним UPDATE, без загрузки строк в сессию,
+    и обновляет счетчик в сводке. Возвращает число отмеченных сообщений.
+    Вызывается до commit().
+    """
+    reader_id, peer_id = int(reader_id), int(peer_id)
+    marked = db.session.execute(MARK_READ_QUERY, {
+        'reader_id': reader_id,
+        'peer_id': peer_id,
+        'up_to_id': int(up_to_id) if up_to_id is not None else MAX_MESSAGE_ID
+    }).rowcount
+    if up_to_id is None:
+        mark_conversation_read(reader_id, peer_id)
+    elif marked:
+        Conversation.query.filter_by(user_id=reader_id, peer_id=peer_id).update(
+            {'unread_count': db.func.max(Conversation.unread_count - marked, 0)}, synchronize_session=False
+        )
+    return marked
+
+def mark_conversation_read(user_id, peer_id):
+    """Сбрасывает счетчик непрочитанных у пользователя в диалоге с собеседником"""
+    Conversation.query.filter_by(
+        user_id=int(user_id),
+        peer_id=int(peer_id)
+    ).update({'unread_count': 0}, synchronize_session=False)
+
+def delete_conversation(user_id, peer_id):
+    """Удаляет сводки пары с обеих сторон"""
+    user_id, peer_id = int(user_id), int(peer_id)
+    Conversation.query.filter(or_(
+        and_(Conversation.user_id == user_id, Conversation.peer_id == peer_id),
+        and_(Conversation.user_id == peer_id, Conversation.peer_id == user_id)
+    )).delete(synchronize_session=False)
+
+# Полное восстановление сводок по существующим сообщениям
+REBUILD_QUERY = text(f"""
+    INSERT INTO conversation (user_id, peer_id, last_message_id, last_timestamp, last_preview, unread_count)
+    SELECT owner_id, peer_id, id, timestamp, substr(content, 1, {PREVIEW_LENGTH}), unread_count
+    FROM (
+        SELECT
+            owner_id, peer_id, id, timestamp, content,
+            ROW_NUMBER() OVER (
+                PARTITION BY owner_id, peer_id ORDER BY timestamp DESC, id DESC
+            ) AS rn,
+            SUM(CASE WHEN incoming = 1 AND is_read = 0 THEN 1 ELSE 0 END) OVER (
+                PARTITION BY owner_id, peer_id
+            ) AS unread_count
+        FROM (
+            SELECT sender_id AS owner_id, recipient_id AS peer_id, id, timestamp, content, is_read, 0 AS incoming
+            FROM message
+            UNION ALL
+            SELECT recipient_id AS owner_id, sender_id AS peer_id, id, timestamp, content, is_read, 1 AS incoming
+            FROM message
+            WHERE recipient_id != sender_id
+        )
+    )
+    WHERE rn = 1
+""")
+
+def rebuild_conversations():
+    """Пересобирает таблицу conversation из строк message. Возвращает число сводок."""
+    try:
+        db.session.execute(text("DELETE FROM conversation"))
+        db.session.execute(REBUILD_QUERY)
+        db.session.commit()
+        count = Conversation.query.count()
+        logging.info(f"Сводки диалогов пересобраны: {count}")
+        return count
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Ошибка при пересборке сводок диалогов: {str(e)}")
+        raise
@@ -0,0 +1,259 @@
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Сколько последних событий хранится для переподключения по Last-Event-ID
+HISTORY_SIZE = 2000
+# Как часто воркер проверяет общую таблицу событий (секунды)
+POLL_INTERVAL = 0.05
+# Сколько строк оставлять в общей таблице событий при очистке
+RETAIN_ROWS = 20000
+
+class EventBroker:
+    """
+    In-process publish/subscribe broker for live updates.
+
+    Every event gets an id of the form "<epoch>-<seq>", where epoch identifies
+    the broker instance. A subscriber resumes from the last id it saw; if that
+    id belongs to another epoch or has already left the history buffer, the
+    subscriber is told to resynchronise instead of silently missing events.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.epoch = str(int(time.time() * 1000))
+        self._condition = threading.Condition()
+        self._history = collections.deque(maxlen=history_size)
+        self._seq = 0
+        # Events at or below this sequence are not available for replay
+        self._floor = 0
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Calls callback(event_type, data) for every event this process sees"""
+        self._listeners.append(callback)
+
+    def _append(self, seq, recipients, event_type, data):
+        """Adds an event to the history; the caller holds the condition"""
+        if len(self._history) == self._history.maxlen:
+            self._floor = self._history[0][0]
+        self._history.append((seq, recipients, event_type, data))
+        self._seq = seq
+        for callback in self._listeners:
+            try:
+                callback(event_type, data)
+            except Exception as e:
+                logging.error(f"Event listener error for {event_type}: {str(e)}")
+
+    def publish(self, user_ids, event_type, data):
+        """Stores an event addressed to user_ids and wakes up waiting subscribers"""
+        recipients = frozenset(int(uid) for uid in user_ids)
+        with self._condition:
+            self._append(self._seq + 1, recipients, event_type, data)
+            self._condition.notify_all()
+            return f"{self.epoch}-{self._seq}"
+
+    def parse_event_id(self, event_id):
+        """Returns the sequence number for an id of this broker, or None if unknown"""
+        if not event_id:
+            return None
+        epoch, _, seq = str(event_id).partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def current_seq(self):
+        with self._condition:
+            return self._seq
+
+    def is_resumable(self, seq):
+        """Whether every event after seq is still in the history buffer"""
+        with self._condition:
+            return self._floor <= seq <= self._seq
+
+    def _collect(self, user_id, after_seq):
+        events = []
+        for seq, recipients, event_type, data in self._history:
+            if seq > after_seq and user_id in recipients:
+                events.append((f"{self.epoch}-{seq}", event_type, data))
+        return events
+
+    def wait(self, user_id, after_seq, timeout):
+        """
+        Blocks until there are events for user_id after after_seq or the timeout
+        expires. Returns (events, new_after_seq).
+        """
+        user_id = int(user_id)
+        with self._condition:
+            if self._seq <= after_seq:
+                self._condition.wait(timeout)
+            events = self._collect(user_id, after_seq)
+            return events, self._seq
+
+class SQLiteEventBus(EventBroker):
+    """
+    Fan-out between worker processes through a shared SQLite file.
+
+    publish() appends a row to the event table; every process polls the table
+    for rows it has not seen and feeds them into its local history, so a
+    subscriber connected to any worker receives events published by any other.
+    Row ids are global, which also lets a client resume on a different worker.
+    """
+
+    def __init__(self, path, history_size=HISTORY_SIZE, poll_interval=POLL_INTERVAL):
+        super().__init__(history_size)
+        self.path = path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._poll_lock = threading.Lock()
+        self._poller = None
+        self._stopped = threading.Event()
+        self._polls = 0
+
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS event_bus_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS event_bus (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipients TEXT NOT NULL,
+                event_type TEXT NOT NULL,
+                data TEXT NOT NULL
+            )
+        """)
+        # Эпоха хранится в файле, чтобы все воркеры выдавали одинаковые id
+        conn.execute("INSERT OR IGNORE INTO event_bus_meta (key, value) VALUES ('epoch', ?)",
+                     (uuid.uuid4().hex[:12],))
+        self.epoch = conn.execute("SELECT value FROM event_bus_meta WHERE key = 'epoch'").fetchone()[0]
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM event_bus").fetchone()[0]
+        # Старые события не загружаются в память: переподключение к ним даст resync
+        self._seq = self._floor = last_id
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def publish(self, user_ids, event_type, data):
+        recipients = sorted({int(uid) for uid in user_ids})
+        cursor = self._connect().execute(
+            "INSERT INTO event_bus (recipients, event_type, data) VALUES (?, ?, ?)",
+            (json.dumps(recipients), event_type, json.dumps(data))
+        )
+        # Local subscribers should not wait for the next poll tick
+        self.poll()
+        return f"{self.epoch}-{cursor.lastrowid}"
+
+    def poll(self):
+        """Moves rows published since the last poll into the local history"""
+        with self._poll_lock:
+            rows = self._connect().execute(
+                "SELECT id, recipients, event_type, data FROM event_bus WHERE id > ? ORDER BY id",
+                (self._seq,)
+            ).fetchall()
+            if rows:
+                with self._condition:
+                    for row_id, recipients, event_type, data in rows:
+                        self._append(row_id, frozenset(json.loads(recipients)), event_type, json.loads(data))
+                    self._condition.notify_all()
+            self._polls += 1
+            if self._polls % 1000 == 0:
+                self._connect().execute("DELETE FROM event_bus WHERE id <= ?", (self._seq - RETAIN_ROWS,))
+            return len(rows)
+
+    def _poll_forever(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"Event bus poll error: {str(e)}")
+
+    def close(self):
+        """Stops the background poller"""
+        self._stopped.set()
+        if self._poller is not None:
+            self._poller.join()
+
+    def _start_poller(self):
+        # Опрос запускается только в процессах, где есть подписчики или слушатели
+        if self._poller is None:
+            with self._poll_lock:
+                if self._poller is None:
+                    self._poller = threading.Thread(target=self._poll_forever, name='event-bus-poller', daemon=True)
+                    self._poller.start()
+
+    def add_listener(self, callback):
+        super().add_listener(callback)
+        self._start_poller()
+
+    def wait(self, user_id, after_seq, timeout):
+        self._start_poller()
+        return super().wait(user_id, after_seq, timeout)
+
+BACKENDS = {
+    'memory': lambda app: EventBroker(),
+    'sqlite': lambda app: SQLiteEventBus(
+        app.config.get('EVENT_BUS_PATH') or os.path.join(app.instance_path, 'events.db')
+    ),
+}
+
+broker = EventBroker()
+# Слушатели всех событий процесса; переносятся на брокер, выбранный init_events
+_listeners = []
+
+def init_events(app):
+    """
+    Selects the fan-out backend from app.config['EVENT_BUS']: 'memory' for a
+    single process, 'sqlite' when several workers serve the app. app.py sets
+    'sqlite' unless the EVENT_BUS environment variable says otherwise; an app
+    without the setting (tests) gets 'memory'.
+    """
+    global broker
+    backend = app.config.get('EVENT_BUS', 'memory')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EVENT_BUS backend: {backend}")
+    broker = BACKENDS[backend](app)
+    for callback in _listeners:
+        broker.add_listener(callback)
+    logging.info(f"Event bus backend: {backend}")
+    return broker
+
+def get_broker():
+    return broker
+
+def add_listener(callback):
+    """
+    Registers callback(event_type, data) for every event published in any
+    worker, including events with no recipients (internal signals).
+    """
+    _listeners.append(callback)
+    broker.add_listener(callback)
+
+def publish(user_ids, event_type, data):
+    """Publishes an event to the given users; never raises into the caller"""
+    try:
+        return broker.publish(user_ids, event_type, data)
+    except Exception as e:
+        logging.error(f"Error publishing {event_type} event: {str(e)}")
+        return None
+
+def format_sse(event_id, event_type, data):
+    """Formats one Server-Sent Events frame"""
+    frame = ''
+    if event_id:
+        frame += f"id: {event_id}\n"
+    frame += f"event: {event_type}\n"
+    frame += f"data: {json.dumps(data)}\n\n"
+    return frame
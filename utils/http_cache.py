@@ -0,0 +1,26 @@
+import hashlib
+from flask import current_app, request
+
+# Меняется вместе с форматом ответов, чтобы старые ETag клиентов не совпали с новыми
+ETAG_FORMAT = 1
+
+def version_etag(*parts):
+    """
+    ETag built from version counters and ids instead of the response body.
+    parts must change whenever the response would: include the endpoint name,
+    the viewer and every counter the body depends on.
+    """
+    digest = hashlib.blake2b(repr((ETAG_FORMAT,) + parts).encode('utf-8'), digest_size=12)
+    return digest.hexdigest()
+
+def not_modified(etag):
+    """304 response if the client already has this version, otherwise None"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    return tag_response(current_app.response_class(status=304), etag)
+
+def tag_response(response, etag):
+    """Attaches the ETag; the browser revalidates it on every request (no-cache)"""
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
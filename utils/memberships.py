@@ -0,0 +1,39 @@
+from types import MappingProxyType
+from models.user import db, GroupMember
+from utils.cache import InvalidatingCache
+
+# Сколько групп держать в кеше процесса
+MEMBERSHIP_CACHE_SIZE = 5000
+# Внутренний сигнал шины событий: состав или роли этих групп изменились
+MEMBERSHIPS_CHANGED = 'memberships_changed'
+
+def load_members(group_id):
+    """Read-only {user_id: role} of the accepted members of a group"""
+    rows = db.session.query(GroupMember.user_id, GroupMember.role).filter_by(
+        group_id=group_id,
+        invitation_status='accepted'
+    )
+    return MappingProxyType({row.user_id: row.role for row in rows})
+
+membership_cache = InvalidatingCache(load_members, MEMBERSHIP_CACHE_SIZE, MEMBERSHIPS_CHANGED)
+
+def get_members(group_id):
+    return membership_cache.get(int(group_id))
+
+def member_role(group_id, user_id):
+    """Role of an accepted member, or None if the user is not in the group"""
+    try:
+        group_id, user_id = int(group_id), int(user_id)
+    except (TypeError, ValueError):
+        return None
+    return get_members(group_id).get(user_id)
+
+def is_group_member(group_id, user_id):
+    return member_role(group_id, user_id) is not None
+
+def is_group_admin(group_id, user_id):
+    return member_role(group_id, user_id) == 'admin'
+
+def members_changed(*group_ids):
+    """Drops cached memberships of group_ids in every worker. Call after commit."""
+    membership_cache.changed(int(group_id) for group_id in group_ids)
@@ -0,0 +1,127 @@
+import importlib.util
+import logging
+import os
+import re
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from werkzeug.security import generate_password_hash
+from models.user import db, normalize_name
+
+# Скрипты миграций: migrations/NNNN_name.py с функцией upgrade(connection)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+def load_migrations():
+    """Returns [(version, name, module)] sorted by version"""
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        spec = importlib.util.spec_from_file_location(
+            f'migrations.{filename[:-3]}', os.path.join(MIGRATIONS_DIR, filename)
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append((int(match.group(1)), match.group(2), module))
+    return migrations
+
+def latest_version():
+    versions = [int(MIGRATION_FILE.match(f).group(1)) for f in os.listdir(MIGRATIONS_DIR) if MIGRATION_FILE.match(f)]
+    return max(versions, default=0)
+
+def get_schema_version(connection):
+    """Версия схемы или None, если база еще не версионирована"""
+    try:
+        return connection.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar()
+    except OperationalError:
+        return None
+
+def _set_schema_version(connection, version):
+    connection.execute(text("""
+        INSERT INTO schema_version (id, version) VALUES (1, :version)
+        ON CONFLICT(id) DO UPDATE SET version = excluded.version
+    """), {'version': version})
+
+# --- Helpers for migration scripts ---
+
+def create_table_if_missing(connection, table_name):
+    """Создает таблицу по текущей модели, если ее еще нет"""
+    db.metadata.tables[table_name].create(bind=connection, checkfirst=True)
+
+def add_column_if_missing(connection, table_name, column_name, ddl):
+    """Добавляет колонку через ALTER TABLE, если ее еще нет"""
+    columns = [column['name'] for column in inspect(connection).get_columns(table_name)]
+    if column_name not in columns:
+        connection.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN {column_name} {ddl}'))
+        logging.info(f'Колонка {table_name}.{column_name} добавлена')
+
+def create_index_if_missing(connection, table_name, index_name):
+    """Создает индекс, объявленный в модели, если его еще нет"""
+    for index in db.metadata.tables[table_name].indexes:
+        if index.name == index_name:
+            index.create(bind=connection, checkfirst=True)
+            return
+    raise KeyError(f'Index {index_name} is not declared on {table_name}')
+
+# --- Runner ---
+
+def migrate():
+    """
+    Приводит схему к последней версии. Возвращает имена примененных миграций.
+
+    Пустая база создается целиком по моделям и сразу помечается последней
+    версией. Существующая база без таблицы версий считается версией 0 и
+    проходит все миграции (первые из них идемпотентны и догоняют любые
+    состояния, оставленные старым create_tables).
+    """
+    migrations = load_migrations()
+    latest = migrations[-1][0] if migrations else 0
+
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+        ))
+        current = get_schema_version(connection)
+        if current is None:
+            if 'user' not in inspect(connection).get_table_names():
+                logging.info("Пустая база: создаем схему по моделям")
+                db.metadata.create_all(bind=connection)
+                # Тестовый пользователь для локальной разработки, как раньше в create_tables
+                # name_search задается явно: сырой INSERT обходит @validates('name')
+                connection.execute(text(
+                    "INSERT INTO user (name, name_search, email, password_hash) "
+                    "VALUES (:name, :name_search, 'test@example.com', :password_hash)"
+                ), {'name': 'Test User', 'name_search': normalize_name('Test User'),
+                    'password_hash': generate_password_hash('password123')})
+                _set_schema_version(connection, latest)
+                return []
+            current = 0
+            _set_schema_version(connection, 0)
+
+    applied = []
+    for version, name, module in migrations:
+        if version <= current:
+            continue
+        logging.info(f"Применяем миграцию {version:04d}_{name}")
+        with db.engine.begin() as connection:
+            module.upgrade(connection)
+            _set_schema_version(connection, version)
+        applied.append(f"{version:04d}_{name}")
+    return applied
+
+def check_schema_version():
+    """
+    Проверка при старте воркера: один запрос вместо инспекции всей схемы.
+    Возвращает (текущая версия или None, последняя версия).
+    """
+    with db.engine.connect() as connection:
+        current = get_schema_version(connection)
+    latest = latest_version()
+    if current is None:
+        logging.error("База данных не версионирована: выполните `flask --app app migrate-db`")
+    elif current < latest:
+        logging.warning(f"Схема базы устарела ({current} < {latest}): выполните `flask --app app migrate-db`")
+    else:
+        logging.info(f"Версия схемы базы: {current}")
+    return current, latest
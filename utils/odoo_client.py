@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+import xmlrpc.client
+
+# Сколько подряд неудачных вызовов открывают предохранитель
+FAILURE_THRESHOLD = 5
+# Сколько секунд предохранитель остается открытым до пробного вызова
+RESET_TIMEOUT = 30
+# Таймаут сетевых операций XML-RPC (секунды)
+REQUEST_TIMEOUT = 10
+
+class OdooUnavailable(Exception):
+    """Raised without contacting Odoo while the circuit breaker is open"""
+
+class OdooAuthError(Exception):
+    """Odoo rejected the configured credentials"""
+
+class _TimeoutMixin:
+    def __init__(self, timeout, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        # Transport кеширует соединение по хосту: пока сервер не закрыл его,
+        # все запросы потока идут через одно keep-alive соединение
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+class KeepAliveTransport(_TimeoutMixin, xmlrpc.client.Transport):
+    pass
+
+class SafeKeepAliveTransport(_TimeoutMixin, xmlrpc.client.SafeTransport):
+    pass
+
+def _is_auth_fault(fault):
+    text = str(fault.faultString)
+    return 'AccessDenied' in text or 'Access Denied' in text or 'Session expired' in text
+
+class OdooClient:
+    """
+    Shared XML-RPC client for Odoo.
+
+    The uid from authenticate() is cached for the whole process and refreshed
+    only when Odoo reports an access error. Each thread gets its own transport
+    (xmlrpc transports are not thread-safe), reused for every call so the
+    HTTP connection stays open. After FAILURE_THRESHOLD consecutive failures
+    the circuit breaker opens and calls fail fast with OdooUnavailable for
+    RESET_TIMEOUT seconds; then a single trial call decides whether to close it.
+    """
+
+    def __init__(self, url, db_name, username, password, timeout=REQUEST_TIMEOUT,
+                 failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.url = url.rstrip('/')
+        self.db_name = db_name
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._auth_lock = threading.Lock()
+        self._uid = None
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    def _proxy(self, endpoint):
+        proxies = getattr(self._local, 'proxies', None)
+        if proxies is None:
+            transport_class = SafeKeepAliveTransport if self.url.startswith('https') else KeepAliveTransport
+            transport = transport_class(self.timeout)
+            # Оба эндпоинта на одном хосте делят транспорт и, значит, соединение
+            proxies = self._local.proxies = {
+                name: xmlrpc.client.ServerProxy(f'{self.url}/xmlrpc/2/{name}', transport=transport, allow_none=True)
+                for name in ('common', 'object')
+            }
+        return proxies[endpoint]
+
+    def _drop_connection(self):
+        proxies = getattr(self._local, 'proxies', None)
+        if proxies:
+            proxies['common']('close')()
+            self._local.proxies = None
+
+    # --- Circuit breaker ---
+
+    def _before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_progress:
+                raise OdooUnavailable('Odoo circuit breaker is open')
+            # Полуоткрытое состояние: пропускаем один пробный вызов
+            self._trial_in_progress = True
+
+    def _record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def _record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logging.error(f"Odoo недоступен после {self._failures} ошибок подряд, пауза {self.reset_timeout} с")
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        """Whether calls would currently fail fast"""
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_timeout
+
+    # --- Calls ---
+
+    def _authenticate(self):
+        uid = self._proxy('common').authenticate(self.db_name, self.username, self.password, {})
+        if not uid:
+            raise OdooAuthError('Odoo rejected the configured credentials')
+        logging.info(f"Аутентификация в Odoo выполнена, uid={uid}")
+        return uid
+
+    def uid(self):
+        """Returns the cached uid, authenticating on first use"""
+        uid = self._uid
+        if uid is None:
+            # Одновременно аутентифицируется только один поток, остальные ждут его uid
+            with self._auth_lock:
+                uid = self._uid
+                if uid is None:
+                    uid = self._uid = self._authenticate()
+        return uid
+
+    def _call(self, model, method, args, kwargs):
+        uid = self.uid()
+        try:
+            return self._proxy('object').execute_kw(self.db_name, uid, self.password, model, method, args, kwargs or {})
+        except xmlrpc.client.Fault as e:
+            if not _is_auth_fault(e):
+                raise
+            # uid устарел (например, сменили пароль): переаутентифицируемся один раз
+            logging.warning("Odoo отклонил uid, повторная аутентификация")
+            with self._lock:
+                if self._uid == uid:
+                    self._uid = None
+            uid = self.uid()
+            return self._proxy('object').execute_kw(self.db_name, uid, self.password, model, method, args, kwargs or {})
+
+    def execute_kw(self, model, method, args, kwargs=None):
+        """
+        Calls model.method on Odoo. xmlrpc Faults (Odoo is up but rejected the
+        call) are raised as is and do not count towards the circuit breaker.
+        """
+        self._before_call()
+        try:
+            result = self._call(model, method, args, kwargs)
+        except xmlrpc.client.Fault:
+            self._record_success()
+            raise
+        except Exception:
+            self._record_failure()
+            try:
+                self._drop_connection()
+            except Exception:
+                pass
+            raise
+        self._record_success()
+        return result
@@ -1,5 +1,11 @@
 import xmlrpc.client
-from models.user import Message
+import datetime
+import json
+import threading
+import time
+import uuid
+from models.user import db, User, Group, OdooOutbox
+from utils.odoo_client import OdooClient
 import logging
 
 # Настройка логирования
@@ -15,88 +21,195 @@ ODOO_DB = 'messenger_db'  # Имя базы данных Odoo
 ODOO_USER = 'admin'  # Имя пользователя Odoo
 ODOO_PASSWORD = 'admin'  # Пароль пользователя Odoo
 
-def send_message_to_odoo(message):
+# Общий клиент процесса: uid и соединения переиспользуются между вызовами
+odoo_client = OdooClient(ODOO_URL, ODOO_DB, ODOO_USER, ODOO_PASSWORD)
+
+# Параметры очереди синхронизации (outbox)
+OUTBOX_BATCH_SIZE = 100  # Сколько записей отправляется одним вызовом create
+OUTBOX_MAX_ATTEMPTS = 8  # После стольких неудач запись переходит в статус 'dead'
+OUTBOX_BACKOFF_BASE = 5  # Секунды до первого повтора, дальше удваивается
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_LEASE = 300  # На сколько секунд воркер резервирует взятую пачку
+OUTBOX_POLL_INTERVAL = 2
+
+def _user_name(user_id):
+    user = User.query.get(user_id) if user_id else None
+    return user.name if user else ''
+
+def message_vals(message):
+    """Значения записи messenger.message для личного сообщения"""
+    return {
+        'sender_id': message.sender_id,
+        'sender_name': _user_name(message.sender_id),
+        'recipient_id': message.recipient_id,
+        'recipient_name': _user_name(message.recipient_id),
+        'group_ext_id': '',
+        'group_name': '',
+        'content': message.content,
+        'timestamp': message.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'message_type': message.message_type,
+        'is_read': False,
+        'attachments_count': message.attachments_count if hasattr(message, 'attachments_count') else 0,
+        'language': message.language if hasattr(message, 'language') else 'en'
+    }
+
+def group_message_vals(group_message):
+    """Значения записи messenger.message для группового сообщения"""
+    group = Group.query.get(group_message.group_id) if group_message.group_id else None
+    return {
+        'sender_id': group_message.sender_id,
+        'sender_name': _user_name(group_message.sender_id),
+        'recipient_id': '',
+        'recipient_name': '',
+        'group_ext_id': f'group_{group_message.group_id}' if group_message.group_id else '',
+        'group_name': group.name if group else '',
+        'content': group_message.content,
+        'timestamp': group_message.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'message_type': group_message.message_type,
+        'is_read': False,
+        'attachments_count': group_message.attachments_count if hasattr(group_message, 'attachments_count') else 0,
+        'language': group_message.language if hasattr(group_message, 'language') else 'en'
+    }
+
+def enqueue_odoo_record(model, vals):
     """
-    Отправляет сообщение (объект Message) в Odoo через XML-RPC API.
+    Добавляет запись в очередь для Odoo в текущую сессию. Коммитится вместе
+    с остальными изменениями вызывающего кода, поэтому сообщение и задача на
+    синхронизацию либо сохраняются обе, либо ни одна.
     """
-    try:
-        common = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/common')
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
-        if not uid:
-            logging.error("Ошибка аутентификации в Odoo")
-            return False
-        models = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/object')
+    db.session.add(OdooOutbox(model=model, payload=json.dumps(vals)))
 
-        vals = {
-            'sender_id': message.sender_id,
-            'sender_name': message.sender_name if hasattr(message, 'sender_name') else '',
-            'recipient_id': message.recipient_id if hasattr(message, 'recipient_id') else '',
-            'recipient_name': message.recipient_name if hasattr(message, 'recipient_name') else '',
-            'group_ext_id': '',
-            'group_name': '',
-            'content': message.content,
-            'timestamp': message.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'message_type': message.message_type,
-            'is_read': False,
-            'attachments_count': message.attachments_count if hasattr(message, 'attachments_count') else 0,
-            'language': message.language if hasattr(message, 'language') else 'en'
-        }
+def enqueue_message(message):
+    """Ставит личное сообщение в очередь; вызывается после flush() и до commit()"""
+    enqueue_odoo_record('messenger.message', message_vals(message))
 
-        message_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            'messenger.message', 'create',
-            [vals]
-        )
-        logging.info(f"Сообщение успешно отправлено в Odoo. ID: {message_id}")
-        return True
-    except Exception as e:
-        logging.error(f"Ошибка при отправке сообщения в Odoo: {str(e)}")
-        return False
+def enqueue_group_message(group_message):
+    """Ставит групповое сообщение в очередь; вызывается после flush() и до commit()"""
+    enqueue_odoo_record('messenger.message', group_message_vals(group_message))
+
+def backoff_delay(attempts):
+    return min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
 
-def send_group_message_to_odoo(group_message):
+def _claim_batch(batch_size):
     """
-    Отправляет групповое сообщение (объект GroupMessage) в Odoo через XML-RPC API.
+    Резервирует пачку готовых к отправке записей. Резерв сдвигает
+    next_attempt_at на OUTBOX_LEASE, так что другие процессы не возьмут те же
+    строки, а после падения воркера записи снова станут доступны.
     """
-    try:
-        common = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/common')
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
-        if not uid:
-            logging.error("Ошибка аутентификации в Odoo")
-            return False
-        models = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/object')
-
-        # Получаем название группы, если есть
-        group_name = ''
-        if hasattr(group_message, 'group_id') and group_message.group_id:
-            from models.user import Group
-            group = Group.query.get(group_message.group_id)
-            group_name = group.name if group else ''
+    token = uuid.uuid4().hex
+    now = datetime.datetime.utcnow()
+    ready_ids = db.session.query(OdooOutbox.id).filter(
+        OdooOutbox.status == 'pending',
+        OdooOutbox.next_attempt_at <= now
+    ).order_by(OdooOutbox.id).limit(batch_size).scalar_subquery()
+    OdooOutbox.query.filter(OdooOutbox.id.in_(ready_ids)).update({
+        'claim_token': token,
+        'next_attempt_at': now + datetime.timedelta(seconds=OUTBOX_LEASE)
+    }, synchronize_session=False)
+    db.session.commit()
+    return OdooOutbox.query.filter_by(claim_token=token).order_by(OdooOutbox.id).all()
 
-        vals = {
-            'sender_id': group_message.sender_id,
-            'sender_name': group_message.sender_name if hasattr(group_message, 'sender_name') else '',
-            'recipient_id': '',
-            'recipient_name': '',
-            'group_ext_id': f'group_{group_message.group_id}' if hasattr(group_message, 'group_id') and group_message.group_id else '',
-            'group_name': group_name,
-            'content': group_message.content,
-            'timestamp': group_message.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'message_type': group_message.message_type,
-            'is_read': False,
-            'attachments_count': group_message.attachments_count if hasattr(group_message, 'attachments_count') else 0,
-            'language': group_message.language if hasattr(group_message, 'language') else 'en'
-        }
+def _mark_sent(rows, odoo_ids):
+    now = datetime.datetime.utcnow()
+    for row, odoo_id in zip(rows, odoo_ids):
+        row.status = 'sent'
+        row.odoo_id = odoo_id
+        row.sent_at = now
+        row.claim_token = None
 
-        message_id = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
-            'messenger.message', 'create',
-            [vals]
-        )
-        logging.info(f"Групповое сообщение успешно отправлено в Odoo. ID: {message_id}")
-        return True
+def _mark_failed(rows, error):
+    now = datetime.datetime.utcnow()
+    for row in rows:
+        row.attempts += 1
+        row.last_error = str(error)[:1000]
+        row.claim_token = None
+        if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+            row.status = 'dead'
+            logging.error(f"Запись очереди Odoo {row.id} перемещена в dead-letter: {error}")
+        else:
+            row.next_attempt_at = now + datetime.timedelta(seconds=backoff_delay(row.attempts))
+
+def _create_records(client, model, rows):
+    """Создает записи одним вызовом create; при ошибке данных отправляет по одной"""
+    try:
+        odoo_ids = client.execute_kw(model, 'create', [[json.loads(row.payload) for row in rows]])
+        _mark_sent(rows, odoo_ids if isinstance(odoo_ids, list) else [odoo_ids])
+        return len(rows)
+    except xmlrpc.client.Fault as e:
+        if len(rows) == 1:
+            _mark_failed(rows, e)
+            return 0
+        # Одна некорректная запись не должна блокировать всю пачку
+        logging.warning(f"Odoo отклонил пачку из {len(rows)} записей, отправляем по одной: {e.faultString}")
+        return sum(_create_records(client, model, [row]) for row in rows)
+
+def drain_outbox(batch_size=OUTBOX_BATCH_SIZE, client=None):
+    """
+    Отправляет одну пачку записей из очереди в Odoo.
+    Возвращает число взятых из очереди записей (0 — очередь пуста
+    или Odoo временно отключен предохранителем).
+    """
+    client = client or odoo_client
+    # Пока предохранитель открыт, записи не берутся и не тратят попытки
+    if client.is_open:
+        return 0
+    rows = _claim_batch(batch_size)
+    if not rows:
+        return 0
+    try:
+        by_model = {}
+        for row in rows:
+            by_model.setdefault(row.model, []).append(row)
+        sent = 0
+        for model, model_rows in by_model.items():
+            sent += _create_records(client, model, model_rows)
+        logging.info(f"В Odoo отправлено записей: {sent} из {len(rows)}")
     except Exception as e:
-        logging.error(f"Ошибка при отправке группового сообщения в Odoo: {str(e)}")
-        return False
+        # Odoo недоступен: вся пачка уходит на повтор с задержкой
+        logging.error(f"Ошибка при отправке очереди в Odoo: {str(e)}")
+        _mark_failed([row for row in rows if row.status == 'pending' and row.claim_token], e)
+    db.session.commit()
+    return len(rows)
+
+def requeue_dead_letters():
+    """Возвращает записи из dead-letter в очередь. Возвращает их число."""
+    count = OdooOutbox.query.filter_by(status='dead').update({
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': datetime.datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    return count
+
+_worker_started = False
+_worker_lock = threading.Lock()
+
+def start_outbox_worker(app, interval=OUTBOX_POLL_INTERVAL):
+    """Запускает фоновый поток, разгружающий очередь; один на процесс (вызывается на каждый запрос)"""
+    global _worker_started
+    if _worker_started:
+        return
+    with _worker_lock:
+        if _worker_started:
+            return
+        _worker_started = True
+
+    def run():
+        while True:
+            claimed = 0
+            with app.app_context():
+                try:
+                    claimed = drain_outbox()
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Ошибка воркера очереди Odoo: {str(e)}")
+                finally:
+                    db.session.remove()
+            # Полная пачка — вероятно, есть еще записи, продолжаем без паузы
+            if claimed < OUTBOX_BATCH_SIZE:
+                time.sleep(interval)
+
+    threading.Thread(target=run, name='odoo-outbox', daemon=True).start()
 
 def send_group_to_odoo(group, admin_users, member_users):
     """
@@ -106,13 +219,6 @@ def send_group_to_odoo(group, admin_users, member_users):
     member_users — список User-объектов (все участники)
     """
     try:
-        common = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/common')
-        uid = common.authenticate(ODOO_DB, ODOO_USER, ODOO_PASSWORD, {})
-        if not uid:
-            logging.error("Ошибка аутентификации в Odoo")
-            return False
-        models = xmlrpc.client.ServerProxy(f'{ODOO_URL}/xmlrpc/2/object')
-
         vals = {
             'group_ext_id': group.id,
             'name': group.name,
@@ -128,21 +234,18 @@ def send_group_to_odoo(group, admin_users, member_users):
         }
 
         # Создать или обновить (по group_ext_id)
-        group_ids = models.execute_kw(
-            ODOO_DB, uid, ODOO_PASSWORD,
+        group_ids = odoo_client.execute_kw(
             'messenger.group', 'search',
             [[['group_ext_id', '=', group.id]]]
         )
         if group_ids:
-            models.execute_kw(
-                ODOO_DB, uid, ODOO_PASSWORD,
+            odoo_client.execute_kw(
                 'messenger.group', 'write',
                 [group_ids, vals]
             )
             logging.info(f"Группа обновлена в Odoo. ID: {group_ids[0]}")
         else:
-            group_id = models.execute_kw(
-                ODOO_DB, uid, ODOO_PASSWORD,
+            group_id = odoo_client.execute_kw(
                 'messenger.group', 'create',
                 [vals]
             )
@@ -0,0 +1,28 @@
+# Размер страницы истории по умолчанию и верхняя граница для limit
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def parse_page_args(args):
+    """Reads before_id/after_id/limit query parameters for keyset pagination"""
+    before_id = args.get('before_id', type=int)
+    after_id = args.get('after_id', type=int)
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return before_id, after_id, limit
+
+def keyset_page(query, id_column, before_id=None, after_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Applies keyset pagination on id_column to a query.
+    Returns (rows, has_more) with rows in ascending id order. With after_id,
+    has_more means there are newer rows beyond the page; otherwise older ones.
+    """
+    if after_id is not None:
+        rows = query.filter(id_column > after_id).order_by(id_column.asc()).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+    if before_id is not None:
+        query = query.filter(id_column < before_id)
+    rows = query.order_by(id_column.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return rows, has_more
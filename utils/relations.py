@@ -0,0 +1,45 @@
+import collections
+from sqlalchemy import text
+from models.user import db
+from utils.cache import InvalidatingCache
+
+# Сколько пользователей держать в кеше процесса
+RELATION_CACHE_SIZE = 10000
+# Внутренний сигнал шины событий: связи этих пользователей изменились
+RELATIONS_CHANGED = 'relations_changed'
+
+Relations = collections.namedtuple('Relations', ['blocked', 'blocked_by', 'contacts'])
+
+# Все связи пользователя одним запросом по индексам block и contact
+RELATIONS_QUERY = text("""
+    SELECT 'blocked' AS kind, blocked_user_id AS other_id FROM block WHERE user_id = :user_id
+    UNION ALL
+    SELECT 'blocked_by', user_id FROM block WHERE blocked_user_id = :user_id
+    UNION ALL
+    SELECT 'contacts', contact_id FROM contact WHERE user_id = :user_id
+""")
+
+def load_relations(user_id):
+    """Whom the user blocked, who blocked them and their contacts, as frozensets"""
+    sets = {'blocked': set(), 'blocked_by': set(), 'contacts': set()}
+    for row in db.session.execute(RELATIONS_QUERY, {'user_id': user_id}):
+        sets[row.kind].add(row.other_id)
+    return Relations(**{kind: frozenset(ids) for kind, ids in sets.items()})
+
+relation_cache = InvalidatingCache(load_relations, RELATION_CACHE_SIZE, RELATIONS_CHANGED)
+
+def get_relations(user_id):
+    return relation_cache.get(int(user_id))
+
+def is_blocked_between(user_id, other_id):
+    """Returns (blocked_by_user, blocked_by_other) for a pair of users"""
+    relations = get_relations(user_id)
+    other_id = int(other_id)
+    return other_id in relations.blocked, other_id in relations.blocked_by
+
+def is_contact(user_id, contact_id):
+    return int(contact_id) in get_relations(user_id).contacts
+
+def relations_changed(*user_ids):
+    """Drops cached relations of user_ids in every worker. Call after commit."""
+    relation_cache.changed(int(user_id) for user_id in user_ids)
@@ -0,0 +1,168 @@
+import logging
+import re
+from sqlalchemy import text
+from models.user import db, GroupMember, normalize_name
+
+# Маркеры начала и конца совпадения в snippet. Это управляющие символы, а не
+# HTML: клиент сначала экранирует текст, затем заменяет маркеры на <mark>
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+# Сколько токенов вокруг совпадения показывать в snippet
+SNIPPET_TOKENS = 12
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
+MAX_SEARCH_OFFSET = 1000
+# Ограничение на число слов в запросе, чтобы не строить огромные выражения MATCH
+MAX_QUERY_TERMS = 8
+
+USER_SEARCH_LIMIT = 10
+# Триграммный индекс находит подстроки не короче трех символов
+MIN_SUBSTRING_LENGTH = 3
+# Верхняя граница диапазона для префикса: больше любого символа строки
+PREFIX_UPPER_BOUND = '\U0010ffff'
+
+def build_match_expression(query):
+    """
+    Превращает пользовательский ввод в безопасное выражение FTS5: каждое слово
+    становится префиксной фразой, слова объединяются через AND. Синтаксис FTS5
+    из ввода (кавычки, NEAR, двоеточия) не пропускается.
+    """
+    terms = re.findall(r'\w+', query, re.UNICODE)[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def _direct_branch():
+    return f"""
+        SELECT 'direct' AS kind, m.id AS id, m.sender_id AS sender_id, m.recipient_id AS recipient_id,
+               NULL AS group_id, NULL AS group_name, m.timestamp AS timestamp,
+               snippet(message_fts, 0, :hl_start, :hl_end, '…', {SNIPPET_TOKENS}) AS snippet
+        FROM message_fts
+        JOIN message m ON m.id = message_fts.rowid
+        WHERE message_fts MATCH :direct_match
+    """
+
+def _group_branch():
+    return f"""
+        SELECT 'group' AS kind, gm.id AS id, gm.sender_id AS sender_id, NULL AS recipient_id,
+               gm.group_id AS group_id, g.name AS group_name, gm.timestamp AS timestamp,
+               snippet(group_message_fts, 0, :hl_start, :hl_end, '…', {SNIPPET_TOKENS}) AS snippet
+        FROM group_message_fts
+        JOIN group_message gm ON gm.id = group_message_fts.rowid
+        JOIN "group" g ON g.id = gm.group_id
+        WHERE group_message_fts MATCH :group_match
+    """
+
+def search_messages(user_id, query, limit=DEFAULT_SEARCH_LIMIT, offset=0):
+    """
+    Ищет по личным сообщениям пользователя и сообщениям его групп.
+    Возвращает (results, has_more); результаты упорядочены от новых к старым.
+    Оценки bm25 двух индексов FTS несравнимы (зависят от числа и длины
+    документов каждого индекса), поэтому ветки сливаются по времени.
+    """
+    expression = build_match_expression(query)
+    if not expression:
+        return [], False
+    user_id = int(user_id)
+
+    # Токены доступа в колонке participants сужают MATCH до видимых сообщений
+    params = {
+        'hl_start': HIGHLIGHT_START,
+        'hl_end': HIGHLIGHT_END,
+        'direct_match': f'participants : u{user_id} AND content : ({expression})',
+        'limit': limit + 1,
+        'offset': offset,
+    }
+    branches = [_direct_branch()]
+    group_ids = [row.group_id for row in db.session.query(GroupMember.group_id).filter_by(
+        user_id=user_id,
+        invitation_status='accepted'
+    )]
+    if group_ids:
+        groups = ' OR '.join(f'g{int(group_id)}' for group_id in group_ids)
+        params['group_match'] = f'participants : ({groups}) AND content : ({expression})'
+        branches.append(_group_branch())
+
+    sql = text(f"""
+        SELECT r.*, u.name AS sender_name
+        FROM ({' UNION ALL '.join(branches)}) r
+        LEFT JOIN user u ON u.id = r.sender_id
+        ORDER BY r.timestamp DESC, r.kind, r.id DESC
+        LIMIT :limit OFFSET :offset
+    """).columns(timestamp=db.DateTime)
+    rows = db.session.execute(sql, params).mappings().all()
+
+    has_more = len(rows) > limit
+    results = []
+    for row in rows[:limit]:
+        results.append({
+            'kind': row['kind'],
+            'id': row['id'],
+            'sender_id': row['sender_id'],
+            'sender_name': row['sender_name'],
+            'recipient_id': row['recipient_id'],
+            'group_id': row['group_id'],
+            'group_name': row['group_name'],
+            'timestamp': row['timestamp'].isoformat() if row['timestamp'] else None,
+            'snippet': row['snippet']
+        })
+    return results, has_more
+
+# Кандидат не сам пользователь и не заблокирован ни в одну сторону
+_VISIBLE_USER = """
+    u.id != :user_id
+    AND NOT EXISTS (SELECT 1 FROM block b WHERE b.user_id = :user_id AND b.blocked_user_id = u.id)
+    AND NOT EXISTS (SELECT 1 FROM block b WHERE b.user_id = u.id AND b.blocked_user_id = :user_id)
+"""
+
+def search_users(user_id, query, limit=USER_SEARCH_LIMIT):
+    """
+    Ищет пользователей по имени: сначала точное совпадение, затем имена,
+    начинающиеся с запроса (индекс по name_search), затем содержащие его
+    (триграммный user_fts). Каждый шаг читает из индекса не больше limit
+    подходящих строк, поэтому время ответа не растет вместе с таблицей.
+    """
+    key = normalize_name(query)
+    if not key:
+        return []
+    params = {
+        'user_id': int(user_id),
+        'low': key,
+        'high': key + PREFIX_UPPER_BOUND,
+        'limit': limit,
+    }
+    # Точное совпадение — наименьшая строка с этим префиксом, поэтому идет первым
+    rows = db.session.execute(text(f"""
+        SELECT u.id, u.name, u.avatar_path, u.bio FROM user u
+        WHERE u.name_search >= :low AND u.name_search < :high AND {_VISIBLE_USER}
+        ORDER BY u.name_search, u.id
+        LIMIT :limit
+    """), params).mappings().all()
+
+    if len(rows) < limit and len(key) >= MIN_SUBSTRING_LENGTH:
+        params['match'] = '"' + ' '.join(query.split()).replace('"', '""') + '"'
+        params['limit'] = limit - len(rows)
+        rows += db.session.execute(text(f"""
+            SELECT u.id, u.name, u.avatar_path, u.bio FROM user_fts
+            JOIN user u ON u.id = user_fts.rowid
+            WHERE user_fts MATCH :match
+              AND (u.name_search < :low OR u.name_search >= :high)
+              AND {_VISIBLE_USER}
+            LIMIT :limit
+        """), params).mappings().all()
+
+    return [dict(row) for row in rows]
+
+def rebuild_search_index():
+    """Пересобирает индексы FTS по сообщениям и именам пользователей"""
+    try:
+        for table in ('message_fts', 'group_message_fts', 'user_fts'):
+            db.session.execute(text(f"INSERT INTO {table} ({table}) VALUES ('rebuild')"))
+            db.session.execute(text(f"INSERT INTO {table} ({table}) VALUES ('optimize')"))
+        db.session.commit()
+        logging.info("Поисковые индексы пересобраны")
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Ошибка при пересборке поисковых индексов: {str(e)}")
+        raise
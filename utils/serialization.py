@@ -0,0 +1,130 @@
+import itertools
+import json
+import logging
+from flask import current_app, stream_with_context
+from models.user import Message, GroupMessage
+
+# orjson необязателен: он быстрее и сам сериализует datetime, без него — stdlib json
+orjson_available = False
+try:
+    import orjson
+    orjson_available = True
+except ImportError:
+    logging.info("orjson not installed, listing responses use the stdlib json encoder")
+
+def _isoformat(value):
+    return value.isoformat()
+
+# Сколько строк читать из курсора (yield_per) и кодировать за один кусок ответа
+STREAM_BATCH_SIZE = 500
+
+# (ключ в JSON, колонка, преобразование значения или None)
+MESSAGE_FIELDS = (
+    ('id', Message.id, None),
+    ('sender_id', Message.sender_id, None),
+    ('recipient_id', Message.recipient_id, None),
+    ('content', Message.content, None),
+    ('translation', Message.translation, None),
+    ('timestamp', Message.timestamp, _isoformat),
+    ('is_read', Message.is_read, None),
+    ('is_edited', Message.is_edited, None),
+    ('edited_at', Message.edited_at, _isoformat),
+    ('message_type', Message.message_type, None),
+    ('file_path', Message.file_path, None),
+    ('mime_type', Message.mime_type, None),
+    ('original_filename', Message.original_filename, None),
+    ('variants', Message.variants, None),
+)
+
+GROUP_MESSAGE_FIELDS = (
+    ('id', GroupMessage.id, None),
+    ('group_id', GroupMessage.group_id, None),
+    ('sender_id', GroupMessage.sender_id, None),
+    ('content', GroupMessage.content, None),
+    ('timestamp', GroupMessage.timestamp, _isoformat),
+    ('is_edited', GroupMessage.is_edited, None),
+    ('edited_at', GroupMessage.edited_at, _isoformat),
+    ('message_type', GroupMessage.message_type, None),
+    ('file_path', GroupMessage.file_path, None),
+    ('mime_type', GroupMessage.mime_type, None),
+    ('original_filename', GroupMessage.original_filename, None),
+    ('variants', GroupMessage.variants, None),
+)
+
+def columns(fields):
+    """Columns to select instead of whole ORM objects"""
+    return [column for _, column, _ in fields]
+
+def row_serializer(fields, native_datetime=orjson_available):
+    """
+    Builds a function that turns a selected row into the same dict as
+    to_dict(). Keys and converters are resolved once here, not per row. With
+    orjson datetimes are left as is: orjson writes them in isoformat itself.
+    """
+    keys = tuple(key for key, _, _ in fields)
+    converters = () if native_datetime else tuple(
+        (index, convert) for index, (_, _, convert) in enumerate(fields) if convert
+    )
+    if not converters:
+        return lambda row: dict(zip(keys, row))
+
+    def serialize(row):
+        values = list(row)
+        for index, convert in converters:
+            value = values[index]
+            if value is not None:
+                values[index] = convert(value)
+        return dict(zip(keys, values))
+    return serialize
+
+MESSAGE_COLUMNS = columns(MESSAGE_FIELDS)
+GROUP_MESSAGE_COLUMNS = columns(GROUP_MESSAGE_FIELDS)
+serialize_message_row = row_serializer(MESSAGE_FIELDS)
+serialize_group_message_row = row_serializer(GROUP_MESSAGE_FIELDS)
+
+def dumps(payload):
+    """Compact JSON bytes, through orjson when it is installed"""
+    if orjson_available:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def json_response(payload, status=200):
+    """Replacement for jsonify on listing endpoints"""
+    return current_app.response_class(dumps(payload), status=status, mimetype='application/json')
+
+def stream_json(payload, key, rows, serialize):
+    """
+    Streaming counterpart of json_response for listings of unknown length.
+    Sends {**payload, key: [serialize(row), ...]} in chunks of STREAM_BATCH_SIZE
+    rows while iterating rows, so memory does not grow with the listing. rows
+    should come from a server-side cursor: Query.yield_per(STREAM_BATCH_SIZE) or
+    execution_options={'yield_per': STREAM_BATCH_SIZE}.
+
+    Run the query before calling this, so that a failing statement still turns
+    into an error response. Once the first chunk is sent the status can no
+    longer change: an error after it is logged and the body is cut short, which
+    the client sees as invalid JSON.
+    """
+    head = dumps(payload)[:-1]
+    head += b',' if len(head) > 1 else b''
+    head += dumps(key) + b':['
+    rows = iter(rows)
+
+    @stream_with_context
+    def generate():
+        yield head
+        separator = b''
+        try:
+            while True:
+                batch = [serialize(row) for row in itertools.islice(rows, STREAM_BATCH_SIZE)]
+                if not batch:
+                    break
+                # Список из пачки без скобок — элементы через запятую
+                yield separator + dumps(batch)[1:-1]
+                separator = b','
+        except Exception as e:
+            logging.error(f"Error streaming {key}: {str(e)}")
+            return
+        yield b']}'
+
+    return current_app.response_class(generate(), mimetype='application/json')
@@ -0,0 +1,73 @@
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from models.user import db
+from utils.db_config import sqlite_engine_options, configure_sqlite
+
+
+def create_test_app(database_uri=None):
+    """
+    Builds an isolated Flask app with every blueprint registered against an
+    in-memory SQLite database. Importing app.py would touch instance/chat.db,
+    so tests use this instead. Benchmarks pass database_uri of a file
+    database: it gets the production pool and PRAGMAs. The URI has to be set
+    here, Flask-SQLAlchemy reads it only in init_app.
+    """
+    from routes.auth import auth_bp
+    from routes.user import user_bp
+    from routes.contacts import contacts_bp
+    from routes.messages import messages_bp
+    from routes.groups import groups_bp
+    from routes.events import events_bp
+    from routes.files import files_bp
+    from utils.relations import relation_cache
+    from utils.memberships import membership_cache
+
+    test_app = Flask(__name__)
+    test_app.config['TESTING'] = True
+    test_app.config['SECRET_KEY'] = 'test'
+    if database_uri:
+        test_app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+        test_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine_options()
+    else:
+        test_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        test_app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False}
+        }
+    test_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(test_app)
+    if database_uri:
+        with test_app.app_context():
+            configure_sqlite(db.engine)
+
+    test_app.register_blueprint(auth_bp)
+    test_app.register_blueprint(user_bp)
+    test_app.register_blueprint(contacts_bp)
+    test_app.register_blueprint(messages_bp)
+    test_app.register_blueprint(groups_bp)
+    test_app.register_blueprint(events_bp)
+    test_app.register_blueprint(files_bp)
+
+    # Кеши живут в процессе, а каждая тестовая база начинается с нуля
+    relation_cache.clear()
+    membership_cache.clear()
+    return test_app
+
+
+class QueryCounter:
+    """Context manager counting SQL statements executed on an engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
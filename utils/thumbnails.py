@@ -0,0 +1,211 @@
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from models.user import db, Message, GroupMessage
+from utils.blobs import store_file, temp_path, variant_path
+from utils.events import publish
+from utils.memberships import get_members
+
+# Pillow и ffmpeg необязательны: без Pillow нет уменьшенных копий, без ffmpeg — кадра-обложки видео
+pil_available = False
+try:
+    from PIL import Image, ImageOps
+    pil_available = True
+except ImportError:
+    logging.info("Pillow not installed, image thumbnails are disabled. Install with: pip install Pillow")
+
+# Длинная сторона превью в пикселях; ?size=N отдает наименьшее превью не меньше N
+THUMBNAIL_SIZES = (160, 480, 960)
+THUMBNAIL_QUALITY = 82
+# Вариант с кадром-обложкой видео в полном размере
+POSTER = 'poster'
+# Секунда, с которой берется обложка (у совсем коротких видео — первый кадр)
+POSTER_OFFSET = 1
+FFMPEG_TIMEOUT = 60
+# Потоки пула по умолчанию (конфиг THUMBNAIL_WORKERS, 0 отключает генерацию)
+THUMBNAIL_WORKERS = 2
+
+_executor = None
+
+def init_thumbnails(app):
+    """Starts the worker pool that builds previews after uploads"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    workers = app.config.get('THUMBNAIL_WORKERS', THUMBNAIL_WORKERS)
+    if workers:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails')
+    logging.info(f"Thumbnail workers: {workers}, Pillow: {pil_available}, ffmpeg: {bool(ffmpeg_path(app.config))}")
+    return _executor
+
+def ffmpeg_path(config=None):
+    config = current_app.config if config is None else config
+    return config.get('FFMPEG_PATH') or shutil.which('ffmpeg')
+
+def previewable(mime_type):
+    """Whether the installed tools can build any variant for this file type"""
+    mime_type = mime_type or ''
+    if mime_type.startswith('image/') and mime_type != 'image/svg+xml':
+        return pil_available
+    if mime_type.startswith('video/'):
+        return bool(ffmpeg_path())
+    return False
+
+def schedule_variants(file_path, mime_type=None, model=None, record_id=None):
+    """
+    Queues preview generation for an upload; call it after the commit. The
+    request does not wait: a worker builds the files and stores their names
+    in model.variants of record_id (avatars pass no model, their type is
+    guessed from the name).
+    """
+    mime_type = mime_type or mimetypes.guess_type(file_path)[0]
+    if _executor is None or not previewable(mime_type):
+        return None
+    app = current_app._get_current_object()
+    return _executor.submit(process_upload, app, file_path, mime_type, model, record_id)
+
+def process_upload(app, file_path, mime_type, model=None, record_id=None):
+    """Worker job: builds the variants and records them on the message row"""
+    with app.app_context():
+        try:
+            names = generate_variants(file_path, mime_type)
+            if model is not None:
+                model.query.filter_by(id=record_id).update(
+                    {'variants': ','.join(names)}, synchronize_session=False
+                )
+                db.session.commit()
+                publish_variants(model, record_id, names)
+            return names
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Ошибка генерации превью для {file_path}: {str(e)}")
+            return []
+        finally:
+            db.session.remove()
+
+def publish_variants(model, record_id, names):
+    """Tells the open chats that the message has previews now: they swap the original for them"""
+    if not names:
+        return
+    data = {'id': record_id, 'variants': ','.join(names)}
+    if model is GroupMessage:
+        group_id = db.session.query(GroupMessage.group_id).filter_by(id=record_id).scalar()
+        if group_id is not None:
+            publish(list(get_members(group_id)), 'group_message_variants', dict(data, group_id=group_id))
+    elif model is Message:
+        row = db.session.query(Message.sender_id, Message.recipient_id).filter_by(id=record_id).first()
+        if row:
+            publish(list(row), 'message_variants', dict(data, sender_id=row[0], recipient_id=row[1]))
+
+def generate_variants(file_path, mime_type):
+    """
+    Writes the previews of the upload at file_path (relative to UPLOAD_FOLDER)
+    next to it through the blob store and returns their names: the poster
+    frame of a video, then every THUMBNAIL_SIZES entry smaller than the image.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    source = os.path.join(upload_folder, file_path)
+    names = []
+    mime_type = mime_type or ''
+    if mime_type.startswith('video/'):
+        poster = temp_path() + '.jpg'
+        try:
+            if not extract_poster(source, poster):
+                return names
+            source = os.path.join(upload_folder, variant_path(file_path, POSTER))
+            store_file(poster, source)
+            names.append(POSTER)
+        finally:
+            if os.path.exists(poster):
+                os.remove(poster)
+    elif not mime_type.startswith('image/') or mime_type == 'image/svg+xml':
+        return names
+    if pil_available:
+        names.extend(str(size) for size in make_thumbnails(source, file_path))
+    return names
+
+def extract_poster(video_path, poster_path):
+    """Saves one frame of the video as JPEG with ffmpeg; False if it is not possible"""
+    ffmpeg = ffmpeg_path()
+    if not ffmpeg:
+        return False
+    for offset in (POSTER_OFFSET, 0):
+        command = [ffmpeg, '-v', 'error', '-y', '-ss', str(offset), '-i', video_path,
+                   '-frames:v', '1', '-q:v', '3', poster_path]
+        try:
+            subprocess.run(command, check=True, capture_output=True, stdin=subprocess.DEVNULL, timeout=FFMPEG_TIMEOUT)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.warning(f"ffmpeg could not extract a frame of {video_path} at {offset}s: {e}")
+            continue
+        # Смещение за концом видео: ffmpeg завершается без ошибки, но кадра нет
+        if os.path.exists(poster_path) and os.path.getsize(poster_path) > 0:
+            return True
+    return False
+
+def make_thumbnails(source, file_path):
+    """Downscaled JPEG copies of the image at source; returns the sizes written"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    written = []
+    with Image.open(source) as opened:
+        # JPEG декодируется сразу в уменьшенном масштабе, не меньше самого большого превью
+        largest = max(THUMBNAIL_SIZES)
+        opened.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(opened)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # Прозрачность на белом фоне: в JPEG ее нет
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        # От большего к меньшему: каждое превью уменьшается из предыдущего
+        for size in sorted(THUMBNAIL_SIZES, reverse=True):
+            if max(image.size) <= size:
+                continue
+            image.thumbnail((size, size), Image.LANCZOS)
+            temp = temp_path()
+            image.save(temp, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+            store_file(temp, os.path.join(upload_folder, variant_path(file_path, size)))
+            written.append(size)
+    return sorted(written)
+
+def variant_for(file_path, size):
+    """
+    Path to serve for /uploads/<file_path>?size=<size>: the smallest
+    thumbnail of at least size pixels, else the poster of a video, else the
+    original. size may also be 'poster'.
+    """
+    if size == POSTER:
+        candidates = [POSTER]
+    else:
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            return file_path
+        candidates = [str(s) for s in sorted(THUMBNAIL_SIZES) if s >= size] + [POSTER]
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for name in candidates:
+        path = variant_path(file_path, name)
+        if os.path.isfile(os.path.join(upload_folder, path)):
+            return path
+    return file_path
+
+def backfill_variants():
+    """Builds previews for attachments uploaded before the pipeline; returns the number processed"""
+    processed = 0
+    app = current_app._get_current_object()
+    for model in (Message, GroupMessage):
+        pending = db.session.query(model.id, model.file_path, model.mime_type).filter(
+            model.message_type == 'file', model.variants.is_(None)
+        ).all()
+        for record_id, file_path, mime_type in pending:
+            if file_path and previewable(mime_type):
+                process_upload(app, file_path, mime_type, model, record_id)
+                processed += 1
+    return processed
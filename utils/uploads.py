@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from werkzeug.utils import secure_filename
+from models.user import db, Upload
+from utils.blobs import store_file
+
+# Размер части по умолчанию; одна часть — один запрос, поэтому он меньше MAX_CONTENT_LENGTH
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# Ограничение на весь файл по умолчанию (конфиг MAX_UPLOAD_SIZE)
+MAX_UPLOAD_SIZE = 1024 * 1024 * 1024
+# Тело части читается и пишется на диск блоками такого размера
+READ_BLOCK_SIZE = 64 * 1024
+# Брошенные загрузки удаляются через сутки без новых частей (flask --app app expire-uploads)
+UPLOAD_EXPIRY = timedelta(hours=24)
+# Захват части, не отпущенный за это время (упавший воркер), может забрать другой запрос
+CHUNK_LOCK_TIMEOUT = timedelta(minutes=5)
+
+class UploadError(Exception):
+    """A rejected upload request; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def partial_folder():
+    """
+    Folder for files being uploaded. It sits inside UPLOAD_FOLDER by default so
+    that finishing an upload is a rename on the same filesystem.
+    """
+    folder = current_app.config.get('UPLOAD_PARTIAL_FOLDER') or os.path.join(
+        current_app.config['UPLOAD_FOLDER'], '.partial'
+    )
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def partial_path(upload_id):
+    return os.path.join(partial_folder(), f'{upload_id}.part')
+
+def start_upload(user_id, filename, size, mime_type=None):
+    """Creates an upload session and an empty temporary file for it"""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('File size is required')
+    original_filename = secure_filename(filename or '')
+    if not original_filename:
+        raise UploadError('File name is required')
+    max_size = current_app.config.get('MAX_UPLOAD_SIZE', MAX_UPLOAD_SIZE)
+    if size < 0 or size > max_size:
+        raise UploadError(f'File is too large (max {max_size} bytes)', 413)
+
+    upload = Upload(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        original_filename=original_filename,
+        mime_type=mime_type or 'application/octet-stream',
+        size=size,
+        chunk_size=current_app.config.get('UPLOAD_CHUNK_SIZE', UPLOAD_CHUNK_SIZE),
+        received_chunks=0
+    )
+    open(partial_path(upload.id), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return upload
+
+def get_upload(upload_id, user_id):
+    """Upload session of this user, or UploadError 404"""
+    upload = db.session.get(Upload, str(upload_id)) if upload_id else None
+    if not upload or upload.user_id != int(user_id):
+        raise UploadError('Upload not found', 404)
+    return upload
+
+def write_chunk(upload, index, stream, checksum):
+    """
+    Appends chunk number index, read from stream block by block, to the
+    temporary file and checks it against checksum (SHA-256, hex). Chunks are
+    accepted in order; a chunk that is already stored is acknowledged without
+    reading it again, so a client can safely resend after a dropped connection.
+    The chunk is claimed on the upload row before the file is touched: a resend
+    while the first request is still writing gets 409.
+    """
+    if index < upload.received_chunks:
+        return upload
+    if index != upload.received_chunks or index >= upload.total_chunks:
+        raise UploadError(f'Expected chunk {upload.received_chunks}', 409)
+    if not checksum:
+        raise UploadError('Chunk checksum is required')
+
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    claimed = Upload.query.filter(
+        Upload.id == upload.id,
+        Upload.received_chunks == index,
+        db.or_(Upload.chunk_lock.is_(None), Upload.updated_at < now - CHUNK_LOCK_TIMEOUT)
+    ).update({'chunk_lock': token, 'updated_at': now}, synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        db.session.refresh(upload)
+        if index < upload.received_chunks:
+            return upload
+        raise UploadError(f'Chunk {index} is already being written', 409)
+
+    try:
+        _write_chunk_data(upload, index, stream, checksum)
+    except Exception:
+        Upload.query.filter_by(id=upload.id, chunk_lock=token).update(
+            {'chunk_lock': None}, synchronize_session=False
+        )
+        db.session.commit()
+        raise
+
+    # Захват мог перейти к другому запросу по CHUNK_LOCK_TIMEOUT — тогда часть не засчитывается
+    accepted = Upload.query.filter_by(id=upload.id, chunk_lock=token).update(
+        {'received_chunks': index + 1, 'chunk_lock': None, 'updated_at': datetime.utcnow()},
+        synchronize_session=False
+    )
+    db.session.commit()
+    db.session.refresh(upload)
+    if not accepted:
+        raise UploadError(f'Chunk {index} was taken over by another request', 409)
+    return upload
+
+def _write_chunk_data(upload, index, stream, checksum):
+    """Writes and verifies the chunk in the temporary file; the caller holds the claim"""
+    offset = index * upload.chunk_size
+    expected = min(upload.chunk_size, upload.size - offset)
+    digest = hashlib.sha256()
+    written = 0
+    with open(partial_path(upload.id), 'r+b') as f:
+        f.seek(offset)
+        # Обрезаем хвост от прошлой оборванной попытки этой же части
+        f.truncate()
+        while True:
+            block = stream.read(READ_BLOCK_SIZE)
+            if not block:
+                break
+            written += len(block)
+            if written > expected:
+                f.truncate(offset)
+                raise UploadError(f'Chunk {index} is longer than {expected} bytes', 413)
+            digest.update(block)
+            f.write(block)
+        if written != expected or digest.hexdigest() != checksum.strip().lower():
+            f.truncate(offset)
+            raise UploadError(f'Chunk {index} is incomplete or its checksum does not match', 422)
+
+def finish_upload(upload, full_path):
+    """
+    Links a complete upload to full_path through the blob store and deletes
+    its session. The temporary file stays until the caller has committed the
+    message row and called discard_partial(): if that commit fails, the
+    rollback brings the session back and the upload can be finished again.
+    """
+    if not upload.is_complete:
+        raise UploadError(f'Upload is incomplete: {upload.received_chunks} of {upload.total_chunks} chunks', 409)
+    store_file(partial_path(upload.id), full_path, keep_source=True)
+    db.session.delete(upload)
+
+def discard_partial(upload_id):
+    """Removes the temporary file of an upload whose message is committed"""
+    try:
+        os.remove(partial_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+def expire_uploads(max_age=UPLOAD_EXPIRY):
+    """
+    Deletes upload sessions that received no chunk for max_age together with
+    their temporary files. A slow upload that is still going is kept.
+    """
+    cutoff = datetime.utcnow() - max_age
+    expired = Upload.query.filter(Upload.updated_at < cutoff).all()
+    for upload in expired:
+        try:
+            os.remove(partial_path(upload.id))
+        except FileNotFoundError:
+            pass
+        db.session.delete(upload)
+    db.session.commit()
+    # Временные файлы без сессии: процесс остановился между коммитом сообщения и discard_partial
+    folder = partial_folder()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if (name.endswith('.part') and os.path.getmtime(path) < time.time() - max_age.total_seconds()
+                and db.session.get(Upload, name[:-len('.part')]) is None):
+            os.remove(path)
+    logging.info(f"Удалено незавершенных загрузок: {len(expired)}")
+    return len(expired)